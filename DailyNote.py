@@ -1,17 +1,15 @@
+import gc
 import time
-import sqlite3
 import os
+import ctypes
 from datetime import datetime, timedelta
 import requests
-from collections import defaultdict
 import cairo
 import tempfile
 import calendar
-import shutil
+import itertools
+import sqlite3
 import sys
-import threading
-import gettext
-import locale
 
 import gi
 
@@ -29,97 +27,86 @@ except (ValueError, ImportError):
 
 from gi.repository import Gtk, GLib, Gdk, GdkPixbuf, Gst, Pango, PangoCairo, Notify, Gio
 
-APP_NAME = "dailynote"
-HOME = os.path.expanduser("~")
-
-LOCALE_DIR = os.path.join(HOME, ".local", "share", "locale") 
-locale.setlocale(locale.LC_ALL, '')
-locale.bindtextdomain(APP_NAME, LOCALE_DIR)
-gettext.bindtextdomain(APP_NAME, LOCALE_DIR)
-gettext.textdomain(APP_NAME)
-_ = gettext.gettext
-
-installed_dir = os.path.join(HOME, '.local', 'share', APP_NAME)
-is_installed = os.path.abspath(os.path.dirname(__file__)) == installed_dir
-
-if is_installed:
-    BASE_DIR = installed_dir
-    LOCALE_DIR = os.path.join(HOME, '.local', 'share', 'locale')
-    DB_NAME = os.path.join(BASE_DIR, "notes.db") # Keep DB with other app data
-else:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    LOCALE_DIR = os.path.join(BASE_DIR, "locale")
-    DB_NAME = os.path.join(BASE_DIR, "notes.db")
-
-ICONS_DIR = os.path.join(BASE_DIR, "icons")
-ALARMS_DIR = os.path.join(BASE_DIR, "alarms")
-os.makedirs(os.path.dirname(DB_NAME), exist_ok=True)
-
-
-
-try:
-    locale.setlocale(locale.LC_ALL, '')
-except locale.Error:
-    print("Locale could not be set. Using default C locale.")
-
-locale.bindtextdomain(APP_NAME, LOCALE_DIR)
-locale.bind_textdomain_codeset(APP_NAME, "UTF-8")
-gettext.textdomain(APP_NAME)
-_ = gettext.gettext
+import dailynote_core as core
+import dailynote_weather as weather
+import dailynote_remote as remote
+import dailynote_trace as trace
+import dailynote_watchdog as watchdog
+import dailynote_leakcheck as leakcheck
+import dailynote_gazetteer as gazetteer
+import dailynote_forecast_chart as forecast_chart
+import dailynote_maintenance as maintenance
+from dailynote_forecast_chart import ForecastChart
+from dailynote_settings import Settings
+from dailynote_style import StyleManager
+from dailynote_core import _, ICONS_DIR, ALARMS_DIR, setup_database
 
 Gst.init(None)
 Notify.init("DailyNote")
 
-HEADERS = {'User-Agent': 'NoteApplication/1.0 (example@mail.com)'}
-
-def setup_database():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS notes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        content TEXT,
-        date TEXT NOT NULL
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS alarms (
-        note_id INTEGER PRIMARY KEY,
-        sound TEXT,
-        volume INTEGER,
-        duration INTEGER,
-        time TEXT,
-        FOREIGN KEY(note_id) REFERENCES notes(id)
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS settings (
-        key TEXT PRIMARY KEY,
-        value TEXT
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS fixed_notes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        content TEXT,
-        event_time TEXT,
-        alarm_enabled INTEGER NOT NULL DEFAULT 0,
-        alarm_days TEXT,
-        sound TEXT,
-        volume INTEGER,
-        repeat_type TEXT DEFAULT 'weekly', 
-        repeat_day INTEGER,               
-        repeat_month INTEGER              
-    )
-    """)
-    
-    conn.commit()
-    conn.close()
+def load_pixbuf(path, width, height):
+    with trace.span("pixbuf load", "pixbuf", path=os.path.basename(path)):
+        return GdkPixbuf.Pixbuf.new_from_file_at_size(path, width, height)
+
+def count_widgets(widget):
+    total = 1
+    if isinstance(widget, Gtk.Container):
+        for child in widget.get_children():
+            total += count_widgets(child)
+    return total
+
+def current_rss_kib():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def trim_malloc_heap():
+    # Freed widget memory stays in glibc's heap until it is trimmed.
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def shorten_label(text, length=40):
+    # Menu labels go over D-Bus to the panel, which cannot ellipsize them.
+    return text if len(text) <= length else text[:length - 1] + "…"
+
+def format_age(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return _("{count} min").format(count=max(minutes, 1))
+    if minutes < 48 * 60:
+        return _("{count} h").format(count=minutes // 60)
+    return _("{count} days").format(count=minutes // (24 * 60))
 
 class NoteApplication(Gtk.ApplicationWindow):
+    # Widgets created by _create_ui that are kept on the window; dropped
+    # together when the hidden window frees its UI.
+    UI_WIDGET_ATTRS = ('popover', 'btn_notifications', 'calendar_widget', 'lbl_clock', 'calendar', 'note_stack',
+                       'search_hbox', 'entry_search', 'notes_listbox', 'fixed_notes_listbox', 'combo_location',
+                       'weather_frame', 'weather_frame_vbox', 'lbl_current_weather', 'calendar_overlay',
+                       'calendar_icon_image', 'calendar_day_label', 'agenda_view', 'agenda_store',
+                       'check_include_archive')
+    AGENDA_PAGE_SIZE = 50
+    MISSED_ALARMS_SHOWN = 10
+    # How often the alarm check mark is written to disk while no alarm rings;
+    # it is written at once after a minute that delivered alarms, on a clock
+    # jump and at exit.
+    ALARM_CHECK_SAVE_MINUTES = 15
+    ALARM_SOUND_INTERVAL = 30
+    INDICATOR_TODAY_SLOTS = 5
+    MAINTENANCE_CHECK_SECONDS = 60
+    MAINTENANCE_POLL_MS = 250
+    INDICATOR_UPCOMING_SLOTS = 3
+    # Upcoming alarms read ahead, so the alarm tick can drop the ones that
+    # fired without querying again.
+    UPCOMING_ALARMS_KEPT = 12
+
     def __init__(self, application):
         super().__init__(title=_("DailyNote"), application=application)
         
@@ -132,24 +119,52 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.notes = []
         self.fixed_notes = []
         self.active_alarms = set()
+        self.last_alarm_minute = None
+        self.alarm_batch = None
+        self.archive_boundary = None
+        self.maintenance_run = None
+        self.maintenance_source = None
+        self.database_held = False
+        self.alarms_deferred = False
+        self.archived_months = {}
+        self.indicator_menu = None
+        self.upcoming_alarms = []
+        self.upcoming_alarms_source = None
+        self.last_alarm_sound_at = None
         self.sound_player = Gst.ElementFactory.make("playbin", "player")
+        # One bus watch and one EOS handler for the life of the window; the
+        # button to reset (if the sound is a preview) is kept on self.
+        self.sound_test_button = None
+        sound_bus = self.sound_player.get_bus()
+        sound_bus.add_signal_watch()
+        sound_bus.connect("message::eos", self.on_eos_message)
         self.current_latitude = None
         self.current_longitude = None
         self.current_location_name = None
-        self.current_font_description = "Sans Serif 10"
-        self.startup_notification_enabled = True
-        self.css_provider = Gtk.CssProvider()
+        self.locations = []
+        self.active_location_id = None
+        self.weather_service = weather.LocationWeather()
+        self.weather_timer = None
+        self.gazetteer = None
+        self.settings = None
+        self.style_manager = None
         self.last_known_day = None
         self.open_popups = {}
+        self.ui_built = False
+        self.ui_release_timer = None
         
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png", prefix="dailynote_")
         self.indicator_icon_path = temp_file.name
         temp_file.close()
 
         setup_database()
+        self.archive_boundary = core.archive_boundary()
         
         self.load_settings_from_db()
-        self._load_css()
+        if self.settings['last_alarm_check'] is not None:
+            self.last_alarm_minute = datetime.fromtimestamp(self.settings['last_alarm_check'])
+        self.style_manager = StyleManager(self.get_screen())
+        self.style_manager.set_font(self.settings['font_description'])
         
         self._create_ui()
         
@@ -158,14 +173,17 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.refresh_notes_list()
         self.refresh_fixed_notes_list()
         
+        self.weather_service.load_persisted()
         self.start_weather_update_in_background()
         GLib.idle_add(self.show_startup_notification)
+        GLib.idle_add(self.archive_old_notes)
         self.setup_indicator()
         self.update_date_and_icon()
         self.update_indicator_icon()
         
         GLib.timeout_add_seconds(1, self.update_time)
         GLib.timeout_add_seconds(1, self.check_alarms)
+        GLib.timeout_add_seconds(self.MAINTENANCE_CHECK_SECONDS, self.check_maintenance)
         
         self.connect("delete-event", self.on_window_close)
 
@@ -180,31 +198,62 @@ class NoteApplication(Gtk.ApplicationWindow):
 
     def on_window_close(self, widget, event):
         self.hide()
+        self.schedule_ui_release()
         return True
 
+    def schedule_ui_release(self):
+        self.cancel_ui_release()
+        minutes = self.settings['tray_release_minutes']
+        if minutes > 0 and self.ui_built:
+            self.ui_release_timer = GLib.timeout_add_seconds(minutes * 60, self.release_ui)
+
+    def cancel_ui_release(self):
+        if self.ui_release_timer:
+            GLib.source_remove(self.ui_release_timer)
+            self.ui_release_timer = None
+
+    def release_ui(self):
+        # Low-footprint tray mode: only the notes metadata, the alarm and
+        # weather timers and the indicator stay alive while hidden.
+        self.ui_release_timer = None
+        if self.get_visible() or not self.ui_built:
+            return False
+        rss_before = current_rss_kib()
+        with trace.span("release ui", "app"):
+            for popup in list(self.open_popups.values()):
+                popup["window"].destroy()
+            self.get_child().destroy()
+            self.set_titlebar(None)
+            for attr in self.UI_WIDGET_ATTRS:
+                setattr(self, attr, None)
+            self.ui_built = False
+            self.unrealize()
+            core.content_cache.clear()
+            forecast_chart.clear_icon_cache()
+            if self.gazetteer:
+                self.gazetteer.close()
+            self.gazetteer = None
+            gc.collect()
+            trim_malloc_heap()
+        print(f"Released hidden window UI: RSS {rss_before} KiB -> {current_rss_kib()} KiB")
+        return False
+
+    def ensure_ui(self):
+        if self.ui_built:
+            return
+        rss_before = current_rss_kib()
+        with trace.span("rebuild ui", "app"):
+            self._create_ui()
+            self.update_date_and_icon()
+            self.refresh_notes_list()
+            self.refresh_fixed_notes_list()
+            self.start_weather_update_in_background()
+        print(f"Rebuilt window UI: RSS {rss_before} KiB -> {current_rss_kib()} KiB")
+
     def _get_themed_icon_path(self, icon_name):
         theme_folder = "light" if self.is_dark_theme() else "dark"
         return os.path.join(ICONS_DIR, theme_folder, icon_name)
 
-    def _load_css(self):
-        screen = Gdk.Screen.get_default()
-        parsed_font = Pango.FontDescription.from_string(self.current_font_description)
-        font_size = parsed_font.get_size()
-        font_family = parsed_font.get_family()
-        css_font_size = int(font_size / Pango.SCALE)
-        css_font_string = f"font-family: \"{font_family}\"; font-size: {css_font_size}pt;"
-        css_string = f"""
-        * {{ {css_font_string} }}
-        .not-list-frame, .weather-frame {{
-            border: 0.5px solid #616161;
-            border-radius: 1px;
-            padding: 5px;
-        }}
-        .weather-frame {{ padding: 10px; }}
-        """
-        self.css_provider.load_from_data(css_string.encode('utf-8'))
-        Gtk.StyleContext.add_provider_for_screen(screen, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
-
     def _create_ui(self):
         main_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10, margin=10)
         self.add(main_vbox)
@@ -216,7 +265,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         menu_button = Gtk.MenuButton()
         menu_icon_path = self._get_themed_icon_path("menu.svg")
         if os.path.exists(menu_icon_path):
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(menu_icon_path, 24, 24)
+            pixbuf = load_pixbuf(menu_icon_path, 24, 24)
             menu_icon = Gtk.Image.new_from_pixbuf(pixbuf)
             menu_button.add(menu_icon)
         
@@ -277,7 +326,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         search_button = Gtk.Button(relief=Gtk.ReliefStyle.NONE) 
         search_icon_path = self._get_themed_icon_path("search.svg")
         if os.path.exists(search_icon_path):
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(search_icon_path, 16, 16)
+            pixbuf = load_pixbuf(search_icon_path, 16, 16)
             img = Gtk.Image.new_from_pixbuf(pixbuf)
             search_button.set_image(img)
         search_button.connect("clicked", self.clear_search_entry)
@@ -285,6 +334,10 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.entry_search = Gtk.Entry(placeholder_text=_("Search in notes..."))
         self.entry_search.connect("changed", self.search_notes)
         self.search_hbox.pack_start(self.entry_search, True, True, 0)
+        self.check_include_archive = Gtk.CheckButton(label=_("Include archive"))
+        self.check_include_archive.connect("toggled", lambda w: self.search_notes(self.entry_search))
+        self.check_include_archive.set_no_show_all(not self.archive_boundary)
+        self.search_hbox.pack_start(self.check_include_archive, False, False, 0)
         notes_header_box.pack_start(self.search_hbox, False, False, 0)
         
         main_vbox.pack_start(notes_header_box, False, False, 0)
@@ -303,14 +356,22 @@ class NoteApplication(Gtk.ApplicationWindow):
         fixed_notes_page.pack_start(btn_add_fixed, False, False, 5)
         fixed_notes_page.pack_start(fixed_scroll, True, True, 0)
         self.note_stack.add_titled(fixed_notes_page, "fixed", _("Fixed Notes"))
+        self.note_stack.add_titled(self.create_agenda_page(), "agenda", _("Agenda"))
+        self.note_stack.connect("notify::visible-child-name", self.on_note_stack_page_changed)
         
         notes_frame = Gtk.Frame(shadow_type=Gtk.ShadowType.NONE)
         notes_frame.get_style_context().add_class("not-list-frame")
         notes_frame.add(self.note_stack)
         main_vbox.pack_start(notes_frame, True, True, 0)
 
+        weather_title_hbox = Gtk.Box(spacing=10)
         lbl_weather_title = Gtk.Label(label=_("Current Weather:"), xalign=0)
-        main_vbox.pack_start(lbl_weather_title, False, False, 0)
+        weather_title_hbox.pack_start(lbl_weather_title, False, False, 0)
+        self.combo_location = Gtk.ComboBoxText()
+        self.combo_location.set_no_show_all(True)
+        self.combo_location.connect("changed", self.on_location_combo_changed)
+        weather_title_hbox.pack_end(self.combo_location, False, False, 0)
+        main_vbox.pack_start(weather_title_hbox, False, False, 0)
         self.weather_frame = Gtk.Frame()
         self.weather_frame.get_style_context().add_class("weather-frame")
         self.weather_frame_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5, margin=10)
@@ -318,7 +379,6 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.lbl_current_weather = Gtk.Label(label=_("Loading weather information..."))
         self.weather_frame_vbox.pack_start(self.lbl_current_weather, True, True, 0)
         main_vbox.pack_start(self.weather_frame, False, False, 0)
-        GLib.timeout_add_seconds(600, self.start_weather_update_in_background)
 
         btn_box1 = Gtk.Box(spacing=10, margin_top=10)
         main_vbox.pack_end(btn_box1, False, False, 0)
@@ -337,6 +397,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         btn_box2.pack_start(btn_weekly, True, True, 0)
         btn_box2.pack_start(btn_monthly, True, True, 0)
         btn_box2.pack_start(btn_advanced_weather, True, True, 0)
+        self.ui_built = True
 
     def _create_calendar_icon_widget(self):
         self.calendar_overlay = Gtk.Overlay()
@@ -354,6 +415,8 @@ class NoteApplication(Gtk.ApplicationWindow):
     def update_date_and_icon(self):
         day_str = datetime.now().strftime("%d")
         self.last_known_day = datetime.now().day
+        if not self.ui_built:
+            return
         style_context = self.get_style_context()
         text_color_rgba = style_context.get_color(Gtk.StateFlags.NORMAL)
         r, g, b = [int(c * 255) for c in (text_color_rgba.red, text_color_rgba.green, text_color_rgba.blue)]
@@ -361,7 +424,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.calendar_day_label.set_markup(f"<span weight='heavy' size='x-large' foreground='{hex_color}'>{day_str}</span>")
         icon_path = self._get_themed_icon_path("calendar_icon.svg")
         if os.path.exists(icon_path):
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(icon_path, 42, 42)
+            pixbuf = load_pixbuf(icon_path, 42, 42)
             self.calendar_icon_image.set_from_pixbuf(pixbuf)
 
     def update_indicator_icon(self):
@@ -369,7 +432,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         day_str = datetime.now().strftime("%d")
         base_icon_path = self._get_themed_icon_path("calendar_icon.svg")
         if not os.path.exists(base_icon_path): return
-        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(base_icon_path, size, size)
+        pixbuf = load_pixbuf(base_icon_path, size, size)
         surface = cairo.ImageSurface(cairo.Format.ARGB32, size, size)
         context = cairo.Context(surface)
         Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
@@ -396,9 +459,26 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.indicator = AppIndicator3.Indicator.new("dailynote-app", "goa-account-google", AppIndicator3.IndicatorCategory.APPLICATION_STATUS)
         self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
         self.indicator.set_menu(self.create_indicator_menu())
-        
+        self.refresh_upcoming_alarms()
+        self.update_indicator_menu()
+
     def create_indicator_menu(self):
+        # A fixed pool of items for today's notes and the upcoming alarms.
+        # Updates only relabel, show or hide them, so the exported menu is
+        # never rebuilt and the panel does not flicker.
         menu = Gtk.Menu()
+        self.indicator_targets = {}
+        self.indicator_today_header = Gtk.MenuItem(label=_("Today"), sensitive=False)
+        menu.append(self.indicator_today_header)
+        self.indicator_today_items = [self.create_indicator_slot(menu) for _i in range(self.INDICATOR_TODAY_SLOTS)]
+        self.indicator_today_more = Gtk.MenuItem(sensitive=False)
+        menu.append(self.indicator_today_more)
+        menu.append(Gtk.SeparatorMenuItem())
+        self.indicator_upcoming_header = Gtk.MenuItem(label=_("Upcoming Alarms"), sensitive=False)
+        menu.append(self.indicator_upcoming_header)
+        self.indicator_upcoming_items = [self.create_indicator_slot(menu) for _i in range(self.INDICATOR_UPCOMING_SLOTS)]
+        self.indicator_upcoming_separator = Gtk.SeparatorMenuItem()
+        menu.append(self.indicator_upcoming_separator)
         item_add_note = Gtk.MenuItem(label=_("Add New Note"))
         item_add_note.connect("activate", self.add_note_popup)
         menu.append(item_add_note)
@@ -409,9 +489,85 @@ class NoteApplication(Gtk.ApplicationWindow):
         item_quit.connect("activate", self.cleanup_and_quit)
         menu.append(item_quit)
         menu.show_all()
+        self.indicator_menu = menu
         return menu
 
+    def create_indicator_slot(self, menu):
+        item = Gtk.MenuItem(label="")
+        item.connect("activate", self.on_indicator_slot_activate)
+        menu.append(item)
+        return item
+
+    def set_indicator_item(self, item, label, target=None):
+        # Touches the item only when something changed.
+        visible = label is not None
+        if visible and item.get_label() != label:
+            item.set_label(label)
+        if item.get_visible() != visible:
+            item.set_visible(visible)
+        self.indicator_targets[item] = target
+
+    def update_indicator_menu(self):
+        if self.indicator_menu is None:
+            return
+        today = datetime.now().strftime("%Y-%m-%d")
+        todays_notes = [note for note in self.notes if note['date'] == today]
+        for i, item in enumerate(self.indicator_today_items):
+            note = todays_notes[i] if i < len(todays_notes) else None
+            self.set_indicator_item(item, shorten_label(note['title']) if note else None, note['id'] if note else None)
+        hidden = len(todays_notes) - len(self.indicator_today_items)
+        self.set_indicator_item(self.indicator_today_more, _("…and {count} more").format(count=hidden) if hidden > 0 else None)
+        self.set_indicator_item(self.indicator_today_header, _("Today") if todays_notes else _("No notes today"))
+
+        now = datetime.now()
+        for i, item in enumerate(self.indicator_upcoming_items):
+            alarm = self.upcoming_alarms[i] if i < len(self.upcoming_alarms) else None
+            label = None
+            if alarm:
+                when = alarm['when'].strftime("%H:%M" if alarm['when'].date() == now.date() else "%a %H:%M")
+                label = f"{when}  {shorten_label(alarm['title'])}"
+                if alarm['lead_minutes']:
+                    label += " " + _("(in {minutes} min)").format(minutes=alarm['lead_minutes'])
+            self.set_indicator_item(item, label, alarm['id'] if alarm else None)
+        self.set_indicator_item(self.indicator_upcoming_header, _("Upcoming Alarms") if self.upcoming_alarms else None)
+        if self.indicator_upcoming_separator.get_visible() != bool(self.upcoming_alarms):
+            self.indicator_upcoming_separator.set_visible(bool(self.upcoming_alarms))
+
+    def refresh_upcoming_alarms(self):
+        # Read from the scheduler's table when alarms are changed, not every
+        # time the menu is drawn. Reading re-arms fixed notes, so while the
+        # database is held it is left to hold_database_writers.
+        self.upcoming_alarms_source = None
+        if self.database_held:
+            return False
+        self.upcoming_alarms = core.upcoming_alarms(limit=self.UPCOMING_ALARMS_KEPT)
+        self.update_indicator_menu()
+        return False
+
+    def drop_fired_upcoming_alarms(self, now):
+        # Called from the alarm tick: forgets what has fired, and only reads
+        # ahead again, from an idle callback, when the menu would run short
+        # or a fixed note fired and was re-armed for its next occurrence.
+        upcoming = [alarm for alarm in self.upcoming_alarms if alarm['when'] > now]
+        if len(upcoming) == len(self.upcoming_alarms):
+            return
+        rearmed = any(not isinstance(alarm['id'], int) for alarm in self.upcoming_alarms if alarm['when'] <= now)
+        self.upcoming_alarms = upcoming
+        self.update_indicator_menu()
+        if (rearmed or len(upcoming) < self.INDICATOR_UPCOMING_SLOTS) and self.upcoming_alarms_source is None:
+            self.upcoming_alarms_source = GLib.idle_add(self.refresh_upcoming_alarms, priority=GLib.PRIORITY_LOW)
+
+    def on_indicator_slot_activate(self, item):
+        target = self.indicator_targets.get(item)
+        self.on_show_application(item)
+        if isinstance(target, int):
+            note = next((n for n in self.notes if n.id == target), None)
+            if note:
+                self.edit_note_popup(note)
+
     def on_show_application(self, widget, *args):
+        self.cancel_ui_release()
+        self.ensure_ui()
         self.show_all()
         self.present()
 
@@ -422,7 +578,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         if icon_name:
             icon_path = self._get_themed_icon_path(icon_name)
             if os.path.exists(icon_path):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(icon_path, icon_size, icon_size)
+                pixbuf = load_pixbuf(icon_path, icon_size, icon_size)
                 img = Gtk.Image.new_from_pixbuf(pixbuf)
                 hbox.pack_start(img, False, False, 0)
         lbl = Gtk.Label(label=label_text)
@@ -432,10 +588,12 @@ class NoteApplication(Gtk.ApplicationWindow):
         return btn
 
     def update_time(self):
-        self.lbl_clock.set_markup("<span weight='bold' size='x-large'>" + time.strftime("%H:%M:%S") + "</span>")
+        if self.ui_built and self.get_visible():
+            self.lbl_clock.set_markup("<span weight='bold' size='x-large'>" + time.strftime("%H:%M:%S") + "</span>")
         if datetime.now().day != self.last_known_day:
             self.update_date_and_icon()
             self.update_indicator_icon()
+            self.update_indicator_menu()
         return True
         
     def on_calendar_day_selected(self, calendar):
@@ -451,7 +609,10 @@ class NoteApplication(Gtk.ApplicationWindow):
 
         if active_tab == "daily":
             if search_text:
-                filtered_notes = [n for n in self.notes if search_text in n['title'].lower() or (n.get('content') and search_text in n.get('content', '').lower())]
+                matching_ids = core.search_note_ids(search_text)
+                filtered_notes = [n for n in self.notes if n.id in matching_ids]
+                if self.check_include_archive.get_active():
+                    filtered_notes = core.search_archived_notes(search_text) + filtered_notes
                 self.refresh_notes_list(filtered_notes=filtered_notes)
             else:
                 self.refresh_notes_list()
@@ -462,20 +623,26 @@ class NoteApplication(Gtk.ApplicationWindow):
             else:
                 self.refresh_fixed_notes_list()
 
+    @trace.traced()
     def refresh_notes_list(self, *args, filtered_notes=None):
+        if not self.ui_built:
+            return
         for child in self.notes_listbox.get_children():
-            self.notes_listbox.remove(child)
+            child.destroy()
 
         if filtered_notes is not None:
             notes_to_display = filtered_notes
+            recurring = []
         else:
             year, month, day = self.calendar.get_date()
             date_str = f"{year}-{month+1:02d}-{day:02d}"
-            notes_to_display = [n for n in self.notes if n['date'] == date_str]
+            notes_to_display = self.notes_on(date_str)
+            recurring = core.occurrence_index.on(datetime(year, month + 1, day).date())
 
         all_alarms = self.load_all_alarms()
+        trace.count("notes", len(notes_to_display))
 
-        if not notes_to_display:
+        if not notes_to_display and not recurring:
             if filtered_notes is not None:
                 self.notes_listbox.add(Gtk.Label(label=_("No search results found.")))
             else:
@@ -512,7 +679,7 @@ class NoteApplication(Gtk.ApplicationWindow):
                 if note.get('id') in all_alarms:
                     image_path = self._get_themed_icon_path("alarm_filled.png")
                     if os.path.exists(image_path):
-                        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(image_path, 24, 24)
+                        pixbuf = load_pixbuf(image_path, 24, 24)
                         img = Gtk.Image.new_from_pixbuf(pixbuf)
                         img.set_valign(Gtk.Align.CENTER)
                         hbox.pack_end(img, False, False, 0)
@@ -520,9 +687,123 @@ class NoteApplication(Gtk.ApplicationWindow):
                 btn_note.add(hbox)
                 btn_note.connect("clicked", lambda w, n=note: self.edit_note_popup(n))
                 self.notes_listbox.add(btn_note)
+            for fixed_note in recurring:
+                self.notes_listbox.add(self.create_recurring_button(fixed_note, margin=5))
                 
+        if trace.enabled: trace.count("widgets", count_widgets(self.notes_listbox))
         self.notes_listbox.show_all()
 
+    def create_agenda_page(self):
+        # Upcoming notes, alarms and fixed-note occurrences, pulled from the
+        # core.iter_agenda() stream one page at a time as the list is
+        # scrolled. The TreeView only renders the visible rows.
+        self.agenda_store = Gtk.ListStore(str, str, str, str, str, int)
+        self.agenda_stream = None
+        self.agenda_exhausted = False
+        self.agenda_last_date = None
+        self.agenda_view = Gtk.TreeView(model=self.agenda_store)
+        self.agenda_view.append_column(Gtk.TreeViewColumn(_("Date"), Gtk.CellRendererText(), text=0))
+        self.agenda_view.append_column(Gtk.TreeViewColumn(_("Time"), Gtk.CellRendererText(), text=1))
+        title_column = Gtk.TreeViewColumn(_("Title"))
+        icon_renderer = Gtk.CellRendererPixbuf()
+        title_column.pack_start(icon_renderer, False)
+        title_column.add_attribute(icon_renderer, "icon-name", 2)
+        title_renderer = Gtk.CellRendererText()
+        title_column.pack_start(title_renderer, True)
+        title_column.add_attribute(title_renderer, "text", 3)
+        self.agenda_view.append_column(title_column)
+        self.agenda_view.connect("row-activated", self.on_agenda_row_activated)
+        agenda_scroll = Gtk.ScrolledWindow()
+        agenda_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        agenda_scroll.add(self.agenda_view)
+        vadjustment = agenda_scroll.get_vadjustment()
+        vadjustment.connect("value-changed", self.on_agenda_scrolled)
+        vadjustment.connect("changed", self.on_agenda_scrolled)
+        return agenda_scroll
+
+    def agenda_visible(self):
+        return self.ui_built and self.note_stack.get_visible_child_name() == "agenda"
+
+    def reset_agenda(self):
+        if not self.ui_built:
+            return
+        self.agenda_store.clear()
+        self.agenda_stream = None
+        self.agenda_exhausted = False
+        self.agenda_last_date = None
+        if self.agenda_visible():
+            self.load_agenda_page()
+
+    def format_agenda_date(self, day):
+        today = datetime.now().date()
+        if day == today:
+            return _("Today")
+        if day == today + timedelta(days=1):
+            return _("Tomorrow")
+        return day.strftime("%a %d.%m.%Y")
+
+    @trace.traced()
+    def load_agenda_page(self):
+        if self.agenda_stream is None:
+            self.agenda_stream = core.iter_agenda(datetime.now().date())
+        items = list(itertools.islice(self.agenda_stream, self.AGENDA_PAGE_SIZE))
+        trace.count("rows", len(items))
+        self.agenda_exhausted = len(items) < self.AGENDA_PAGE_SIZE
+        for item in items:
+            date_label = "" if item['date'] == self.agenda_last_date else self.format_agenda_date(item['date'])
+            self.agenda_last_date = item['date']
+            if item['kind'] == 'fixed':
+                icon_name = "media-playlist-repeat-symbolic"
+            else:
+                icon_name = "alarm-symbolic" if item['alarm'] else None
+            self.agenda_store.append([date_label, item['time'], icon_name, item['title'], item['kind'], item['id']])
+        if self.agenda_exhausted and len(self.agenda_store) == 0:
+            self.agenda_store.append(["", "", None, _("Nothing coming up"), "", 0])
+
+    def on_agenda_scrolled(self, adjustment):
+        if self.agenda_exhausted or not self.agenda_visible():
+            return
+        if adjustment.get_value() + 2 * adjustment.get_page_size() >= adjustment.get_upper():
+            self.load_agenda_page()
+
+    def on_note_stack_page_changed(self, stack, pspec):
+        if stack.get_visible_child_name() == "agenda" and self.agenda_stream is None:
+            self.load_agenda_page()
+
+    def on_agenda_row_activated(self, tree_view, path, column):
+        kind, item_id = self.agenda_store[path][4], self.agenda_store[path][5]
+        if kind == 'note':
+            note = next((n for n in self.notes if n.id == item_id), None)
+            if note:
+                self.edit_note_popup(note)
+        elif kind == 'fixed':
+            fixed_note = next((n for n in self.fixed_notes if n['id'] == item_id), None)
+            if fixed_note:
+                self.fixed_note_popup(tree_view, note_data=fixed_note)
+
+    def create_recurring_button(self, fixed_note, margin=0):
+        # An occurrence of a repeating fixed note; opens the fixed note editor.
+        btn = Gtk.Button(halign=Gtk.Align.FILL)
+        hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5, margin_start=margin, margin_end=margin)
+        btn.add(hbox)
+        repeat_icon = Gtk.Image.new_from_icon_name("media-playlist-repeat-symbolic", Gtk.IconSize.BUTTON)
+        repeat_icon.set_valign(Gtk.Align.CENTER)
+        hbox.pack_start(repeat_icon, False, False, 0)
+        event_time = fixed_note.get('event_time')
+        text = f"{fixed_note['title']} ({event_time})" if event_time else fixed_note['title']
+        lbl = Gtk.Label(label=text, xalign=0, margin_top=margin, margin_bottom=margin)
+        lbl.set_line_wrap(True)
+        hbox.pack_start(lbl, True, True, 0)
+        btn.connect("clicked", lambda w, n=fixed_note: self.fixed_note_popup(w, note_data=n))
+        return btn
+
+    def reload_notes_from_db(self):
+        self.load_notes()
+        self.load_fixed_notes()
+        self.refresh_notes_list()
+        self.refresh_fixed_notes_list()
+        self.refresh_open_popups()
+
     def refresh_open_popups(self):
         if self.open_popups.get("weekly"):
             win = self.open_popups["weekly"]["window"]
@@ -545,95 +826,142 @@ class NoteApplication(Gtk.ApplicationWindow):
                 self.populate_monthly_grid(grid, selected_date, win)
 
     def load_notes(self):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, title, content, date FROM notes")
-        self.notes = [{'id': r[0], 'title': r[1], 'content': r[2], 'date': r[3]} for r in cursor.fetchall()]
-        conn.close()
+        self.notes = core.load_notes()
+        self.archived_months.clear()
+        self.reset_agenda()
+        if self.indicator_menu is not None:
+            self.refresh_upcoming_alarms()
     
+    def notes_on(self, date_str):
+        # The day's notes; days before the archive boundary also get the
+        # archived ones, read from the archive a month at a time.
+        notes = [n for n in self.notes if n['date'] == date_str]
+        if self.archive_boundary and date_str < self.archive_boundary:
+            month = date_str[:7]
+            if month not in self.archived_months:
+                self.archived_months[month] = core.load_archived_notes(f"{month}-01", f"{month}-31")
+            notes += [n for n in self.archived_months[month] if n['date'] == date_str]
+        return notes
+
+    def is_idle_for_maintenance(self):
+        return not self.get_visible() or not self.is_active()
+
+    def check_maintenance(self):
+        # Starts (or resumes) the daily database maintenance once the window
+        # is hidden or in the background; each step runs at low priority.
+        if self.maintenance_run is None:
+            if not maintenance.due(self.settings['last_maintenance']):
+                return True
+            self.maintenance_run = maintenance.MaintenanceRun(on_worker=self.hold_database_writers)
+        if self.maintenance_source is None and self.is_idle_for_maintenance():
+            self.schedule_maintenance_step()
+        return True
+
+    def schedule_maintenance_step(self):
+        # While a phase runs on the worker thread there is nothing to do but
+        # wait, so it is polled instead of running the idle handler flat out.
+        if self.maintenance_run.busy():
+            self.maintenance_source = GLib.timeout_add(self.MAINTENANCE_POLL_MS, self.run_maintenance_step, priority=GLib.PRIORITY_LOW)
+        else:
+            self.maintenance_source = GLib.idle_add(self.run_maintenance_step, priority=GLib.PRIORITY_LOW)
+
+    def run_maintenance_step(self):
+        if not self.is_idle_for_maintenance() and not self.maintenance_run.busy():
+            # Paused; check_maintenance resumes it later.
+            self.maintenance_source = None
+            return False
+        if self.maintenance_run.step():
+            self.schedule_maintenance_step()
+            return False
+        print(self.maintenance_run.summary())
+        self.settings.set('last_maintenance', time.time())
+        self.maintenance_run = None
+        self.maintenance_source = None
+        return False
+
+    def hold_database_writers(self, held):
+        # VACUUM and quick_check run on the maintenance worker's own
+        # connection; writing from here meanwhile would block the main loop
+        # on the lock. Settings and weather keep their changes in memory,
+        # and the alarm tick waits and catches the minutes up afterwards.
+        self.database_held = held
+        if held:
+            self.settings.hold()
+            self.weather_service.hold()
+        else:
+            self.settings.release()
+            self.weather_service.release()
+            if self.upcoming_alarms_source is None:
+                self.upcoming_alarms_source = GLib.idle_add(self.refresh_upcoming_alarms, priority=GLib.PRIORITY_LOW)
+
+    def stop_maintenance(self):
+        if self.maintenance_source is not None:
+            GLib.source_remove(self.maintenance_source)
+            self.maintenance_source = None
+        if self.maintenance_run is not None:
+            self.maintenance_run.close()
+            self.maintenance_run = None
+
+    def archive_old_notes(self):
+        days = self.settings['archive_after_days']
+        if days > 0:
+            cutoff = (datetime.now().date() - timedelta(days=days)).isoformat()
+            with trace.span("archive notes", "db", before=cutoff):
+                moved = core.archive_notes(cutoff)
+            if moved:
+                print(f"Archived {moved} notes dated before {cutoff}.")
+                self.archive_boundary = core.archive_boundary()
+                self.reload_notes_from_db()
+                if self.ui_built:
+                    self.check_include_archive.set_no_show_all(False)
+                    self.check_include_archive.show()
+        return False
+
     def load_fixed_notes(self):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, title, content, alarm_enabled, event_time, alarm_days, repeat_type, repeat_day, repeat_month FROM fixed_notes ORDER BY id")
-        self.fixed_notes = [
-            {'id': r[0], 'title': r[1], 'content': r[2], 'alarm_enabled': r[3], 'event_time': r[4], 
-             'alarm_days': r[5], 'repeat_type': r[6], 'repeat_day': r[7], 'repeat_month': r[8]} for r in cursor.fetchall()
-        ]
-        conn.close()
+        self.fixed_notes = core.load_fixed_notes()
+        self.reset_agenda()
+        if self.indicator_menu is not None:
+            self.refresh_upcoming_alarms()
 
     def load_all_alarms(self):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT note_id, sound, volume, duration, time FROM alarms")
-        alarms = {r[0]: {'sound': r[1], 'volume': r[2], 'duration': r[3], 'time': r[4]} for r in cursor.fetchall()}
-        conn.close()
-        return alarms
+        return core.load_all_alarms()
     
     def save_note_db(self, note):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        if 'id' in note:
-            cursor.execute("UPDATE notes SET title=?, content=?, date=? WHERE id=?", (note['title'], note['content'], note['date'], note['id']))
-        else:
-            cursor.execute("INSERT INTO notes (title, content, date) VALUES (?, ?, ?)", (note['title'], note['content'], note['date']))
-            note['id'] = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        core.save_note(note)
         self.load_notes()
 
-    def save_alarm_db(self, note_id, sound, volume, duration, time_str):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO alarms (note_id, sound, volume, duration, time) VALUES (?, ?, ?, ?, ?)", (note_id, sound, volume, duration, time_str))
-        conn.commit()
-        conn.close()
+    def save_alarm_db(self, note_id, sound, volume, duration, time_str, lead_minutes=()):
+        core.save_alarm(note_id, sound, volume, duration, time_str, lead_minutes)
+        self.reset_agenda()
+        self.refresh_upcoming_alarms()
 
     def load_alarm_db(self, note_id):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT sound, volume, duration, time FROM alarms WHERE note_id=?", (note_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return {'sound': row[0], 'volume': row[1], 'duration': row[2], 'time': row[3]} if row else None
+        return core.load_alarm(note_id)
 
     def delete_note_db(self, note_id):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM notes WHERE id=?", (note_id,))
-        cursor.execute("DELETE FROM alarms WHERE note_id=?", (note_id,))
-        conn.commit()
-        conn.close()
+        core.delete_note(note_id)
         self.load_notes()
 
     def delete_alarm_db(self, note_id):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM alarms WHERE note_id=?", (note_id,))
-        conn.commit()
-        conn.close()
+        core.delete_alarm(note_id)
+        self.reset_agenda()
+        self.refresh_upcoming_alarms()
     
-    def save_setting_db(self, key, value):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        conn.commit()
-        conn.close()
-
     def load_settings_from_db(self):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        settings = {row[0]: row[1] for row in cursor.execute("SELECT key, value FROM settings").fetchall()}
-        width = int(settings.get('window_width', 600))
-        height = int(settings.get('window_height', 800))
-        opacity = float(settings.get('window_opacity', 1.0))
-        self.set_default_size(width, height)
-        self.props.opacity = opacity
-        self.current_latitude = settings.get('latitude', None)
-        self.current_longitude = settings.get('longitude', None)
-        self.current_location_name = settings.get('location_name', None)
-        self.current_font_description = settings.get('font_description', "Sans Serif 10")
-        self.startup_notification_enabled = settings.get('startup_notification_enabled', 'True') == 'True'
-        conn.close()
+        self.settings = Settings.load()
+        self.set_default_size(self.settings['window_width'], self.settings['window_height'])
+        self.props.opacity = self.settings['window_opacity']
+        self.locations = core.load_locations()
+        self.set_active_location(self.settings['active_location_id'])
+        # Only the look that depends on a changed key is re-applied.
+        self.settings.connect('font_description', lambda key, value: self.style_manager.set_font(value))
+        self.settings.connect('window_opacity', lambda key, value: self.set_opacity(value))
+        self.settings.connect('window_width', self.on_window_size_setting_changed)
+        self.settings.connect('window_height', self.on_window_size_setting_changed)
+        self.settings.connect('startup_notification_enabled', lambda key, value: self.update_notification_button_label())
+
+    def on_window_size_setting_changed(self, key, value):
+        self.resize(self.settings['window_width'], self.settings['window_height'])
 
     def settings_popup(self, widget):
         self.popover.hide()
@@ -654,22 +982,27 @@ class NoteApplication(Gtk.ApplicationWindow):
         opacity_adj = Gtk.Adjustment(value=self.props.opacity, lower=0.2, upper=1.0, step_increment=0.05)
         scale_opacity = Gtk.Scale(orientation=Gtk.Orientation.HORIZONTAL, adjustment=opacity_adj, digits=2)
         vbox.pack_start(scale_opacity, False, False, 0)
+        vbox.pack_start(Gtk.Label(label=_("Free memory when hidden for (minutes, 0 = never):"), xalign=0), False, False, 0)
+        release_adj = Gtk.Adjustment(value=self.settings['tray_release_minutes'], lower=0, upper=1440, step_increment=5)
+        spin_release = Gtk.SpinButton(adjustment=release_adj)
+        vbox.pack_start(spin_release, False, False, 0)
+        vbox.pack_start(Gtk.Label(label=_("Archive notes older than (days, 0 = never):"), xalign=0), False, False, 0)
+        archive_adj = Gtk.Adjustment(value=self.settings['archive_after_days'], lower=0, upper=3650, step_increment=30)
+        spin_archive = Gtk.SpinButton(adjustment=archive_adj)
+        vbox.pack_start(spin_archive, False, False, 0)
         btn_box = Gtk.Box(spacing=10, margin_top=10)
         btn_save = Gtk.Button(label=_("Save and Close"))
-        btn_save.connect("clicked", self.save_app_settings, spin_width, spin_height, scale_opacity, win)
+        btn_save.connect("clicked", self.save_app_settings, spin_width, spin_height, scale_opacity, spin_release, spin_archive, win)
         btn_box.pack_end(btn_save, False, False, 0)
         vbox.pack_end(btn_box, False, False, 0)
         win.show_all()
 
-    def save_app_settings(self, widget, spin_width, spin_height, scale_opacity, settings_window):
-        width = spin_width.get_value_as_int()
-        height = spin_height.get_value_as_int()
-        opacity = scale_opacity.get_value()
-        self.save_setting_db('window_width', str(width))
-        self.save_setting_db('window_height', str(height))
-        self.save_setting_db('window_opacity', str(opacity))
-        self.resize(width, height)
-        self.props.opacity = opacity
+    def save_app_settings(self, widget, spin_width, spin_height, scale_opacity, spin_release, spin_archive, settings_window):
+        self.settings.update(window_width=spin_width.get_value_as_int(),
+                             window_height=spin_height.get_value_as_int(),
+                             window_opacity=scale_opacity.get_value(),
+                             tray_release_minutes=spin_release.get_value_as_int(),
+                             archive_after_days=spin_archive.get_value_as_int())
         settings_window.destroy()
 
     def add_note_popup(self, widget, *args):
@@ -716,7 +1049,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         lbl_content_title = Gtk.Label(label=_("Content:"), xalign=0, margin_top=5)
         vbox.pack_start(lbl_content_title, False, False, 0)
         textview_content = Gtk.TextView(wrap_mode=Gtk.WrapMode.WORD)
-        textview_content.get_buffer().set_text(note_item.get('content',''))
+        textview_content.get_buffer().set_text(note_item.get('content') or '')
         scroll = Gtk.ScrolledWindow(min_content_height=150)
         scroll.add(textview_content)
         content_frame = Gtk.Frame(shadow_type=Gtk.ShadowType.NONE)
@@ -728,11 +1061,79 @@ class NoteApplication(Gtk.ApplicationWindow):
         btn_edit.connect("clicked", lambda w: self.save_existing_note(note_item, entry_title, textview_content, win))
         btn_delete = Gtk.Button(label=_("Delete"))
         btn_delete.connect("clicked", lambda w: self.delete_note(note_item, win))
+        btn_history = Gtk.Button(label=_("History"))
+        btn_history.connect("clicked", lambda w: self.note_history_popup(note_item, entry_title, textview_content, win))
         btn_box.pack_start(btn_edit, True, True, 0)
+        btn_box.pack_start(btn_history, True, True, 0)
         btn_box.pack_start(btn_delete, True, True, 0)
         vbox.pack_end(btn_box, False, False, 0)
         win.show_all()
 
+    def note_history_popup(self, note_item, entry_title, textview_content, parent):
+        # Lists the earlier versions of a note; the selected one is rebuilt
+        # on demand and can be copied back into the editor, where it is only
+        # kept once saved (the version it replaces then joins the history).
+        win = Gtk.Window(title=_("Note History"), transient_for=parent, modal=True, default_width=600, default_height=450)
+        hbox = Gtk.Box(spacing=10, margin=10)
+        win.add(hbox)
+        revisions_list = Gtk.ListBox()
+        revisions_scroll = Gtk.ScrolledWindow(min_content_width=180)
+        revisions_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        revisions_scroll.add(revisions_list)
+        hbox.pack_start(revisions_scroll, False, False, 0)
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        hbox.pack_start(vbox, True, True, 0)
+        lbl_title = Gtk.Label(xalign=0)
+        vbox.pack_start(lbl_title, False, False, 0)
+        textview_revision = Gtk.TextView(wrap_mode=Gtk.WrapMode.WORD, editable=False, cursor_visible=False)
+        revision_scroll = Gtk.ScrolledWindow()
+        revision_scroll.add(textview_revision)
+        content_frame = Gtk.Frame(shadow_type=Gtk.ShadowType.NONE)
+        content_frame.get_style_context().add_class("not-list-frame")
+        content_frame.add(revision_scroll)
+        vbox.pack_start(content_frame, True, True, 0)
+        btn_box = Gtk.Box(spacing=10)
+        btn_restore = Gtk.Button(label=_("Copy to Editor"), sensitive=False)
+        btn_close = Gtk.Button(label=_("Close"))
+        btn_box.pack_start(btn_restore, True, True, 0)
+        btn_box.pack_start(btn_close, True, True, 0)
+        vbox.pack_end(btn_box, False, False, 0)
+
+        revisions = core.load_note_revisions(note_item['id'])
+        for revision in revisions:
+            if revision['saved_at'] is None:
+                label = _("Until {time}").format(time=revision['replaced_at'].strftime("%d.%m.%Y %H:%M"))
+            else:
+                label = revision['saved_at'].strftime("%d.%m.%Y %H:%M")
+            revisions_list.add(Gtk.Label(label=label, xalign=0, margin=5))
+        if not revisions:
+            revisions_list.add(Gtk.Label(label=_("No earlier versions"), margin=5))
+        selected = {}
+
+        def on_row_selected(listbox, row):
+            if row is None or row.get_index() >= len(revisions):
+                return
+            version = core.load_note_revision(note_item['id'], revisions[row.get_index()]['revision'])
+            if version is None:
+                return
+            selected['version'] = version
+            lbl_title.set_markup(f"<b>{GLib.markup_escape_text(version[0])}</b>")
+            textview_revision.get_buffer().set_text(version[1])
+            btn_restore.set_sensitive(True)
+
+        def on_restore_clicked(widget):
+            title, content = selected['version']
+            entry_title.set_text(title)
+            textview_content.get_buffer().set_text(content)
+            win.destroy()
+
+        revisions_list.connect("row-selected", on_row_selected)
+        btn_restore.connect("clicked", on_restore_clicked)
+        btn_close.connect("clicked", lambda w: win.destroy())
+        win.show_all()
+        if revisions:
+            revisions_list.select_row(revisions_list.get_row_at_index(0))
+
     def save_existing_note(self, note_item, entry_title, textview_content, window):
         note_item['title'] = entry_title.get_text()
         buffer = textview_content.get_buffer()
@@ -755,138 +1156,241 @@ class NoteApplication(Gtk.ApplicationWindow):
             window.destroy()
 
     def check_alarms(self):
-        now = datetime.now()
-        now_str = now.strftime("%H:%M")
-        now_date_str = now.strftime("%Y-%m-%d")
-        for note in self.notes:
-            alarm = self.load_alarm_db(note.get('id'))
-            if alarm and note.get('date') == now_date_str and alarm.get('time') == now_str and note.get('id') not in self.active_alarms:
-                self.active_alarms.add(note.get('id'))
-                self.show_alarm_popup(note, alarm)
-
-        today_weekday = str(now.weekday())
-        today_monthday = now.day
-        today_month = now.month
-
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, title, content, alarm_days, repeat_type, repeat_day, repeat_month FROM fixed_notes WHERE alarm_enabled=1 AND event_time=?", (now_str,))
-        fixed_alarms_to_check = cursor.fetchall()
-        conn.close()
-
-        for alarm_data in fixed_alarms_to_check:
-            alarm_id = f"fixed_{alarm_data[0]}"
-            if alarm_id not in self.active_alarms:
-                note_title, note_content = alarm_data[1], alarm_data[2]
-                alarm_days, repeat_type, repeat_day, repeat_month = alarm_data[3], alarm_data[4], alarm_data[5], alarm_data[6]
-                trigger_alarm = False
-                if repeat_type == 'weekly' and today_weekday in alarm_days.split(','):
-                    trigger_alarm = True
-                elif repeat_type == 'monthly' and today_monthday == repeat_day:
-                    trigger_alarm = True
-                elif repeat_type == 'yearly' and today_monthday == repeat_day and today_month == repeat_month:
-                    trigger_alarm = True
-                if trigger_alarm:
-                    self.active_alarms.add(alarm_id)
-                    fake_note = {'id': alarm_id, 'title': note_title, 'content': note_content}
-                    fake_alarm = {'sound': None, 'volume': 80, 'duration': 10} 
-                    self.show_alarm_popup(fake_note, fake_alarm)
+        # A GLib timeout that does not return True is removed for good, so a
+        # locked database must only delay the alarms, never stop them; the
+        # minute is evaluated again on the next tick.
+        last_minute, deferred = self.last_alarm_minute, self.alarms_deferred
+        try:
+            self.check_due_alarms()
+        except sqlite3.OperationalError as e:
+            print(f"Alarm check postponed: {e}")
+            self.last_alarm_minute, self.alarms_deferred = last_minute, deferred
         return True
 
+    def check_due_alarms(self):
+        # Each minute is evaluated once. If more than a minute has passed
+        # since the last one (the app was closed, the machine slept or the
+        # main loop stalled), the alarms in the gap are reported together.
+        # Minutes postponed while the database was busy ring late instead.
+        # A clock set backwards only moves the mark.
+        now = datetime.now().replace(second=0, microsecond=0)
+        if now == self.last_alarm_minute or self.database_held:
+            self.alarms_deferred = self.alarms_deferred or self.database_held
+            return
+        last_minute, self.last_alarm_minute = self.last_alarm_minute, now
+        deferred, self.alarms_deferred = self.alarms_deferred, False
+        jumped = last_minute is not None and not timedelta(0) < now - last_minute <= timedelta(minutes=1)
+        if jumped and now > last_minute and not deferred:
+            self.show_missed_alarms(core.missed_alarms(last_minute, now))
+        since = last_minute if deferred and last_minute is not None and last_minute < now else now - timedelta(minutes=1)
+        due_alarms = core.take_due_alarms(since, now)
+        # The saved mark is where a restart looks for missed alarms, so it
+        # must never fall behind alarms that were already delivered.
+        saved = self.settings['last_alarm_check']
+        if due_alarms or jumped:
+            self.settings.set('last_alarm_check', now.timestamp())
+            self.settings.flush()
+        elif saved is None or abs(now.timestamp() - saved) >= self.ALARM_CHECK_SAVE_MINUTES * 60:
+            self.settings.set('last_alarm_check', now.timestamp())
+
+        items = []
+        for due in due_alarms:
+            # A lead reminder and its alarm share the note id; both must ring.
+            key = (due['id'], due['lead_minutes'])
+            if key in self.active_alarms:
+                continue
+            self.active_alarms.add(key)
+            note = {'id': due['id'], 'title': due['title'], 'content': due['content'], 'when': due['when'], 'lead_minutes': due['lead_minutes']}
+            if isinstance(due['id'], int):
+                alarm = {'sound': due['sound'], 'volume': due['volume'], 'duration': due['duration']}
+            else:
+                alarm = {'sound': None, 'volume': 80, 'duration': 10}
+            items.append((note, alarm))
+        if items:
+            self.show_alarm_batch(items)
+        self.drop_fired_upcoming_alarms(now)
+
+    def show_missed_alarms(self, missed):
+        if not missed:
+            return
+        today = datetime.now().date()
+        lines = []
+        for alarm in missed[:self.MISSED_ALARMS_SHOWN]:
+            when = alarm['when'].strftime("%H:%M" if alarm['when'].date() == today else "%d.%m. %H:%M")
+            lines.append(f"<b>{when}</b> {GLib.markup_escape_text(alarm['title'])}")
+        if len(missed) > self.MISSED_ALARMS_SHOWN:
+            lines.append(_("…and {count} more").format(count=len(missed) - self.MISSED_ALARMS_SHOWN))
+        notification = Notify.Notification.new(_("Missed Alarms"), "\n".join(lines), "alarm-symbolic")
+        notification.set_urgency(Notify.Urgency.CRITICAL)
+        notification.show()
+        # A missed one-off alarm is spent, as if its popup had timed out.
+        note_ids = [alarm['id'] for alarm in missed if isinstance(alarm['id'], int)]
+        for note_id in note_ids:
+            self.delete_alarm_db(note_id)
+        if note_ids:
+            self.refresh_notes_list()
+            self.refresh_open_popups()
+
     def show_alarm_popup(self, note, alarm):
+        return self.show_alarm_batch([(note, alarm)])
+
+    def show_alarm_batch(self, items):
+        # Alarms that come due together share one window and one sound. Items
+        # due while the window is still open are added to it, and the sound is
+        # restarted at most once per ALARM_SOUND_INTERVAL seconds. New items
+        # can extend the auto-dismiss deadline but never shorten it.
+        batch = self.alarm_batch or self.create_alarm_batch_window()
+        for note, alarm in items:
+            self.add_alarm_batch_row(batch, note, alarm)
+        self.play_alarm_batch_sound(batch, [alarm for _note, alarm in items])
+        now = GLib.get_monotonic_time()
+        duration = max(alarm.get('duration') or 10 for _note, alarm in items)
+        deadline = max(batch['deadline'] or 0, now + duration * 1000000)
+        if deadline != batch['deadline']:
+            if batch['timeout']:
+                GLib.source_remove(batch['timeout'])
+            batch['deadline'] = deadline
+            batch['timeout'] = GLib.timeout_add((deadline - now) // 1000, self.expire_alarm_batch)
+        self.update_alarm_batch_title()
+        batch['window'].show_all()
+        return batch['window']
+
+    def create_alarm_batch_window(self):
         win = Gtk.Window(title=_("Alarm"), default_width=400, default_height=300)
         win.set_keep_above(True)
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5, margin=10)
         win.add(vbox)
-        
-        title_markup = GLib.markup_escape_text(note['title'])
-        vbox.pack_start(Gtk.Label(label=f"<b>{_('Title')}: {title_markup}</b>", use_markup=True, xalign=0), False, False, 0)
-        
-        lbl_content_header = Gtk.Label(label=_("Content:"), xalign=0, margin_top=10, margin_bottom=2)
-        vbox.pack_start(lbl_content_header, False, False, 0)
-        content_frame = Gtk.Frame(shadow_type=Gtk.ShadowType.NONE)
-        content_frame.get_style_context().add_class("not-list-frame")
-        textview_content = Gtk.TextView()
-        textview_content.set_editable(False)
-        textview_content.set_cursor_visible(False)
-        textview_content.set_wrap_mode(Gtk.WrapMode.WORD)
-        textview_content.get_buffer().set_text(note.get('content', ''))
-        textview_content.set_left_margin(5)
-        textview_content.set_right_margin(5)
-        textview_content.set_top_margin(5)
-        textview_content.set_bottom_margin(5)
+        rows_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
         scroll = Gtk.ScrolledWindow()
-        scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
-        scroll.add(textview_content)
-        content_frame.add(scroll)
-        vbox.pack_start(content_frame, True, True, 0)
+        scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scroll.add(rows_box)
+        vbox.pack_start(scroll, True, True, 0)
         vbox.pack_start(Gtk.Label(label=_("Snooze duration (min):"), xalign=0), False, False, 0)
         scale_snooze = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, 0, 180, 1)
         scale_snooze.set_value(5)
         vbox.pack_start(scale_snooze, False, False, 0)
         btn_box = Gtk.Box(spacing=10)
-        btn_snooze = Gtk.Button(label=_("Snooze"))
-        btn_dismiss = Gtk.Button(label=_("Dismiss"))
-        btn_box.pack_start(btn_snooze, True, True, 0)
-        btn_box.pack_start(btn_dismiss, True, True, 0)
+        btn_snooze_all = Gtk.Button(label=_("Snooze All"))
+        btn_dismiss_all = Gtk.Button(label=_("Dismiss All"))
+        btn_box.pack_start(btn_snooze_all, True, True, 0)
+        btn_box.pack_start(btn_dismiss_all, True, True, 0)
         vbox.pack_end(btn_box, False, False, 0)
-        
-        if alarm.get('sound'):
-            sound_path = os.path.join(ALARMS_DIR, alarm['sound'])
-            if os.path.exists(sound_path):
-                self.sound_player.set_property("uri", f"file://{sound_path}")
-                self.sound_player.set_property("volume", alarm['volume'] / 100.0)
-                self.sound_player.set_state(Gst.State.PLAYING)
-
-        bus = self.sound_player.get_bus()
-        bus.add_signal_watch()
-        bus.connect("message::eos", self.on_eos_message, None)
-        timeout_source = GLib.timeout_add_seconds(alarm.get('duration', 10), self.stop_alarm_sound_and_window, win, note['id'], True)
-        
-        def on_action_close():
-            self.stop_sound()
-            GLib.source_remove(timeout_source)
-            if note['id'] in self.active_alarms: self.active_alarms.remove(note['id'])
-            win.destroy()
+        self.alarm_batch = {'window': win, 'rows_box': rows_box, 'scale_snooze': scale_snooze, 'rows': {}, 'timeout': None,
+                            'btn_snooze_all': btn_snooze_all, 'playing': False, 'deadline': None}
+        btn_snooze_all.connect("clicked", lambda w: self.finish_alarm_batch(snooze=True))
+        btn_dismiss_all.connect("clicked", lambda w: self.finish_alarm_batch(dismiss=True))
+        win.connect("delete-event", self.on_alarm_batch_delete)
+        return self.alarm_batch
+
+    def add_alarm_batch_row(self, batch, note, alarm):
+        # Rows are keyed like active_alarms, so an alarm gets its own row next
+        # to a reminder for the same note that is still open.
+        key = (note['id'], note.get('lead_minutes', 0))
+        if key in batch['rows']:
+            return
+        # A lead reminder leaves the alarm itself in place, so it cannot be snoozed.
+        is_reminder = key[1] > 0
+        row = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        title_markup = GLib.markup_escape_text(note['title'])
+        row.pack_start(Gtk.Label(label=f"<b>{title_markup}</b>", use_markup=True, xalign=0), False, False, 0)
+        if is_reminder:
+            reminder_text = _("Alarm in {minutes} min, at {time}").format(minutes=note['lead_minutes'], time=note['when'].strftime("%H:%M"))
+            row.pack_start(Gtk.Label(label=reminder_text, xalign=0), False, False, 0)
+        if note.get('content'):
+            row.pack_start(Gtk.Label(label=note['content'], xalign=0, wrap=True, selectable=True), False, False, 0)
+        btn_box = Gtk.Box(spacing=10)
+        if not is_reminder and isinstance(note['id'], int):
+            btn_snooze = Gtk.Button(label=_("Snooze"))
+            btn_snooze.connect("clicked", lambda w: self.finish_alarm_batch_item(key, snooze=True))
+            btn_box.pack_start(btn_snooze, False, False, 0)
+        btn_dismiss = Gtk.Button(label=_("Dismiss"))
+        btn_dismiss.connect("clicked", lambda w: self.finish_alarm_batch_item(key, dismiss=True))
+        btn_box.pack_end(btn_dismiss, False, False, 0)
+        row.pack_start(btn_box, False, False, 0)
+        row.pack_start(Gtk.Separator(), False, False, 0)
+        batch['rows_box'].pack_start(row, False, False, 0)
+        batch['rows'][key] = {'widget': row, 'reminder': is_reminder}
+
+    def update_alarm_batch_title(self):
+        rows = self.alarm_batch['rows']
+        self.alarm_batch['window'].set_title(_("Alarm") if len(rows) == 1 else _("{count} Alarms").format(count=len(rows)))
+        self.alarm_batch['btn_snooze_all'].set_sensitive(any(isinstance(note_id, int) and not row['reminder'] for (note_id, _lead), row in rows.items()))
+
+    def play_alarm_batch_sound(self, batch, alarms):
+        # One pipeline for the whole burst: the loudest alarm with a sound
+        # file wins, and a sound already playing is not restarted.
+        now = GLib.get_monotonic_time()
+        if batch['playing']:
+            return
+        if self.last_alarm_sound_at is not None and now - self.last_alarm_sound_at < self.ALARM_SOUND_INTERVAL * 1000000:
+            return
+        candidates = [alarm for alarm in alarms if alarm.get('sound') and os.path.exists(os.path.join(ALARMS_DIR, alarm['sound']))]
+        if not candidates:
+            return
+        alarm = max(candidates, key=lambda a: a.get('volume') or 0)
+        self.last_alarm_sound_at = now
+        batch['playing'] = True
+        self.sound_player.set_state(Gst.State.NULL)
+        self.sound_player.set_property("uri", f"file://{os.path.join(ALARMS_DIR, alarm['sound'])}")
+        self.sound_player.set_property("volume", alarm['volume'] / 100.0)
+        self.sound_player.set_state(Gst.State.PLAYING)
 
-        def snooze_action(widget):
-            snooze_minutes = int(scale_snooze.get_value())
-            if snooze_minutes > 0 and isinstance(note.get('id'), int):
-                new_time = (datetime.now() + timedelta(minutes=snooze_minutes)).strftime("%H:%M")
-                snooze_text = _("Alarm snoozed until {time}.").format(time=new_time)
-                dialog = Gtk.MessageDialog(transient_for=win, modal=True, message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.OK, text=snooze_text)
-                dialog.run()
-                dialog.destroy()
-                self.save_alarm_db(note.get('id'), alarm.get('sound'), alarm.get('volume'), alarm.get('duration'), new_time)
-            self.refresh_notes_list()
-            self.refresh_open_popups()
-            on_action_close()
-        
-        def dismiss_action(widget):
-            if isinstance(note.get('id'), int):
-                self.delete_alarm_db(note.get('id'))
-                self.refresh_notes_list()
-                self.refresh_open_popups()
-            on_action_close()
+    def finish_alarm_batch_item(self, key, snooze=False, dismiss=False, refresh=True):
+        # Snoozing or dismissing a one-off alarm updates the database; a
+        # reminder or a fixed note is simply taken off the list.
+        batch = self.alarm_batch
+        row = batch['rows'].pop(key)
+        self.active_alarms.discard(key)
+        note_id = key[0]
+        changed = False
+        if isinstance(note_id, int) and not row['reminder']:
+            snooze_minutes = int(batch['scale_snooze'].get_value())
+            if snooze and snooze_minutes > 0:
+                core.snooze_alarm(note_id, datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=snooze_minutes))
+                changed = True
+            elif dismiss:
+                core.delete_alarm(note_id)
+                changed = True
+        row['widget'].destroy()
+        if not batch['rows']:
+            self.close_alarm_batch()
+        else:
+            self.update_alarm_batch_title()
+        if changed and refresh:
+            self.on_alarms_changed()
+        return changed
+
+    def finish_alarm_batch(self, snooze=False, dismiss=False):
+        changed = False
+        for key in list(self.alarm_batch['rows']):
+            changed = self.finish_alarm_batch_item(key, snooze=snooze, dismiss=dismiss, refresh=False) or changed
+        if changed:
+            self.on_alarms_changed()
+
+    def on_alarms_changed(self):
+        self.reset_agenda()
+        self.refresh_upcoming_alarms()
+        self.refresh_notes_list()
+        self.refresh_open_popups()
 
-        def on_window_close(widget, event):
-            on_action_close()
-            return False
+    def expire_alarm_batch(self):
+        # Unanswered alarms are dismissed once their duration is over.
+        self.alarm_batch['timeout'] = None
+        self.finish_alarm_batch(dismiss=True)
+        return False
 
-        btn_snooze.connect("clicked", snooze_action)
-        btn_dismiss.connect("clicked", dismiss_action)
-        win.connect("delete-event", on_window_close)
-        win.show_all()
-        
-    def stop_alarm_sound_and_window(self, window, note_id, delete_from_db=False):
+    def close_alarm_batch(self):
+        batch, self.alarm_batch = self.alarm_batch, None
         self.stop_sound()
-        if note_id in self.active_alarms: self.active_alarms.remove(note_id)
-        if delete_from_db and isinstance(note_id, int):
-            self.delete_alarm_db(note_id)
-            self.refresh_notes_list()
-            self.refresh_open_popups()
-        window.destroy()
-        return False
+        if batch['timeout']:
+            GLib.source_remove(batch['timeout'])
+        for key in batch['rows']:
+            self.active_alarms.discard(key)
+        batch['window'].destroy()
+
+    def on_alarm_batch_delete(self, window, event):
+        self.close_alarm_batch()
+        return True
 
     def alarm_popup(self, widget):
         win = Gtk.Window(title=_("Select Note for Alarm"), transient_for=self, modal=True, default_width=400, default_height=420)
@@ -902,7 +1406,7 @@ class NoteApplication(Gtk.ApplicationWindow):
         note_list_frame_alarm.add(scroll)
         vbox_main.pack_start(note_list_frame_alarm, True, True, 0)
         def update_titles(calendar):
-            for child in listbox_titles.get_children(): listbox_titles.remove(child)
+            for child in listbox_titles.get_children(): child.destroy()
             year, month, day = calendar.get_date()
             date_str = f"{year}-{month+1:02d}-{day:02d}"
             day_notes = [n for n in self.notes if n['date'] == date_str]
@@ -922,7 +1426,7 @@ class NoteApplication(Gtk.ApplicationWindow):
                     if note.get('id') in all_alarms:
                         image_path = self._get_themed_icon_path("alarm_filled.png")
                         if os.path.exists(image_path):
-                            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(image_path, 24, 24)
+                            pixbuf = load_pixbuf(image_path, 24, 24)
                             img = Gtk.Image.new_from_pixbuf(pixbuf)
                             img.set_valign(Gtk.Align.CENTER)
                             hbox.pack_end(img, False, False, 0)
@@ -962,9 +1466,13 @@ class NoteApplication(Gtk.ApplicationWindow):
         scale_duration = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, 1, 180, 1)
         scale_duration.set_value(10)
         vbox.pack_start(scale_duration, False, False, 0)
+        vbox.pack_start(Gtk.Label(label=_("Remind Before (min, comma separated):"), xalign=0), False, False, 0)
+        entry_leads = Gtk.Entry(placeholder_text="15, 60")
+        vbox.pack_start(entry_leads, False, False, 0)
         alarm_data = self.load_alarm_db(note_item.get('id'))
         if alarm_data:
             entry_time.set_text(alarm_data['time'])
+            entry_leads.set_text(", ".join(str(lead) for lead in alarm_data['lead_minutes']))
             scale_volume.set_value(alarm_data['volume'])
             scale_duration.set_value(alarm_data['duration'])
             for i, row in enumerate(combo_sound.get_model()):
@@ -977,7 +1485,8 @@ class NoteApplication(Gtk.ApplicationWindow):
         vbox.pack_end(btn_box, False, False, 0)
         def on_save_clicked(widget):
             self.stop_sound(btn_test_sound)
-            self.save_alarm_db(note_item.get('id'), combo_sound.get_active_text() or "", int(scale_volume.get_value()), int(scale_duration.get_value()), entry_time.get_text())
+            self.save_alarm_db(note_item.get('id'), combo_sound.get_active_text() or "", int(scale_volume.get_value()), int(scale_duration.get_value()), entry_time.get_text(),
+                               core.parse_lead_minutes(entry_leads.get_text()))
             win.destroy()
             self.refresh_notes_list()
         def on_delete_clicked(widget):
@@ -999,16 +1508,17 @@ class NoteApplication(Gtk.ApplicationWindow):
         self.sound_player.set_property("volume", volume / 100.0)
         self.sound_player.set_state(Gst.State.PLAYING)
         test_button.set_label(_("Stop Sound"))
-        bus = self.sound_player.get_bus()
-        bus.add_signal_watch()
-        bus.connect("message::eos", self.on_eos_message, test_button)
+        self.sound_test_button = test_button
 
-    def on_eos_message(self, bus, message, test_button):
-        if test_button: 
-            self.stop_sound(test_button)
-        else:
+    def on_eos_message(self, bus, message):
+        # A preview plays once; an alarm sound loops while its window is open.
+        if self.sound_test_button:
+            self.stop_sound(self.sound_test_button)
+        elif self.alarm_batch and self.alarm_batch['playing']:
             self.sound_player.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH, 0)
             self.sound_player.set_state(Gst.State.PLAYING)
+        else:
+            self.stop_sound()
         
     def on_volume_changed(self, scale):
         if self.sound_player.get_state(0)[1] == Gst.State.PLAYING:
@@ -1016,11 +1526,16 @@ class NoteApplication(Gtk.ApplicationWindow):
 
     def stop_sound(self, test_button=None):
         self.sound_player.set_state(Gst.State.NULL)
+        self.sound_test_button = None
+        # Whatever stopped it (a preview took the player over, or the alarm
+        # window closed), the next burst of alarms has to start it again.
+        if self.alarm_batch:
+            self.alarm_batch['playing'] = False
         if test_button:
             test_button.set_label(_("Play Sound"))
 
     def show_startup_notification(self):
-        if not self.startup_notification_enabled: return False
+        if not self.settings['startup_notification_enabled']: return False
         today = datetime.now().strftime("%Y-%m-%d")
         todays_notes = [n for n in self.notes if n['date'] == today]
         if todays_notes:
@@ -1037,65 +1552,133 @@ class NoteApplication(Gtk.ApplicationWindow):
         return False
     
     def toggle_startup_notification(self, widget):
-        self.startup_notification_enabled = not self.startup_notification_enabled
-        self.save_setting_db('startup_notification_enabled', str(self.startup_notification_enabled))
-        self.update_notification_button_label()
+        self.settings.set('startup_notification_enabled', not self.settings['startup_notification_enabled'])
         self.popover.hide()
 
     def update_notification_button_label(self):
-        label = _("Disable Notifications") if self.startup_notification_enabled else _("Enable Notifications")
+        if not self.ui_built:
+            return
+        label = _("Disable Notifications") if self.settings['startup_notification_enabled'] else _("Enable Notifications")
         self.btn_notifications.set_label(label)
         
-    def start_weather_update_in_background(self, *args):
+    def set_active_location(self, location_id):
+        location = next((l for l in self.locations if l['id'] == location_id), None)
+        if location is None and self.locations:
+            location = self.locations[0]
+        self.active_location_id = location['id'] if location else None
+        self.current_latitude = location['latitude'] if location else None
+        self.current_longitude = location['longitude'] if location else None
+        self.current_location_name = location['name'] if location else None
+
+    def location_label(self, location):
+        name = location['name'] or f"{location['latitude']}, {location['longitude']}"
+        forecast = self.weather_service.cached(location['id'])
+        if forecast:
+            temperature = forecast.temperature[forecast.current_index()]
+            if temperature is not None:
+                return f"{name} ({temperature}°C)"
+        return name
+
+    def refresh_location_combo(self):
+        if not self.ui_built:
+            return
+        self.combo_location.handler_block_by_func(self.on_location_combo_changed)
+        self.combo_location.remove_all()
+        for location in self.locations:
+            self.combo_location.append(str(location['id']), self.location_label(location))
+        if self.active_location_id is not None:
+            self.combo_location.set_active_id(str(self.active_location_id))
+        self.combo_location.handler_unblock_by_func(self.on_location_combo_changed)
+        self.combo_location.set_visible(len(self.locations) > 1)
+
+    def on_location_combo_changed(self, combo):
+        active_id = combo.get_active_id()
+        if active_id is None:
+            return
+        self.set_active_location(int(active_id))
+        self.settings.set('active_location_id', self.active_location_id)
+        forecast = self.weather_service.cached(self.active_location_id)
+        if forecast:
+            self._update_weather_ui(forecast)
+        else:
+            self.show_weather_loading()
+            location = next(l for l in self.locations if l['id'] == self.active_location_id)
+            self.weather_service.refresh([location], self.post_location_weather)
+
+    def show_weather_loading(self):
+        if not self.ui_built:
+            return
         for child in self.weather_frame_vbox.get_children():
-            self.weather_frame_vbox.remove(child)
+            child.destroy()
         loading_label = Gtk.Label(label=_("Loading weather information..."))
         self.weather_frame_vbox.pack_start(loading_label, True, True, 0)
         self.weather_frame_vbox.show_all()
-        
-        thread = threading.Thread(target=self._fetch_weather_data)
-        thread.daemon = True
-        thread.start()
-        return True
 
-    def _fetch_weather_data(self):
-        if not self.current_latitude or not self.current_longitude:
-            GLib.idle_add(self._update_weather_ui, {"error": _("Please set a location.")})
-            return
+    def start_weather_update_in_background(self, *args):
+        # Draws whatever is cached straight away (persisted across restarts)
+        # and only goes to the network for locations whose data has expired.
+        if self.weather_timer:
+            GLib.source_remove(self.weather_timer)
+            self.weather_timer = None
+        self.refresh_location_combo()
+        if not self.locations:
+            self._update_weather_ui(None, _("Please set a location."))
+            return False
+        forecast = self.weather_service.cached(self.active_location_id)
+        if forecast:
+            self._update_weather_ui(forecast)
+        else:
+            self.show_weather_loading()
+        due = self.weather_service.due(self.locations)
+        if due:
+            self.weather_service.refresh(due, self.post_location_weather)
+        else:
+            self.schedule_weather_refresh()
+        return False
 
-        try:
-            url = f"https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={self.current_latitude}&lon={self.current_longitude}"
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            GLib.idle_add(self._update_weather_ui, data)
-        except Exception as e:
-            print(f"Error fetching weather: {e}")
-            GLib.idle_add(self._update_weather_ui, {"error": _("Could not retrieve weather.")})
+    def schedule_weather_refresh(self):
+        if self.weather_timer:
+            GLib.source_remove(self.weather_timer)
+        delay = self.weather_service.next_refresh_delay(self.locations)
+        self.weather_timer = GLib.timeout_add_seconds(delay, self.start_weather_update_in_background)
+
+    def post_location_weather(self, location, forecast, error):
+        # Runs on a weather pool thread; hand the result to the main loop.
+        GLib.idle_add(self._on_location_weather, location, forecast, error)
+
+    def _on_location_weather(self, location, forecast, error):
+        if self.ui_built:
+            for row in self.combo_location.get_model():
+                if row[1] == str(location['id']):
+                    row[0] = self.location_label(location)
+        if location['id'] == self.active_location_id:
+            forecast = forecast or self.weather_service.cached(location['id'])
+            self._update_weather_ui(forecast, None if forecast else _("Could not retrieve weather."))
+        if not self.weather_service.pending:
+            self.schedule_weather_refresh()
+        return False
 
-    def _update_weather_ui(self, data):
+    @trace.traced()
+    def _update_weather_ui(self, forecast, error=None):
+        if not self.ui_built:
+            return
         for child in self.weather_frame_vbox.get_children():
-            self.weather_frame_vbox.remove(child)
+            child.destroy()
 
-        if not data or data.get("error"):
-            error_text = data.get("error", _("Failed to get weather data."))
+        if error or not forecast:
+            error_text = error or _("Failed to get weather data.")
             error_label = Gtk.Label(label=error_text, justify=Gtk.Justification.CENTER)
             self.weather_frame_vbox.pack_start(error_label, True, True, 0)
             self.weather_frame_vbox.show_all()
             return
         
         try:
-            timeseries = data.get('properties', {}).get('timeseries', [])
-            if not timeseries: raise ValueError("Could not get time series data from API.")
-            
-            current_data = timeseries[0]['data']
-            details = current_data['instant']['details']
-            summary = current_data['next_1_hours']['summary']
-            temperature = details.get('air_temperature')
-            weather_symbol_code = summary.get('symbol_code')
-            wind_speed_ms = details.get('wind_speed')
-            relative_humidity = details.get('relative_humidity')
-            precipitation_amount = current_data['next_1_hours']['details'].get('precipitation_amount', 0)
+            current = forecast.at(forecast.current_index())
+            temperature = current['temperature']
+            weather_symbol_code = current['icon']
+            wind_speed_ms = current['wind_speed']
+            relative_humidity = current['humidity']
+            precipitation_amount = current['precipitation'] or 0
             wind_speed_kmh = round(wind_speed_ms * 3.6, 1) if wind_speed_ms is not None else 0
             
             weather_symbols = {
@@ -1120,7 +1703,7 @@ class NoteApplication(Gtk.ApplicationWindow):
             final_icon_path = os.path.join(ICONS_DIR, icon_filename)
             img = Gtk.Image()
             if os.path.exists(final_icon_path):
-                 pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(final_icon_path, 48, 48)
+                 pixbuf = load_pixbuf(final_icon_path, 48, 48)
                  img.set_from_pixbuf(pixbuf)
             else: img.set_from_icon_name('image-missing-symbolic', Gtk.IconSize.DIALOG)
 
@@ -1134,7 +1717,7 @@ class NoteApplication(Gtk.ApplicationWindow):
                 icon_path = self._get_themed_icon_path(icon_filename)
                 img = Gtk.Image()
                 if os.path.exists(icon_path):
-                    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(icon_path, 24, 24)
+                    pixbuf = load_pixbuf(icon_path, 24, 24)
                     img.set_from_pixbuf(pixbuf)
                 info_grid.attach(img, col_idx, 0, 1, 1)
                 info_grid.attach(Gtk.Label(label=text), col_idx, 1, 1, 1)
@@ -1146,6 +1729,15 @@ class NoteApplication(Gtk.ApplicationWindow):
             main_hbox.pack_end(info_grid, False, False, 0)
             
             self.weather_frame_vbox.pack_start(main_hbox, True, True, 0)
+            entry = self.weather_service.entry(self.active_location_id)
+            if entry and entry.forecast is forecast and entry.is_stale():
+                age_text = _("Updated {age} ago").format(age=format_age(entry.age()))
+                if entry.failed:
+                    age_text += " · " + _("offline")
+                lbl_age = Gtk.Label(label=age_text, xalign=1)
+                lbl_age.get_style_context().add_class("dim-label")
+                self.weather_frame_vbox.pack_start(lbl_age, False, False, 0)
+            if trace.enabled: trace.count("widgets", count_widgets(self.weather_frame_vbox))
             self.weather_frame_vbox.show_all()
         except Exception as e:
             print(f"Error updating weather UI: {e}")
@@ -1157,6 +1749,12 @@ class NoteApplication(Gtk.ApplicationWindow):
         win = Gtk.Window(title=_("Location Settings"), transient_for=self, modal=True, default_width=400)
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10, margin=10)
         win.add(vbox)
+        vbox.pack_start(Gtk.Label(label=_("Saved Locations:"), xalign=0), False, False, 0)
+        combo_saved = Gtk.ComboBoxText()
+        combo_saved.append("new", _("(New location)"))
+        for location in self.locations:
+            combo_saved.append(str(location['id']), location['name'] or f"{location['latitude']}, {location['longitude']}")
+        vbox.pack_start(combo_saved, False, False, 0)
         vbox.pack_start(Gtk.Label(label=_("Location Name:"), xalign=0), False, False, 0)
         entry_location = Gtk.Entry(text=self.current_location_name or "", placeholder_text=_("City, Country Code"))
         vbox.pack_start(entry_location, False, False, 0)
@@ -1166,25 +1764,79 @@ class NoteApplication(Gtk.ApplicationWindow):
         vbox.pack_start(Gtk.Label(label=_("Longitude:"), xalign=0), False, False, 0)
         entry_lon = Gtk.Entry(text=self.current_longitude or "", placeholder_text=_("00.0000 (East +, West -)"))
         vbox.pack_start(entry_lon, False, False, 0)
+        self.attach_place_completion(entry_location, entry_lat, entry_lon)
         btn_box = Gtk.Box(spacing=10)
         btn_save = Gtk.Button(label=_("Save"))
         btn_delete = Gtk.Button(label=_("Reset to Default"))
+        btn_remove = Gtk.Button(label=_("Delete Location"))
         btn_box.pack_start(btn_save, True, True, 0)
         btn_box.pack_start(btn_delete, True, True, 0)
+        btn_box.pack_start(btn_remove, True, True, 0)
         vbox.pack_end(btn_box, False, False, 0)
-        btn_save.connect("clicked", lambda w: self.save_location(win, entry_location, entry_lat, entry_lon))
+
+        def on_saved_changed(combo):
+            location = next((l for l in self.locations if str(l['id']) == combo.get_active_id()), None)
+            entry_location.set_text((location['name'] or "") if location else "")
+            entry_lat.set_text(location['latitude'] if location else "")
+            entry_lon.set_text(location['longitude'] if location else "")
+            btn_remove.set_sensitive(location is not None)
+
+        combo_saved.connect("changed", on_saved_changed)
+        combo_saved.set_active_id(str(self.active_location_id) if self.active_location_id is not None else "new")
+        btn_save.connect("clicked", lambda w: self.save_location(win, entry_location, entry_lat, entry_lon, combo_saved.get_active_id()))
         btn_delete.connect("clicked", lambda w: self.reset_location_to_default(entry_location, entry_lat, entry_lon))
+        btn_remove.connect("clicked", lambda w: self.delete_location(win, combo_saved.get_active_id()))
         win.show_all()
 
-    def save_location(self, window, entry_location, entry_lat, entry_lon):
+    def attach_place_completion(self, entry_location, entry_lat, entry_lon):
+        # Suggestions come from the offline place database when it is
+        # installed; without it the fields are simply typed in by hand.
+        if self.gazetteer is None:
+            self.gazetteer = gazetteer.Gazetteer.open_default() or False
+        if not self.gazetteer:
+            return
+        store = Gtk.ListStore(str, str, str)
+        completion = Gtk.EntryCompletion(model=store, text_column=0, minimum_key_length=gazetteer.MIN_PREFIX_LENGTH)
+        # The store already holds only matches, folded for accents by the lookup.
+        completion.set_match_func(lambda completion, key, tree_iter: True)
+        entry_location.set_completion(completion)
+
+        def on_text_changed(entry):
+            store.clear()
+            if not entry.has_focus():
+                return
+            with trace.span("place lookup", "sqlite", text=entry.get_text()):
+                places = self.gazetteer.search(entry.get_text())
+            for place in places:
+                label = f"{place['name']}, {place['country']}" if place['country'] else place['name']
+                store.append([label, str(place['latitude']), str(place['longitude'])])
+
+        def on_match_selected(completion, model, tree_iter):
+            label, latitude, longitude = model[tree_iter]
+            with entry_location.handler_block(changed_handler):
+                entry_location.set_text(label)
+                entry_location.set_position(-1)
+            entry_lat.set_text(latitude)
+            entry_lon.set_text(longitude)
+            return True
+
+        changed_handler = entry_location.connect("changed", on_text_changed)
+        completion.connect("match-selected", on_match_selected)
+
+    def save_location(self, window, entry_location, entry_lat, entry_lon, location_id="new"):
         try:
             new_lat, new_lon = float(entry_lat.get_text()), float(entry_lon.get_text())
             new_location_name = entry_location.get_text()
-            self.save_setting_db('latitude', str(new_lat))
-            self.save_setting_db('longitude', str(new_lon))
-            self.save_setting_db('location_name', new_location_name)
-            self.current_latitude, self.current_longitude, self.current_location_name = str(new_lat), str(new_lon), new_location_name
-            self.start_weather_update_in_background()
+            location = {'id': None if location_id in (None, "new") else int(location_id),
+                        'name': new_location_name, 'latitude': str(new_lat), 'longitude': str(new_lon)}
+            core.save_location(location)
+            self.weather_service.forget(location['id'])
+            self.locations = core.load_locations()
+            self.set_active_location(location['id'])
+            self.settings.set('active_location_id', location['id'])
+            self.refresh_location_combo()
+            self.show_weather_loading()
+            self.weather_service.refresh([location], self.post_location_weather)
             window.destroy()
         except ValueError:
             dialog = Gtk.MessageDialog(transient_for=window, modal=True, message_type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.OK, text=_("Latitude and longitude must be numeric values."))
@@ -1195,6 +1847,17 @@ class NoteApplication(Gtk.ApplicationWindow):
         entry_location.set_text("")
         entry_lat.set_text("")
         entry_lon.set_text("")
+
+    def delete_location(self, window, location_id):
+        if location_id in (None, "new"):
+            return
+        core.delete_location(int(location_id))
+        self.weather_service.forget(int(location_id))
+        self.locations = core.load_locations()
+        self.set_active_location(self.active_location_id)
+        self.settings.set('active_location_id', self.active_location_id)
+        window.destroy()
+        self.start_weather_update_in_background()
         
     def advanced_weather_popup(self, widget):
         title = _("5-Day Weather Forecast for {location}").format(location=self.current_location_name or '...')
@@ -1208,56 +1871,18 @@ class NoteApplication(Gtk.ApplicationWindow):
             win.show_all()
             return
         try:
-            url = f"https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={self.current_latitude}&lon={self.current_longitude}"
-            response = requests.get(url, headers=HEADERS)
-            response.raise_for_status()
-            data = response.json()
-            if not data or 'properties' not in data or 'timeseries' not in data['properties']: raise ValueError("Invalid or incomplete data from API.")
-            forecast_by_day_and_time = self.group_forecast_data(data['properties']['timeseries'])
-            grid = Gtk.Grid(column_spacing=15, row_spacing=10)
-            grid.get_style_context().add_class("forecast-grid")
-            vbox.pack_start(grid, True, True, 0)
-            day_names = [_("Monday"), _("Tuesday"), _("Wednesday"), _("Thursday"), _("Friday"), _("Saturday"), _("Sunday")]
-            time_periods = [_("Morning"), _("Noon"), _("Evening"), _("Night")]
-            grid.attach(Gtk.Label(label=""), 0, 0, 1, 1)
-            for i, period in enumerate(time_periods):
-                lbl = Gtk.Label()
-                lbl.set_markup(f"<span weight='bold'>{period}</span>")
-                grid.attach(lbl, i + 1, 0, 1, 1)
-            days_to_display = sorted(forecast_by_day_and_time.keys())[:5]
-            for i, day in enumerate(days_to_display):
-                day_of_week = datetime.strptime(day, "%Y-%m-%d").weekday()
-                lbl_day = Gtk.Label(justify=Gtk.Justification.LEFT)
-                lbl_day.set_markup(f"<span weight='bold'>{day_names[day_of_week]}</span>")
-                grid.attach(lbl_day, 0, i + 1, 1, 1)
-                
-                translated_periods = [_("Morning"), _("Noon"), _("Evening"), _("Night")]
-                original_periods = ["Morning", "Noon", "Evening", "Night"]
-                period_map = dict(zip(original_periods, translated_periods))
-
-                for j, period_key in enumerate(original_periods):
-                    period_display = period_map[period_key]
-                    if period_key in forecast_by_day_and_time[day] and forecast_by_day_and_time[day][period_key]:
-                        data_item = forecast_by_day_and_time[day][period_key]
-                        temp = data_item.get('temperature', '-')
-                        icon_code = data_item.get('icon', None)
-                        wind_speed = data_item.get('wind_speed', '-')
-                        humidity = data_item.get('humidity', '-')
-                        cell_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5, margin=5)
-                        if icon_code:
-                            icon_path = os.path.join(ICONS_DIR, f"{icon_code}.svg")
-                            if os.path.exists(icon_path):
-                                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(icon_path, 32, 32)
-                                cell_vbox.pack_start(Gtk.Image.new_from_pixbuf(pixbuf), False, False, 0)
-                        lbl_temp = Gtk.Label(use_markup=True, label=f"<b>{temp}°C</b>")
-                        cell_vbox.pack_start(lbl_temp, False, False, 0)
-                        wind_label_text = _("Wind: {speed} m/s").format(speed=wind_speed)
-                        humidity_label_text = _("Humidity: %{humidity}").format(humidity=humidity)
-                        cell_vbox.pack_start(Gtk.Label(label=wind_label_text), False, False, 0)
-                        cell_vbox.pack_start(Gtk.Label(label=humidity_label_text), False, False, 0)
-                        grid.attach(cell_vbox, j + 1, i + 1, 1, 1)
-                    else:
-                        grid.attach(Gtk.Label(label="-"), j + 1, i + 1, 1, 1)
+            forecast = self.weather_service.cached(self.active_location_id)
+            if forecast is None:
+                forecast = weather.parse_forecast(weather.fetch_forecast(self.current_latitude, self.current_longitude))
+            forecast_stack = Gtk.Stack()
+            forecast_switcher = Gtk.StackSwitcher(stack=forecast_stack, halign=Gtk.Align.CENTER)
+            vbox.pack_start(forecast_switcher, False, False, 0)
+            vbox.pack_start(forecast_stack, True, True, 0)
+            chart_scroll = Gtk.ScrolledWindow()
+            chart_scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
+            chart_scroll.add(ForecastChart(forecast))
+            forecast_stack.add_titled(chart_scroll, "chart", _("Forecast"))
+            forecast_stack.add_titled(self.create_hourly_forecast_view(forecast), "hourly", _("Hourly"))
             btn_close = Gtk.Button(label=_("Close"))
             btn_close.connect("clicked", lambda w: win.destroy())
             vbox.pack_end(btn_close, False, False, 0)
@@ -1268,46 +1893,41 @@ class NoteApplication(Gtk.ApplicationWindow):
             dialog.destroy()
             print(f"Error detail: {e}")
 
-    def find_closest_data(self, day_data, target_hour):
-        if not day_data: return None
-        return min(day_data, key=lambda item: abs(datetime.fromisoformat(item['time'].replace('Z', '+00:00')).hour - target_hour))
-
-    def group_forecast_data(self, timeseries_data):
-        forecast_by_day = defaultdict(list)
-        for item in timeseries_data:
-            day_str = datetime.fromisoformat(item['time'].replace('Z', '+00:00')).strftime("%Y-%m-%d")
-            forecast_by_day[day_str].append(item)
-        grouped_data = defaultdict(dict)
-        for day, day_data in forecast_by_day.items():
-            grouped_data[day]['Morning'] = self.extract_weather_info(self.find_closest_data(day_data, 6))
-            grouped_data[day]['Noon'] = self.extract_weather_info(self.find_closest_data(day_data, 12))
-            grouped_data[day]['Evening'] = self.extract_weather_info(self.find_closest_data(day_data, 18))
-            grouped_data[day]['Night'] = self.extract_weather_info(self.find_closest_data(day_data, 0))
-        return grouped_data
-        
-    def extract_weather_info(self, item):
-        if not item: return None
-        try:
-            summary_key_order = ['next_1_hours', 'next_6_hours', 'next_12_hours']
-            summary = next((item['data'][key]['summary'] for key in summary_key_order if key in item['data']), None)
-            if not summary: return None
-            details = item['data']['instant']['details']
-            return {'temperature': details['air_temperature'], 'icon': summary['symbol_code'], 'wind_speed': details['wind_speed'], 'humidity': details['relative_humidity']}
-        except KeyError:
-            return None
-    
-    def on_font_select_clicked(self, widget):
-        self.popover.hide()
-        dialog = Gtk.FontChooserDialog(title=_("Select Font"), transient_for=self, modal=True)
-        dialog.set_font(self.current_font_description)
-        if dialog.run() == Gtk.ResponseType.OK:
-            new_font_description = dialog.get_font()
-            if new_font_description:
-                self.current_font_description = new_font_description
-                self.save_setting_db('font_description', new_font_description)
-                self._load_css()
-        dialog.destroy()
-        
+    def create_hourly_forecast_view(self, forecast):
+        # A TreeView only renders the visible rows, so all ~80 timesteps cost
+        # one widget instead of a box of labels per hour.
+        store = Gtk.ListStore(str, GdkPixbuf.Pixbuf, str, str, str, str)
+        day_names = [_("Monday"), _("Tuesday"), _("Wednesday"), _("Thursday"), _("Friday"), _("Saturday"), _("Sunday")]
+        icon_cache = {}
+        for day in forecast.days():
+            start, end = forecast.day_slices[day]
+            year, month, day_of_month = forecast.day_dates[day]
+            day_name = day_names[calendar.weekday(year, month, day_of_month)]
+            for i in range(start, end):
+                symbol = forecast.symbol[i]
+                if symbol not in icon_cache:
+                    icon_path = os.path.join(ICONS_DIR, f"{symbol}.svg")
+                    icon_cache[symbol] = load_pixbuf(icon_path, 24, 24) if symbol and os.path.exists(icon_path) else None
+                temperature = forecast.temperature[i]
+                precipitation = forecast.precipitation[i]
+                store.append([
+                    f"{day_name} {forecast.clock(i)}",
+                    icon_cache[symbol],
+                    f"{temperature}°C" if temperature is not None else "-",
+                    f"{precipitation} mm" if precipitation is not None else "-",
+                    f"{forecast.wind_speed[i]} m/s" if forecast.wind_speed[i] is not None else "-",
+                    f"%{forecast.humidity[i]}" if forecast.humidity[i] is not None else "-",
+                ])
+        tree = Gtk.TreeView(model=store)
+        tree.append_column(Gtk.TreeViewColumn(_("Time"), Gtk.CellRendererText(), text=0))
+        tree.append_column(Gtk.TreeViewColumn("", Gtk.CellRendererPixbuf(), pixbuf=1))
+        for title, column in ((_("Temperature"), 2), (_("Precipitation"), 3), (_("Wind"), 4), (_("Humidity"), 5)):
+            tree.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=column))
+        scroll = Gtk.ScrolledWindow()
+        scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scroll.add(tree)
+        return scroll
+
     def weekly_view_popup(self, widget):
         win = Gtk.Window(default_width=900, default_height=600)
         header = Gtk.HeaderBar()
@@ -1330,10 +1950,15 @@ class NoteApplication(Gtk.ApplicationWindow):
         main_box.pack_start(weekly_grid, True, True, 0)
         win.show_all()
 
+    @trace.traced()
     def populate_weekly_grid(self, grid, selected_date, parent_win):
         for child in grid.get_children():
-            grid.remove(child)
+            child.destroy()
         start_of_week = selected_date - timedelta(days=selected_date.weekday())
+        all_alarms = self.load_all_alarms()
+        recurring = {}
+        for day, fixed_note in core.occurrence_index.between(start_of_week.date(), (start_of_week + timedelta(days=6)).date()):
+            recurring.setdefault(day, []).append(fixed_note)
         day_names = [_("Monday"), _("Tuesday"), _("Wednesday"), _("Thursday"), _("Friday"), _("Saturday"), _("Sunday")]
         for i, name in enumerate(day_names):
             lbl = Gtk.Label(xalign=0.5, margin_bottom=5)
@@ -1353,8 +1978,7 @@ class NoteApplication(Gtk.ApplicationWindow):
             notes_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=3, margin_left=4, margin_right=4, margin_bottom=4)
             day_scroll.add(notes_box)
             day_cell_container.pack_start(day_scroll, True, True, 0)
-            day_notes = [n for n in self.notes if n['date'] == date_str]
-            all_alarms = self.load_all_alarms()
+            day_notes = self.notes_on(date_str)
             for note in day_notes:
                 btn_note = Gtk.Button()
                 hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
@@ -1365,13 +1989,16 @@ class NoteApplication(Gtk.ApplicationWindow):
                 if note.get('id') in all_alarms:
                     image_path = self._get_themed_icon_path("alarm_filled.png")
                     if os.path.exists(image_path):
-                        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(image_path, 16, 16)
+                        pixbuf = load_pixbuf(image_path, 16, 16)
                         img = Gtk.Image.new_from_pixbuf(pixbuf)
                         img.set_valign(Gtk.Align.CENTER)
                         hbox.pack_end(img, False, False, 0)
                 btn_note.connect("clicked", lambda w, n=note, p=parent_win: self.edit_note_popup(n, parent_window=p))
                 notes_box.pack_start(btn_note, False, False, 0)
+            for fixed_note in recurring.get(current_day.date(), ()):
+                notes_box.pack_start(self.create_recurring_button(fixed_note), False, False, 0)
             grid.attach(day_cell_container, i, 1, 1, 1)
+        if trace.enabled: trace.count("widgets", count_widgets(grid))
         grid.show_all()
 
     def monthly_view_popup(self, widget):
@@ -1396,13 +2023,15 @@ class NoteApplication(Gtk.ApplicationWindow):
         main_box.pack_start(monthly_grid, True, True, 0)
         win.show_all()
 
+    @trace.traced()
     def populate_monthly_grid(self, grid, selected_date, parent_win):
         all_alarms = self.load_all_alarms()
         for child in grid.get_children():
-            grid.remove(child)
+            child.destroy()
         first_day_of_month = selected_date.replace(day=1)
         start_weekday = first_day_of_month.weekday() 
         num_days_in_month = calendar.monthrange(selected_date.year, selected_date.month)[1]
+        recurring = core.occurrence_index.month(selected_date.year, selected_date.month)
         day_names = [_("Monday"), _("Tuesday"), _("Wednesday"), _("Thursday"), _("Friday"), _("Saturday"), _("Sunday")]
         for i, name in enumerate(day_names):
             lbl = Gtk.Label(xalign=0.5, margin_bottom=5)
@@ -1428,7 +2057,7 @@ class NoteApplication(Gtk.ApplicationWindow):
                 notes_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=3, margin_left=4, margin_right=4, margin_bottom=4)
                 day_scroll.add(notes_box)
                 day_cell_container.pack_start(day_scroll, True, True, 0)
-                day_notes = [n for n in self.notes if n['date'] == date_str]
+                day_notes = self.notes_on(date_str)
                 for note in day_notes:
                     btn_note = Gtk.Button()
                     hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
@@ -1439,16 +2068,19 @@ class NoteApplication(Gtk.ApplicationWindow):
                     if note.get('id') in all_alarms:
                         image_path = self._get_themed_icon_path("alarm_filled.png")
                         if os.path.exists(image_path):
-                            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(image_path, 16, 16)
+                            pixbuf = load_pixbuf(image_path, 16, 16)
                             img = Gtk.Image.new_from_pixbuf(pixbuf)
                             img.set_valign(Gtk.Align.CENTER)
                             hbox.pack_end(img, False, False, 0)
                     btn_note.connect("clicked", lambda w, n=note, p=parent_win: self.edit_note_popup(n, parent_window=p))
                     notes_box.pack_start(btn_note, False, False, 0)
+                for fixed_note in recurring.get(current_day_date.date(), ()):
+                    notes_box.pack_start(self.create_recurring_button(fixed_note), False, False, 0)
                 grid.attach(day_cell_container, col, row, 1, 1)
                 current_day_number += 1
             if current_day_number > num_days_in_month:
                 break
+        if trace.enabled: trace.count("widgets", count_widgets(grid))
         grid.show_all()
 
     def fixed_note_popup(self, widget, note_data=None):
@@ -1605,6 +2237,8 @@ class NoteApplication(Gtk.ApplicationWindow):
             
         self.save_fixed_note_db(note_dict)
         self.refresh_fixed_notes_list()
+        self.refresh_notes_list()
+        self.refresh_open_popups()
         window.destroy()
     
     def on_fixed_note_delete(self, widget, note_id, window):
@@ -1614,38 +2248,23 @@ class NoteApplication(Gtk.ApplicationWindow):
         response = dialog.run()
         dialog.destroy()
         if response == Gtk.ResponseType.YES:
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM fixed_notes WHERE id=?", (note_id,))
-            conn.commit()
-            conn.close()
+            core.delete_fixed_note(note_id)
             self.load_fixed_notes()
             self.refresh_fixed_notes_list()
+            self.refresh_notes_list()
+            self.refresh_open_popups()
             window.destroy()
 
     def save_fixed_note_db(self, note_dict):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        if 'id' in note_dict:
-            cursor.execute("""UPDATE fixed_notes SET title=?, content=?, event_time=?, alarm_enabled=?, 
-                              alarm_days=?, repeat_type=?, repeat_day=?, repeat_month=? WHERE id=?""", 
-                           (note_dict['title'], note_dict['content'], note_dict['event_time'], 
-                            note_dict['alarm_enabled'], note_dict['alarm_days'], note_dict['repeat_type'], 
-                            note_dict['repeat_day'], note_dict['repeat_month'], note_dict['id']))
-        else:
-            cursor.execute("""INSERT INTO fixed_notes (title, content, event_time, alarm_enabled, 
-                                                     alarm_days, repeat_type, repeat_day, repeat_month) 
-                              VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", 
-                           (note_dict['title'], note_dict['content'], note_dict['event_time'],
-                            note_dict['alarm_enabled'], note_dict['alarm_days'], note_dict['repeat_type'],
-                            note_dict['repeat_day'], note_dict['repeat_month']))
-        conn.commit()
-        conn.close()
+        core.save_fixed_note(note_dict)
         self.load_fixed_notes()
 
+    @trace.traced()
     def refresh_fixed_notes_list(self, filtered_notes=None):
+        if not self.ui_built:
+            return
         for child in self.fixed_notes_listbox.get_children():
-            self.fixed_notes_listbox.remove(child)
+            child.destroy()
 
         notes_to_display = self.fixed_notes if filtered_notes is None else filtered_notes
 
@@ -1714,15 +2333,11 @@ class NoteApplication(Gtk.ApplicationWindow):
 
                 self.fixed_notes_listbox.add(row)
         
+        if trace.enabled: trace.count("widgets", count_widgets(self.fixed_notes_listbox))
         self.fixed_notes_listbox.show_all()
 
     def on_fixed_note_switch_toggled(self, switch, gparam, note_id):
-        is_alarm_enabled = 1 if switch.get_active() else 0
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE fixed_notes SET alarm_enabled=? WHERE id=?", (is_alarm_enabled, note_id))
-        conn.commit()
-        conn.close()
+        core.set_fixed_note_alarm_enabled(note_id, switch.get_active())
         self.load_fixed_notes()
         self.refresh_fixed_notes_list()
 
@@ -1736,7 +2351,8 @@ class NoteApplication(Gtk.ApplicationWindow):
         if response == Gtk.ResponseType.OK:
             destination_path = dialog.get_filename()
             try:
-                shutil.copy(DB_NAME, destination_path)
+                self.settings.flush()
+                core.backup_database(destination_path)
                 success_text = _("Backup Successful!\nFile saved to:\n{path}").format(path=destination_path)
                 success_dialog = Gtk.MessageDialog(transient_for=self, modal=True, message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.OK, text=success_text)
                 success_dialog.run()
@@ -1767,7 +2383,9 @@ class NoteApplication(Gtk.ApplicationWindow):
             if response == Gtk.ResponseType.OK:
                 backup_path = dialog.get_filename()
                 try:
-                    shutil.copy(backup_path, DB_NAME)
+                    self.settings.discard_pending()
+                    self.stop_maintenance()
+                    core.restore_database(backup_path)
                     success_dialog = Gtk.MessageDialog(transient_for=self, modal=True, message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.OK, text=_("Restore Successful!"), secondary_text=_("Please restart the application for the changes to take effect."))
                     success_dialog.run()
                     success_dialog.destroy()
@@ -1782,15 +2400,35 @@ class NoteApplication(Gtk.ApplicationWindow):
     def on_font_select_clicked(self, widget):
         self.popover.hide()
         dialog = Gtk.FontChooserDialog(title=_("Select Font"), transient_for=self, modal=True)
-        dialog.set_font(self.current_font_description)
+        dialog.set_font(self.settings['font_description'])
         if dialog.run() == Gtk.ResponseType.OK:
             new_font_description = dialog.get_font()
             if new_font_description:
-                self.current_font_description = new_font_description
-                self.save_setting_db('font_description', new_font_description)
-                self._load_css()
+                self.settings.set('font_description', new_font_description)
         dialog.destroy()
 
+    def run_refresh_cycle(self):
+        # One synthetic pass over every view that rebuilds its widgets, plus an
+        # alarm popup opened and closed; driven by the leak check.
+        self.refresh_notes_list()
+        self.refresh_fixed_notes_list()
+        self.refresh_location_combo()
+        self._update_weather_ui(self.weather_service.cached(self.active_location_id))
+        self.refresh_open_popups()
+        alarm_window = self.show_alarm_popup({'id': 'leak-check', 'title': _("Leak check"), 'content': ''},
+                                             {'sound': None, 'volume': 0, 'duration': 10})
+        alarm_window.close()
+
+    def run_leak_check(self):
+        self.weekly_view_popup(None)
+        self.monthly_view_popup(None)
+        targets = {"main window": self, "calendar": self.calendar, "notes list": self.notes_listbox,
+                   "location combo": self.combo_location, "sound player": self.sound_player,
+                   "sound bus": self.sound_player.get_bus()}
+        leakcheck.run(self.run_refresh_cycle, targets)
+        self.cleanup_and_quit()
+        return False
+
     def cleanup_and_quit(self, *args):
         if hasattr(self, 'indicator_icon_path') and os.path.exists(self.indicator_icon_path):
             try:
@@ -1798,6 +2436,16 @@ class NoteApplication(Gtk.ApplicationWindow):
             except OSError as e:
                 print(f"Error while deleting temporary file: {e}")
         Notify.uninit()
+        # Maintenance first: it releases the settings held during VACUUM.
+        self.stop_maintenance()
+        if self.last_alarm_minute is not None:
+            self.settings.set('last_alarm_check', self.last_alarm_minute.timestamp())
+        self.settings.flush()
+        self.sound_player.set_state(Gst.State.NULL)
+        self.sound_player.get_bus().remove_signal_watch()
+        self.weather_service.shutdown()
+        if self.gazetteer:
+            self.gazetteer.close()
         
         app = self.get_application()
         if app:
@@ -1805,10 +2453,11 @@ class NoteApplication(Gtk.ApplicationWindow):
 
 class Application(Gtk.Application):
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, application_id="com.github.kullaniciadi.dailynote",
+        super().__init__(*args, application_id=remote.APPLICATION_ID,
                          flags=Gio.ApplicationFlags.FLAGS_NONE, **kwargs)
         self.window = None
         self.is_startup_launch = '--startup' in sys.argv
+        self.notes_service = remote.NotesService(on_changed=self.on_remote_notes_changed)
         
         self.add_main_option(
             "startup",
@@ -1819,21 +2468,80 @@ class Application(Gtk.Application):
             None
         )
 
+    def do_startup(self):
+        Gtk.Application.do_startup(self)
+        actions = [
+            ("show", None, self.on_show_action),
+            ("add-note", GLib.VariantType.new("(sss)"), self.on_add_note_action),
+            ("set-alarm", GLib.VariantType.new("(xs)"), self.on_set_alarm_action),
+            ("refresh", None, lambda action, param: self.on_remote_notes_changed()),
+        ]
+        for name, param_type, callback in actions:
+            action = Gio.SimpleAction.new(name, param_type)
+            action.connect("activate", callback)
+            self.add_action(action)
+
+    def do_dbus_register(self, connection, object_path):
+        Gtk.Application.do_dbus_register(self, connection, object_path)
+        self.notes_service.register(connection, object_path)
+        return True
+
+    def do_dbus_unregister(self, connection, object_path):
+        self.notes_service.unregister(connection)
+        Gtk.Application.do_dbus_unregister(self, connection, object_path)
+
+    def on_show_action(self, action, param):
+        if self.window:
+            self.window.on_show_application(None)
+
+    def on_add_note_action(self, action, param):
+        title, content, date_str = param.unpack()
+        try:
+            core.add_notes([{'title': title, 'content': content, 'date': date_str}])
+        except ValueError as e:
+            print(f"Ignoring remote add-note: {e}")
+            return
+        self.on_remote_notes_changed()
+
+    def on_set_alarm_action(self, action, param):
+        note_id, time_str = param.unpack()
+        try:
+            core.set_alarms([{'note_id': note_id, 'time': time_str}])
+        except ValueError as e:
+            print(f"Ignoring remote set-alarm: {e}")
+            return
+        self.on_remote_notes_changed()
+
+    def on_remote_notes_changed(self):
+        if self.window:
+            self.window.reload_notes_from_db()
+
     def do_activate(self):
         if not self.window:
             self.window = NoteApplication(self)
 
         if self.is_startup_launch:
             self.is_startup_launch = False
+            self.window.schedule_ui_release()
             return
 
-        self.window.show_all()
-        self.window.present()
+        self.window.on_show_application(None)
+        if leakcheck.requested_cycles:
+            GLib.idle_add(self.window.run_leak_check)
 
     def do_shutdown(self):
         Gtk.Application.do_shutdown(self)
 
-if __name__ == '__main__':
+def main():
+    trace.enable_from_env()
+    trace.enable_from_argv(sys.argv)
+    watchdog.enable_from_env()
+    watchdog.enable_from_argv(sys.argv)
+    leakcheck.enable_from_env()
+    leakcheck.enable_from_argv(sys.argv)
     app = Application()
-    exit_status = app.run(sys.argv)
-    sys.exit(exit_status)
+    status = app.run(sys.argv)
+    return 1 if leakcheck.failed else status
+
+if __name__ == '__main__':
+    sys.exit(main())
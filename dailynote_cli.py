@@ -0,0 +1,129 @@
+import sys
+import argparse
+from datetime import datetime
+
+import dailynote_core as core
+import dailynote_trace as trace
+import dailynote_maintenance as maintenance
+from dailynote_core import _
+
+COMMANDS = ("today", "add", "search", "next-alarm", "maintenance", "compression")
+
+
+def format_note(note, alarms, show_date=False):
+    text = note['title']
+    alarm_info = alarms.get(note['id'])
+    if alarm_info:
+        text += f" ({alarm_info.get('time')})"
+    if show_date:
+        text = f"{note['date']}  {text}"
+    return text
+
+
+def cmd_today(args):
+    day = datetime.strptime(args.date, "%Y-%m-%d") if args.date else datetime.now()
+    notes = core.load_notes_for_date(day.strftime("%Y-%m-%d"))
+    alarms = core.load_all_alarms() if notes else {}
+    for note in notes:
+        print(format_note(note, alarms))
+    for note in core.occurrence_index.on(day.date()):
+        event_time = note.get('event_time')
+        print(f"{note['title']} ({event_time})" if event_time else note['title'])
+    return 0
+
+
+def cmd_add(args):
+    date_str = args.date or datetime.now().strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        print(_("Invalid date: {date}").format(date=date_str), file=sys.stderr)
+        return 2
+    if args.alarm and core.parse_time_of_day(args.alarm) is None:
+        print(_("Invalid time: {time}").format(time=args.alarm), file=sys.stderr)
+        return 2
+    note = core.save_note({'title': args.title, 'content': args.content or '', 'date': date_str})
+    if args.alarm:
+        core.save_alarm(note['id'], "", 50, 10, args.alarm)
+    print(note['id'])
+    return 0
+
+
+def cmd_search(args):
+    notes = core.search_notes(args.text, include_archive=args.archive)
+    alarms = core.load_all_alarms() if notes else {}
+    for note in notes:
+        print(format_note(note, alarms, show_date=True))
+    return 0 if notes else 1
+
+
+def cmd_next_alarm(args):
+    alarm = core.next_alarm()
+    if not alarm:
+        return 1
+    reminder = _(" (reminder, {minutes} min before)").format(minutes=alarm['lead_minutes']) if alarm['lead_minutes'] else ""
+    print(f"{alarm['when'].strftime('%Y-%m-%d %H:%M')}  {alarm['title']}{reminder}")
+    return 0
+
+
+def cmd_maintenance(args):
+    run = maintenance.MaintenanceRun()
+    run.run_all()
+    print(run.summary())
+    return 0 if run.ok() else 1
+
+
+def cmd_compression(args):
+    report = core.compression_report()
+    print(_("{notes} notes stored compressed: {plain} KiB of text in {stored} KiB, {saved} KiB saved.").format(
+        notes=report['notes'], plain=report['plain'] // 1024, stored=report['stored'] // 1024,
+        saved=(report['plain'] - report['stored']) // 1024))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog=core.APP_NAME, description=_("Query and add DailyNote notes without starting the GUI."))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_today = subparsers.add_parser("today", help=_("List the notes and reminders for today"))
+    p_today.add_argument("--date", help=_("Show another day instead (YYYY-MM-DD)"))
+    p_today.set_defaults(func=cmd_today)
+
+    p_add = subparsers.add_parser("add", help=_("Add a new daily note"))
+    p_add.add_argument("title")
+    p_add.add_argument("content", nargs="?")
+    p_add.add_argument("--date", help=_("Date of the note (YYYY-MM-DD), defaults to today"))
+    p_add.add_argument("--alarm", metavar="HH:MM", help=_("Also set an alarm for the note"))
+    p_add.set_defaults(func=cmd_add)
+
+    p_search = subparsers.add_parser("search", help=_("Search note titles and contents"))
+    p_search.add_argument("text")
+    p_search.add_argument("--archive", action="store_true", help=_("Also search the archived notes"))
+    p_search.set_defaults(func=cmd_search)
+
+    p_next = subparsers.add_parser("next-alarm", help=_("Print the next alarm or reminder that will ring"))
+    p_next.set_defaults(func=cmd_next_alarm)
+
+    p_maintenance = subparsers.add_parser("maintenance", help=_("Optimize, compact and check the database now"))
+    p_maintenance.set_defaults(func=cmd_maintenance)
+
+    p_compression = subparsers.add_parser("compression", help=_("Report the space saved by compressing large notes"))
+    p_compression.set_defaults(func=cmd_compression)
+    return parser
+
+
+def main(argv=None):
+    trace.enable_from_env()
+    trace.enable_from_argv(sys.argv)
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS + ("-h", "--help"):
+        # Anything that is not a CLI command (including --startup) starts the GUI.
+        import DailyNote
+        return DailyNote.main()
+    args = build_parser().parse_args(argv)
+    core.setup_database()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
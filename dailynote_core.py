@@ -0,0 +1,1093 @@
+import os
+import zlib
+import heapq
+import itertools
+import sqlite3
+import gettext
+import locale
+from datetime import datetime, timedelta
+from collections import OrderedDict
+
+import dailynote_trace as trace
+import dailynote_recurrence as recurrence
+import dailynote_history as history
+
+APP_NAME = "dailynote"
+HOME = os.path.expanduser("~")
+
+installed_dir = os.path.join(HOME, '.local', 'share', APP_NAME)
+is_installed = os.path.abspath(os.path.dirname(__file__)) == installed_dir
+
+if is_installed:
+    BASE_DIR = installed_dir
+    LOCALE_DIR = os.path.join(HOME, '.local', 'share', 'locale')
+    DB_NAME = os.path.join(BASE_DIR, "notes.db") # Keep DB with other app data
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    LOCALE_DIR = os.path.join(BASE_DIR, "locale")
+    DB_NAME = os.path.join(BASE_DIR, "notes.db")
+
+DB_NAME = os.environ.get("DAILYNOTE_DB", DB_NAME)
+# Notes older than the archive horizon are moved here; the file is only
+# attached for archived months and for searches that include the archive.
+ARCHIVE_DB_NAME = os.environ.get("DAILYNOTE_ARCHIVE_DB", os.path.join(os.path.dirname(DB_NAME), "notes_archive.db"))
+ICONS_DIR = os.path.join(BASE_DIR, "icons")
+ALARMS_DIR = os.path.join(BASE_DIR, "alarms")
+os.makedirs(os.path.dirname(DB_NAME), exist_ok=True)
+
+try:
+    locale.setlocale(locale.LC_ALL, '')
+except locale.Error:
+    print("Locale could not be set. Using default C locale.")
+
+if hasattr(locale, "bindtextdomain"):
+    locale.bindtextdomain(APP_NAME, LOCALE_DIR)
+    locale.bind_textdomain_codeset(APP_NAME, "UTF-8")
+gettext.bindtextdomain(APP_NAME, LOCALE_DIR)
+gettext.textdomain(APP_NAME)
+_ = gettext.gettext
+
+# How far ahead the next occurrence of a fixed note is looked for; four years so a
+# yearly reminder on February 29 is always found.
+RECURRENCE_HORIZON_DAYS = 4 * 366
+
+# How far back missed_alarms() looks after the application was closed or the
+# machine slept; older alarms are not worth reporting.
+MISSED_ALARM_WINDOW = timedelta(days=7)
+
+# Note bodies of at least this many UTF-8 bytes (pasted logs, long meeting
+# notes) are stored zlib-compressed in notes.content_z with content NULL;
+# a non-NULL content_z is the flag. Shorter bodies stay plain text.
+COMPRESS_THRESHOLD = 4096
+
+
+def connect():
+    if trace.enabled:
+        return sqlite3.connect(DB_NAME, factory=trace.TracedConnection)
+    return sqlite3.connect(DB_NAME)
+
+
+def setup_database():
+    conn = connect()
+    cursor = conn.cursor()
+    # Applies to new databases; existing ones are switched over by the
+    # first maintenance run (dailynote_maintenance), which needs a VACUUM.
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT,
+        date TEXT NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_date ON notes(date)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alarms (
+        note_id INTEGER PRIMARY KEY,
+        sound TEXT,
+        volume INTEGER,
+        duration INTEGER,
+        time TEXT,
+        FOREIGN KEY(note_id) REFERENCES notes(id)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS fixed_notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT,
+        event_time TEXT,
+        alarm_enabled INTEGER NOT NULL DEFAULT 0,
+        alarm_days TEXT,
+        sound TEXT,
+        volume INTEGER,
+        repeat_type TEXT DEFAULT 'weekly',
+        repeat_day INTEGER,
+        repeat_month INTEGER
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS locations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        latitude TEXT NOT NULL,
+        longitude TEXT NOT NULL
+    )
+    """)
+    # The single location used to live in the settings table.
+    if cursor.execute("SELECT COUNT(*) FROM locations").fetchone()[0] == 0:
+        old = dict(cursor.execute("SELECT key, value FROM settings WHERE key IN ('latitude', 'longitude', 'location_name')").fetchall())
+        if old.get('latitude') and old.get('longitude'):
+            cursor.execute("INSERT INTO locations (name, latitude, longitude) VALUES (?, ?, ?)",
+                           (old.get('location_name'), old['latitude'], old['longitude']))
+            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('active_location_id', ?)", (str(cursor.lastrowid),))
+
+    # Alarms are absolute instants. alarms.time is kept as the wall-clock
+    # time shown next to the note; fires_at (epoch seconds) is what rings, so
+    # a snooze past midnight moves to the next day. lead_minutes lists extra
+    # reminders before it, e.g. "15,60".
+    alarm_columns = {row[1] for row in cursor.execute("PRAGMA table_info(alarms)")}
+    migrate_alarms = 'fires_at' not in alarm_columns
+    if migrate_alarms:
+        cursor.execute("ALTER TABLE alarms ADD COLUMN fires_at INTEGER")
+        cursor.execute("ALTER TABLE alarms ADD COLUMN lead_minutes TEXT")
+        rows = cursor.execute("SELECT a.note_id, n.date, a.time FROM alarms a JOIN notes n ON n.id = a.note_id").fetchall()
+        cursor.executemany("UPDATE alarms SET fires_at=? WHERE note_id=?",
+                           [(_alarm_epoch(date_str, time_str), note_id) for note_id, date_str, time_str in rows])
+    # Every pending instant (alarms, their lead reminders and the next
+    # occurrence of each fixed-note alarm) in one table clustered by time,
+    # so the next due item is the first row of an index range.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alarm_triggers (
+        fires_at INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        source_id INTEGER NOT NULL,
+        lead_minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (fires_at, source, source_id, lead_minutes)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alarm_triggers_source ON alarm_triggers(source, source_id)")
+    if migrate_alarms:
+        for note_id, fires_at, lead_text in cursor.execute("SELECT note_id, fires_at, lead_minutes FROM alarms").fetchall():
+            _arm_note_alarm(cursor, note_id, fires_at, parse_lead_minutes(lead_text))
+        now = datetime.now()
+        for row in cursor.execute(f"SELECT {FIXED_NOTE_COLUMNS} FROM fixed_notes WHERE alarm_enabled=1").fetchall():
+            _arm_fixed_note(cursor, _fixed_note_from_row(row), now)
+
+    note_columns = {row[1] for row in cursor.execute("PRAGMA table_info(notes)")}
+    if 'content_z' not in note_columns:
+        cursor.execute("ALTER TABLE notes ADD COLUMN content_z BLOB")
+        count, saved = _compress_large_contents(conn, "main")
+        if count:
+            print(f"Compressed {count} large notes, saving {saved / 1024:.0f} KiB.")
+
+    # Earlier versions of daily notes; see dailynote_history for the format.
+    history.create_table(cursor)
+
+    # Last good met.no response per location, so the weather panel can be
+    # drawn before the network answers.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS weather_cache (
+        location_id INTEGER PRIMARY KEY,
+        fetched_at REAL NOT NULL,
+        expires_at REAL,
+        last_modified TEXT,
+        data TEXT NOT NULL
+    )
+    """)
+
+    conn.commit()
+    conn.close()
+
+
+FIXED_NOTE_COLUMNS = "id, title, content, alarm_enabled, event_time, alarm_days, repeat_type, repeat_day, repeat_month"
+
+
+def _fixed_note_from_row(r):
+    return {'id': r[0], 'title': r[1], 'content': r[2], 'alarm_enabled': r[3], 'event_time': r[4],
+            'alarm_days': r[5], 'repeat_type': r[6], 'repeat_day': r[7], 'repeat_month': r[8]}
+
+
+def _pack_content(content):
+    # (content, content_z) column values for a note body.
+    data = (content or '').encode('utf-8')
+    if len(data) >= COMPRESS_THRESHOLD:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return None, packed
+    return content, None
+
+
+def _unpack_content(content, packed):
+    if packed is not None:
+        return zlib.decompress(packed).decode('utf-8')
+    return content or ''
+
+
+def _compress_large_contents(conn, schema):
+    # One-time migration of the bodies stored before content_z existed.
+    # Returns (notes compressed, bytes saved); the freed pages go back to
+    # the file system with the next maintenance run.
+    rows = conn.execute(f"""SELECT id, content FROM {schema}.notes
+                            WHERE content_z IS NULL AND length(CAST(content AS BLOB)) >= ?""", (COMPRESS_THRESHOLD,)).fetchall()
+    count = saved = 0
+    for note_id, content in rows:
+        _plain, packed = _pack_content(content)
+        if packed is None:
+            continue
+        conn.execute(f"UPDATE {schema}.notes SET content=NULL, content_z=? WHERE id=?", (packed, note_id))
+        count += 1
+        saved += len(content.encode('utf-8')) - len(packed)
+    return count, saved
+
+
+class NoteRecord:
+    # Metadata of a daily note. The body is only read from the database when
+    # it is first needed, so the in-memory note list scales with the number
+    # of notes rather than with the amount of text in them. Item access
+    # (note['title'], note.get('content')) keeps working like the dicts that
+    # used to be passed around.
+    __slots__ = ('id', 'title', 'date', '_content')
+    FIELDS = ('id', 'title', 'date', 'content')
+
+    def __init__(self, id=None, title='', date='', content=None):
+        self.id = id
+        self.title = title
+        self.date = date
+        self._content = content
+
+    @property
+    def content(self):
+        if self._content is not None or self.id is None:
+            return self._content
+        return load_note_content(self.id)
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __repr__(self):
+        return f"NoteRecord(id={self.id!r}, title={self.title!r}, date={self.date!r})"
+
+
+class ContentCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, note_id):
+        content = self.entries.get(note_id)
+        if content is not None:
+            self.entries.move_to_end(note_id)
+        return content
+
+    def put(self, note_id, content):
+        self.entries[note_id] = content
+        self.entries.move_to_end(note_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, note_id):
+        self.entries.pop(note_id, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+content_cache = ContentCache()
+
+
+def load_note_content(note_id):
+    content = content_cache.get(note_id)
+    if content is not None:
+        return content
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT content, content_z FROM notes WHERE id=?", (note_id,))
+    row = cursor.fetchone()
+    conn.close()
+    content = _unpack_content(*row) if row else ''
+    content_cache.put(note_id, content)
+    return content
+
+
+def load_notes():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, title, date FROM notes")
+    notes = [NoteRecord(r[0], r[1], r[2]) for r in cursor.fetchall()]
+    conn.close()
+    return notes
+
+
+def load_notes_for_date(date_str):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, title, date FROM notes WHERE date=? ORDER BY id", (date_str,))
+    notes = [NoteRecord(r[0], r[1], r[2]) for r in cursor.fetchall()]
+    conn.close()
+    return notes
+
+
+def iter_notes_from(date_str, page_size=100):
+    # Dated notes on or after date_str with their alarm time, ordered by
+    # (date, id). Each page continues from the last row seen through the date
+    # index, so every page costs the same however many notes there are.
+    last_date, last_id = date_str, -1
+    while True:
+        conn = connect()
+        cursor = conn.cursor()
+        cursor.execute("""SELECT n.id, n.title, n.date, a.time FROM notes n LEFT JOIN alarms a ON a.note_id = n.id
+                          WHERE n.date >= ? AND (n.date > ? OR n.id > ?) ORDER BY n.date, n.id LIMIT ?""",
+                       (last_date, last_date, last_id, page_size))
+        rows = cursor.fetchall()
+        conn.close()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id, last_date = rows[-1][0], rows[-1][2]
+
+
+def iter_agenda(start):
+    # Everything from the date start on, merged lazily in (date, time, title)
+    # order: dated notes (time is their alarm, if any) and the expanded
+    # fixed-note occurrences. Items are dicts with kind 'note' or 'fixed'.
+    def notes():
+        # The pages come in (date, id) order; heapq.merge needs the merge
+        # key order, so each day's notes are sorted before they are yielded.
+        for date_str, rows in itertools.groupby(iter_notes_from(start.isoformat()), key=lambda row: row[2]):
+            try:
+                day = datetime.strptime(date_str, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            items = [{'kind': 'note', 'id': note_id, 'date': day, 'time': alarm_time or '', 'title': title, 'alarm': bool(alarm_time)}
+                     for note_id, title, _date, alarm_time in rows]
+            items.sort(key=lambda item: (item['time'], item['title']))
+            yield from items
+
+    def occurrences():
+        horizon = start + timedelta(days=RECURRENCE_HORIZON_DAYS)
+        for day, note in occurrence_index.between(start, horizon):
+            yield {'kind': 'fixed', 'id': note['id'], 'date': day, 'time': note.get('event_time') or '', 'title': note['title'],
+                   'alarm': note.get('alarm_enabled') == 1 and bool(note.get('event_time'))}
+
+    return heapq.merge(notes(), occurrences(), key=lambda item: (item['date'], item['time'], item['title']))
+
+
+def _connect_for_search():
+    conn = connect()
+    conn.create_function("py_lower", 1, lambda text: text.lower() if text else '', deterministic=True)
+    # Compressed bodies are only inflated for the rows whose title did not
+    # already match.
+    conn.create_function("note_text", 2, _unpack_content, deterministic=True)
+    return conn
+
+
+def search_note_ids(text):
+    # Same case folding as str.lower() so non-ASCII titles match like they
+    # do in the UI; LIKE would only fold ASCII.
+    needle = text.lower()
+    conn = _connect_for_search()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM notes WHERE instr(py_lower(title), ?) > 0 OR instr(py_lower(note_text(content, content_z)), ?) > 0",
+                   (needle, needle))
+    ids = {r[0] for r in cursor.fetchall()}
+    conn.close()
+    return ids
+
+
+def search_notes(text, include_archive=False):
+    needle = text.lower()
+    conn = _connect_for_search()
+    cursor = conn.cursor()
+    cursor.execute("""SELECT id, title, date FROM notes
+                      WHERE instr(py_lower(title), ?) > 0 OR instr(py_lower(note_text(content, content_z)), ?) > 0
+                      ORDER BY date, id""", (needle, needle))
+    notes = [NoteRecord(r[0], r[1], r[2]) for r in cursor.fetchall()]
+    conn.close()
+    if include_archive:
+        notes = search_archived_notes(text) + notes
+    return notes
+
+
+def _attach_archive(conn):
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_NAME,))
+    conn.execute("""CREATE TABLE IF NOT EXISTS archive.notes (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        content TEXT,
+        date TEXT NOT NULL,
+        content_z BLOB
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_notes_date ON notes(date)")
+    # Archived notes keep their history with them.
+    history.create_table(conn, "archive")
+    if 'content_z' not in {row[1] for row in conn.execute("PRAGMA archive.table_info(notes)")}:
+        with conn:
+            conn.execute("ALTER TABLE archive.notes ADD COLUMN content_z BLOB")
+            _compress_large_contents(conn, "archive")
+
+
+def archive_boundary():
+    # Notes dated before this day (YYYY-MM-DD) may be in the archive; None
+    # if nothing was ever archived.
+    conn = connect()
+    row = conn.execute("SELECT value FROM settings WHERE key='archived_before'").fetchone()
+    conn.close()
+    return row[0] if row and os.path.exists(ARCHIVE_DB_NAME) else None
+
+
+def archive_notes(before_date):
+    # Moves the notes dated before before_date, whose alarms have all rung,
+    # into the archive in one transaction. The archive is only attached if
+    # there is something to move. Returns the number of notes moved.
+    now = int(datetime.now().timestamp())
+    pending = "SELECT note_id FROM alarms WHERE fires_at >= ?"
+    conn = connect()
+    try:
+        count = conn.execute(f"SELECT COUNT(*) FROM notes WHERE date < ? AND id NOT IN ({pending})", (before_date, now)).fetchone()[0]
+        if count == 0:
+            return 0
+        _attach_archive(conn)
+        with conn:
+            conn.execute(f"CREATE TEMP TABLE archiving AS SELECT id FROM main.notes WHERE date < ? AND id NOT IN ({pending})", (before_date, now))
+            conn.execute("""INSERT OR REPLACE INTO archive.notes (id, title, content, content_z, date)
+                            SELECT id, title, content, content_z, date FROM main.notes WHERE id IN (SELECT id FROM temp.archiving)""")
+            history.move(conn, "main", "archive", "SELECT id FROM temp.archiving")
+            conn.execute("DELETE FROM alarm_triggers WHERE source='note' AND source_id IN (SELECT id FROM temp.archiving)")
+            conn.execute("DELETE FROM alarms WHERE note_id IN (SELECT id FROM temp.archiving)")
+            conn.execute("DELETE FROM main.notes WHERE id IN (SELECT id FROM temp.archiving)")
+            conn.execute("""INSERT INTO settings (key, value) VALUES ('archived_before', ?)
+                            ON CONFLICT(key) DO UPDATE SET value=max(value, excluded.value)""", (before_date,))
+            conn.execute("DROP TABLE temp.archiving")
+    finally:
+        conn.close()
+    content_cache.clear()
+    return count
+
+
+# A backup is one file: a copy of notes.db with the archived notes and
+# their history in these extra tables, which restore_database moves back
+# into the archive.
+BACKUP_ARCHIVE_TABLE = "backup_archived_notes"
+BACKUP_ARCHIVE_REVISIONS_TABLE = "backup_archived_revisions"
+
+
+def backup_database(destination):
+    source = connect()
+    target = sqlite3.connect(destination)
+    try:
+        source.backup(target)
+        if os.path.exists(ARCHIVE_DB_NAME):
+            _attach_archive(target)
+            with target:
+                target.execute(f"DROP TABLE IF EXISTS main.{BACKUP_ARCHIVE_TABLE}")
+                target.execute(f"""CREATE TABLE main.{BACKUP_ARCHIVE_TABLE} AS
+                                  SELECT id, title, content, content_z, date FROM archive.notes""")
+                target.execute(f"DROP TABLE IF EXISTS main.{BACKUP_ARCHIVE_REVISIONS_TABLE}")
+                target.execute(f"CREATE TABLE main.{BACKUP_ARCHIVE_REVISIONS_TABLE} AS SELECT * FROM archive.note_revisions")
+            target.execute("DETACH DATABASE archive")
+    finally:
+        target.close()
+        source.close()
+
+
+def restore_database(source_path):
+    # Replaces notes.db and the archive with a backup. Backups taken before
+    # they carried the archive restore without one.
+    source = sqlite3.connect(source_path)
+    conn = connect()
+    try:
+        source.backup(conn)
+        if os.path.exists(ARCHIVE_DB_NAME):
+            os.remove(ARCHIVE_DB_NAME)
+        with conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (BACKUP_ARCHIVE_TABLE,)).fetchone():
+                _attach_archive(conn)
+                conn.execute(f"""INSERT INTO archive.notes (id, title, content, content_z, date)
+                                SELECT id, title, content, content_z, date FROM main.{BACKUP_ARCHIVE_TABLE}""")
+                conn.execute(f"DROP TABLE main.{BACKUP_ARCHIVE_TABLE}")
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (BACKUP_ARCHIVE_REVISIONS_TABLE,)).fetchone():
+                    conn.execute(f"INSERT INTO archive.note_revisions SELECT * FROM main.{BACKUP_ARCHIVE_REVISIONS_TABLE}")
+                    conn.execute(f"DROP TABLE main.{BACKUP_ARCHIVE_REVISIONS_TABLE}")
+            else:
+                conn.execute("DELETE FROM settings WHERE key='archived_before'")
+    finally:
+        conn.close()
+        source.close()
+    content_cache.clear()
+
+
+def load_archived_notes(from_date, to_date):
+    # Archived notes dated from_date..to_date, with their content, which is
+    # not in the hot database's cache.
+    if not os.path.exists(ARCHIVE_DB_NAME):
+        return []
+    conn = connect()
+    try:
+        _attach_archive(conn)
+        rows = conn.execute("SELECT id, title, date, content, content_z FROM archive.notes WHERE date BETWEEN ? AND ? ORDER BY date, id",
+                            (from_date, to_date)).fetchall()
+    finally:
+        conn.close()
+    return [NoteRecord(r[0], r[1], r[2], _unpack_content(r[3], r[4])) for r in rows]
+
+
+def search_archived_notes(text):
+    if not os.path.exists(ARCHIVE_DB_NAME):
+        return []
+    needle = text.lower()
+    conn = _connect_for_search()
+    try:
+        _attach_archive(conn)
+        rows = conn.execute("""SELECT id, title, date, content, content_z FROM archive.notes
+                               WHERE instr(py_lower(title), ?) > 0 OR instr(py_lower(note_text(content, content_z)), ?) > 0
+                               ORDER BY date, id""", (needle, needle)).fetchall()
+    finally:
+        conn.close()
+    return [NoteRecord(r[0], r[1], r[2], _unpack_content(r[3], r[4])) for r in rows]
+
+
+def _save_archived_note(conn, note):
+    # An archived note moved on or after the boundary goes back to the hot
+    # database under the same id.
+    _attach_archive(conn)
+    boundary = conn.execute("SELECT value FROM settings WHERE key='archived_before'").fetchone()
+    content, packed = _pack_content(note['content'])
+    with conn:
+        old = conn.execute("SELECT title, content, content_z FROM archive.notes WHERE id=?", (note['id'],)).fetchone()
+        if old:
+            history.record(conn.cursor(), note['id'], (old[0], _unpack_content(old[1], old[2])),
+                           (note['title'], note['content']), datetime.now().timestamp(), schema="archive")
+        if boundary and note['date'] >= boundary[0]:
+            if conn.execute("DELETE FROM archive.notes WHERE id=?", (note['id'],)).rowcount:
+                conn.execute("INSERT INTO main.notes (id, title, content, content_z, date) VALUES (?, ?, ?, ?, ?)",
+                             (note['id'], note['title'], content, packed, note['date']))
+                history.move(conn, "archive", "main", "SELECT ?", (note['id'],))
+        else:
+            conn.execute("UPDATE archive.notes SET title=?, content=?, content_z=?, date=? WHERE id=?",
+                         (note['title'], content, packed, note['date'], note['id']))
+
+
+def load_fixed_notes():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {FIXED_NOTE_COLUMNS} FROM fixed_notes ORDER BY id")
+    fixed_notes = [_fixed_note_from_row(r) for r in cursor.fetchall()]
+    conn.close()
+    return fixed_notes
+
+
+# Expanded occurrences of the fixed notes; every write to fixed_notes below
+# invalidates it.
+occurrence_index = recurrence.OccurrenceIndex(load_fixed_notes)
+
+
+def parse_lead_minutes(text):
+    leads = set()
+    for token in (text or '').split(','):
+        if token.strip().isdigit() and int(token) > 0:
+            leads.add(int(token))
+    return sorted(leads)
+
+
+def format_lead_minutes(leads):
+    return ",".join(str(lead) for lead in sorted(set(leads)))
+
+
+def _alarm_epoch(date_str, time_str):
+    hm = parse_time_of_day(time_str)
+    try:
+        day = datetime.strptime(date_str or '', "%Y-%m-%d")
+    except ValueError:
+        return None
+    return int(day.replace(hour=hm[0], minute=hm[1]).timestamp()) if hm else None
+
+
+def _arm_note_alarm(cursor, note_id, fires_at, leads=()):
+    cursor.execute("DELETE FROM alarm_triggers WHERE source='note' AND source_id=?", (note_id,))
+    if fires_at is not None:
+        cursor.executemany("INSERT OR IGNORE INTO alarm_triggers (fires_at, source, source_id, lead_minutes) VALUES (?, 'note', ?, ?)",
+                           [(fires_at - lead * 60, note_id, lead) for lead in (0, *leads)])
+
+
+def _arm_fixed_note(cursor, note, after):
+    # Only the next occurrence at or after `after` is kept in the table; it
+    # is replaced by the following one once it has passed.
+    cursor.execute("DELETE FROM alarm_triggers WHERE source='fixed' AND source_id=?", (note['id'],))
+    when = next_fixed_occurrence(note, after) if note.get('alarm_enabled') == 1 else None
+    if when:
+        cursor.execute("INSERT INTO alarm_triggers (fires_at, source, source_id, lead_minutes) VALUES (?, 'fixed', ?, 0)",
+                       (int(when.timestamp()), note['id']))
+
+
+def _rearm_passed_fixed_notes(cursor, until):
+    # until is epoch seconds; occurrences at or before it are spent.
+    after = datetime.fromtimestamp(until + 1)
+    rows = cursor.execute(f"""SELECT {FIXED_NOTE_COLUMNS} FROM fixed_notes WHERE id IN
+                              (SELECT source_id FROM alarm_triggers WHERE source='fixed' AND fires_at <= ?)""", (until,)).fetchall()
+    for row in rows:
+        _arm_fixed_note(cursor, _fixed_note_from_row(row), after)
+
+
+def _alarm_from_row(r):
+    return {'sound': r[0], 'volume': r[1], 'duration': r[2], 'time': r[3],
+            'when': datetime.fromtimestamp(r[4]) if r[4] is not None else None, 'lead_minutes': parse_lead_minutes(r[5])}
+
+
+def load_all_alarms():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT note_id, sound, volume, duration, time, fires_at, lead_minutes FROM alarms")
+    alarms = {r[0]: _alarm_from_row(r[1:]) for r in cursor.fetchall()}
+    conn.close()
+    return alarms
+
+
+def take_due_alarms(since, until):
+    # Alarms and reminders with since < fires_at <= until (datetimes), oldest
+    # first, and re-arms the fixed notes whose occurrence has passed.
+    conn = connect()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("""SELECT t.fires_at, t.source, t.source_id, t.lead_minutes, COALESCE(n.title, f.title),
+                                     COALESCE(n.content, f.content), n.content_z, a.sound, a.volume, a.duration
+                              FROM alarm_triggers t
+                              LEFT JOIN notes n ON t.source = 'note' AND n.id = t.source_id
+                              LEFT JOIN alarms a ON t.source = 'note' AND a.note_id = t.source_id
+                              LEFT JOIN fixed_notes f ON t.source = 'fixed' AND f.id = t.source_id
+                              WHERE t.fires_at > ? AND t.fires_at <= ? ORDER BY t.fires_at""",
+                           (int(since.timestamp()), int(until.timestamp())))
+            due = [{'id': source_id if source == 'note' else f"fixed_{source_id}", 'title': title or '', 'content': _unpack_content(content, packed),
+                    'when': datetime.fromtimestamp(fires_at + lead * 60), 'lead_minutes': lead,
+                    'sound': sound, 'volume': volume, 'duration': duration}
+                   for fires_at, source, source_id, lead, title, content, packed, sound, volume, duration in cursor.fetchall()]
+            _rearm_passed_fixed_notes(cursor, int(until.timestamp()))
+    finally:
+        conn.close()
+    return due
+
+
+def _insert_note(cursor, note):
+    # Shared by save_note and add_notes so notes created over D-Bus are
+    # stored like the ones typed in the window. A new note has no history;
+    # its first version is recorded when a later save replaces it.
+    content, packed = _pack_content(note.get('content'))
+    cursor.execute("INSERT INTO notes (title, content, content_z, date) VALUES (?, ?, ?, ?)",
+                   (note['title'], content, packed, note['date']))
+    return cursor.lastrowid
+
+
+def save_note(note):
+    conn = connect()
+    cursor = conn.cursor()
+    saved_at = datetime.now().timestamp()
+    if 'id' in note:
+        old = cursor.execute("SELECT date, title, content, content_z FROM notes WHERE id=?", (note['id'],)).fetchone()
+        if old is None and os.path.exists(ARCHIVE_DB_NAME):
+            try:
+                _save_archived_note(conn, note)
+            finally:
+                conn.close()
+            content_cache.discard(note['id'])
+            return note
+        content, packed = _pack_content(note['content'])
+        cursor.execute("UPDATE notes SET title=?, content=?, content_z=?, date=? WHERE id=?",
+                       (note['title'], content, packed, note['date'], note['id']))
+        if old:
+            history.record(cursor, note['id'], (old[1], _unpack_content(old[2], old[3])), (note['title'], note['content']), saved_at)
+        alarm = cursor.execute("SELECT time, lead_minutes FROM alarms WHERE note_id=?", (note['id'],)).fetchone()
+        if alarm and old and old[0] != note['date']:
+            # The alarm keeps its time of day and moves with the note.
+            fires_at = _alarm_epoch(note['date'], alarm[0])
+            cursor.execute("UPDATE alarms SET fires_at=? WHERE note_id=?", (fires_at, note['id']))
+            _arm_note_alarm(cursor, note['id'], fires_at, parse_lead_minutes(alarm[1]))
+    else:
+        note['id'] = _insert_note(cursor, note)
+    conn.commit()
+    conn.close()
+    content_cache.put(note['id'], note['content'] or '')
+    return note
+
+
+def delete_note(note_id):
+    conn = connect()
+    cursor = conn.cursor()
+    archived = cursor.execute("DELETE FROM notes WHERE id=?", (note_id,)).rowcount == 0 and os.path.exists(ARCHIVE_DB_NAME)
+    cursor.execute("DELETE FROM alarms WHERE note_id=?", (note_id,))
+    cursor.execute("DELETE FROM note_revisions WHERE note_id=?", (note_id,))
+    _arm_note_alarm(cursor, note_id, None)
+    conn.commit()
+    if archived:
+        _attach_archive(conn)
+        with conn:
+            conn.execute("DELETE FROM archive.notes WHERE id=?", (note_id,))
+            conn.execute("DELETE FROM archive.note_revisions WHERE note_id=?", (note_id,))
+    conn.close()
+    content_cache.discard(note_id)
+
+
+def _revisions_schema(conn, note_id):
+    # Where a note's history is kept: with the note, in main or the archive.
+    if conn.execute("SELECT 1 FROM notes WHERE id=?", (note_id,)).fetchone() or not os.path.exists(ARCHIVE_DB_NAME):
+        return "main"
+    _attach_archive(conn)
+    return "archive"
+
+
+def load_note_revisions(note_id):
+    # [{'revision', 'saved_at' (datetime, None for the first), 'replaced_at', 'size'}],
+    # newest first; the current version is not among them.
+    conn = connect()
+    rows = history.list_revisions(conn.cursor(), note_id, _revisions_schema(conn, note_id))
+    conn.close()
+    return [{'revision': r[0], 'saved_at': datetime.fromtimestamp(r[1]) if r[1] is not None else None,
+             'replaced_at': datetime.fromtimestamp(r[2]), 'size': r[3]} for r in rows]
+
+
+def load_note_revision(note_id, revision):
+    # (title, content) of one revision, or None.
+    conn = connect()
+    text = history.rebuild(conn.cursor(), note_id, revision, _revisions_schema(conn, note_id))
+    conn.close()
+    return history.split_version(text) if text is not None else None
+
+
+def save_alarm(note_id, sound, volume, duration, time_str, lead_minutes=()):
+    # The alarm rings at time_str on the note's date; lead_minutes are
+    # reminders that many minutes before.
+    conn = connect()
+    cursor = conn.cursor()
+    row = cursor.execute("SELECT date FROM notes WHERE id=?", (note_id,)).fetchone()
+    fires_at = _alarm_epoch(row[0], time_str) if row else None
+    leads = parse_lead_minutes(format_lead_minutes(lead_minutes))
+    cursor.execute("INSERT OR REPLACE INTO alarms (note_id, sound, volume, duration, time, fires_at, lead_minutes) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   (note_id, sound, volume, duration, time_str, fires_at, format_lead_minutes(leads)))
+    _arm_note_alarm(cursor, note_id, fires_at, leads)
+    conn.commit()
+    conn.close()
+
+
+def snooze_alarm(note_id, until):
+    # Moves the alarm to the absolute instant until (a datetime), which may
+    # be on a later day than the note. Lead reminders are not repeated. The
+    # configured time stays, so moving the note later re-arms the alarm at
+    # the time the user chose rather than at the snoozed one.
+    fires_at = int(until.replace(second=0, microsecond=0).timestamp())
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE alarms SET fires_at=? WHERE note_id=?", (fires_at, note_id))
+    if cursor.rowcount:
+        _arm_note_alarm(cursor, note_id, fires_at)
+    conn.commit()
+    conn.close()
+
+
+def load_alarm(note_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT sound, volume, duration, time, fires_at, lead_minutes FROM alarms WHERE note_id=?", (note_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return _alarm_from_row(row) if row else None
+
+
+def delete_alarm(note_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM alarms WHERE note_id=?", (note_id,))
+    _arm_note_alarm(cursor, note_id, None)
+    conn.commit()
+    conn.close()
+
+
+def save_setting(key, value):
+    save_settings({key: value})
+
+
+def save_settings(values):
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", values.items())
+    finally:
+        conn.close()
+
+
+def load_settings():
+    conn = connect()
+    cursor = conn.cursor()
+    settings = {row[0]: row[1] for row in cursor.execute("SELECT key, value FROM settings").fetchall()}
+    conn.close()
+    return settings
+
+
+def save_fixed_note(note_dict):
+    conn = connect()
+    cursor = conn.cursor()
+    if 'id' in note_dict:
+        cursor.execute("""UPDATE fixed_notes SET title=?, content=?, event_time=?, alarm_enabled=?,
+                          alarm_days=?, repeat_type=?, repeat_day=?, repeat_month=? WHERE id=?""",
+                       (note_dict['title'], note_dict['content'], note_dict['event_time'],
+                        note_dict['alarm_enabled'], note_dict['alarm_days'], note_dict['repeat_type'],
+                        note_dict['repeat_day'], note_dict['repeat_month'], note_dict['id']))
+    else:
+        cursor.execute("""INSERT INTO fixed_notes (title, content, event_time, alarm_enabled,
+                                                 alarm_days, repeat_type, repeat_day, repeat_month)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                       (note_dict['title'], note_dict['content'], note_dict['event_time'],
+                        note_dict['alarm_enabled'], note_dict['alarm_days'], note_dict['repeat_type'],
+                        note_dict['repeat_day'], note_dict['repeat_month']))
+        note_dict['id'] = cursor.lastrowid
+    _arm_fixed_note(cursor, note_dict, datetime.now())
+    conn.commit()
+    conn.close()
+    occurrence_index.invalidate()
+    return note_dict
+
+
+def delete_fixed_note(note_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM fixed_notes WHERE id=?", (note_id,))
+    cursor.execute("DELETE FROM alarm_triggers WHERE source='fixed' AND source_id=?", (note_id,))
+    conn.commit()
+    conn.close()
+    occurrence_index.invalidate()
+
+
+def set_fixed_note_alarm_enabled(note_id, enabled):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE fixed_notes SET alarm_enabled=? WHERE id=?", (1 if enabled else 0, note_id))
+    row = cursor.execute(f"SELECT {FIXED_NOTE_COLUMNS} FROM fixed_notes WHERE id=?", (note_id,)).fetchone()
+    if row:
+        _arm_fixed_note(cursor, _fixed_note_from_row(row), datetime.now())
+    conn.commit()
+    conn.close()
+    occurrence_index.invalidate()
+
+
+def fixed_note_occurs_on(note, day):
+    rule = recurrence.compile_rule(note)
+    return rule is not None and rule.occurs_on(day)
+
+
+def parse_time_of_day(time_str):
+    try:
+        parsed = datetime.strptime((time_str or '').strip(), "%H:%M")
+    except ValueError:
+        return None
+    return parsed.hour, parsed.minute
+
+
+def next_fixed_occurrence(note, after):
+    hm = parse_time_of_day(note.get('event_time'))
+    if hm is None:
+        return None
+    rule = recurrence.compile_rule(note)
+    if rule is None:
+        return None
+    start = after.date()
+    for day in rule.occurrences(start, start + timedelta(days=RECURRENCE_HORIZON_DAYS)):
+        candidate = datetime(day.year, day.month, day.day, hm[0], hm[1])
+        if candidate >= after:
+            return candidate
+    return None
+
+
+def upcoming_alarms(now=None, limit=5):
+    # The first rows of alarm_triggers at or after now: alarms, lead
+    # reminders and the next occurrence of each fixed-note alarm.
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    conn = connect()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            _rearm_passed_fixed_notes(cursor, int(now.timestamp()) - 1)
+            rows = cursor.execute("""SELECT t.fires_at, t.source, t.source_id, t.lead_minutes, COALESCE(n.title, f.title)
+                                     FROM alarm_triggers t
+                                     LEFT JOIN notes n ON t.source = 'note' AND n.id = t.source_id
+                                     LEFT JOIN fixed_notes f ON t.source = 'fixed' AND f.id = t.source_id
+                                     WHERE t.fires_at >= ? ORDER BY t.fires_at LIMIT ?""", (int(now.timestamp()), limit)).fetchall()
+    finally:
+        conn.close()
+    return [{'id': source_id if source == 'note' else f"fixed_{source_id}", 'title': title,
+             'when': datetime.fromtimestamp(fires_at), 'lead_minutes': lead}
+            for fires_at, source, source_id, lead, title in rows]
+
+
+def next_alarm(now=None):
+    upcoming = upcoming_alarms(now, limit=1)
+    return upcoming[0] if upcoming else None
+
+
+def missed_alarms(since, until):
+    # Alarms that fell strictly between two evaluated minutes, oldest first:
+    # one range query over the note alarms plus expansion of the compiled
+    # fixed-note rules (only their next occurrence is kept in the table).
+    # Lead reminders are not reported. Gaps longer than MISSED_ALARM_WINDOW
+    # are cut short.
+    since = max(since, until - MISSED_ALARM_WINDOW)
+    if since >= until:
+        return []
+    missed = []
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("""SELECT t.fires_at, n.id, n.title FROM alarm_triggers t JOIN notes n ON n.id = t.source_id
+                      WHERE t.fires_at > ? AND t.fires_at < ? AND t.source = 'note' AND t.lead_minutes = 0""",
+                   (int(since.timestamp()), int(until.timestamp())))
+    for fires_at, note_id, title in cursor.fetchall():
+        missed.append({'id': note_id, 'title': title, 'when': datetime.fromtimestamp(fires_at)})
+    conn.close()
+
+    for rule in occurrence_index.compiled_rules():
+        note = rule.note
+        hm = parse_time_of_day(note.get('event_time'))
+        if note.get('alarm_enabled') != 1 or hm is None:
+            continue
+        for day in rule.occurrences(since.date(), until.date()):
+            when = datetime(day.year, day.month, day.day, hm[0], hm[1])
+            if since < when < until:
+                missed.append({'id': f"fixed_{note['id']}", 'title': note['title'], 'when': when})
+    missed.sort(key=lambda alarm: alarm['when'])
+    return missed
+
+
+def add_notes(notes):
+    for note in notes:
+        datetime.strptime(note['date'], "%Y-%m-%d")
+    conn = connect()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            ids = [_insert_note(cursor, note) for note in notes]
+    finally:
+        conn.close()
+    return ids
+
+
+def set_alarms(alarms):
+    for alarm in alarms:
+        if parse_time_of_day(alarm['time']) is None:
+            raise ValueError(f"Invalid alarm time: {alarm['time']}")
+    note_ids = {alarm['note_id'] for alarm in alarms}
+    conn = connect()
+    try:
+        with conn:
+            placeholders = ",".join("?" * len(note_ids))
+            dates = dict(conn.execute(f"SELECT id, date FROM notes WHERE id IN ({placeholders})", tuple(note_ids))) if note_ids else {}
+            missing = note_ids - dates.keys()
+            if missing:
+                raise ValueError(f"Unknown note ids: {sorted(missing)}")
+            cursor = conn.cursor()
+            for a in alarms:
+                fires_at = _alarm_epoch(dates[a['note_id']], a['time'])
+                cursor.execute("""INSERT OR REPLACE INTO alarms (note_id, sound, volume, duration, time, fires_at, lead_minutes)
+                                  VALUES (?, ?, ?, ?, ?, ?, '')""",
+                               (a['note_id'], a.get('sound') or '', a.get('volume', 50), a.get('duration', 10), a['time'], fires_at))
+                _arm_note_alarm(cursor, a['note_id'], fires_at)
+    finally:
+        conn.close()
+    return len(alarms)
+
+
+def query_range(from_date, to_date):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("""SELECT n.id, n.title, n.content, n.content_z, n.date, a.time FROM notes n LEFT JOIN alarms a ON a.note_id = n.id
+                      WHERE n.date BETWEEN ? AND ? ORDER BY n.date, n.id""", (from_date, to_date))
+    notes = [{'id': r[0], 'title': r[1], 'content': _unpack_content(r[2], r[3]), 'date': r[4], 'alarm_time': r[5]} for r in cursor.fetchall()]
+    conn.close()
+    return notes
+
+
+def compression_report():
+    # {'notes', 'plain', 'stored'}: how many note bodies are stored
+    # compressed, in the hot database and the archive, with their size as
+    # text and as stored, in bytes.
+    report = {'notes': 0, 'plain': 0, 'stored': 0}
+    conn = connect()
+    try:
+        schemas = ["main"]
+        if os.path.exists(ARCHIVE_DB_NAME):
+            _attach_archive(conn)
+            schemas.append("archive")
+        for schema in schemas:
+            for (packed,) in conn.execute(f"SELECT content_z FROM {schema}.notes WHERE content_z IS NOT NULL"):
+                report['notes'] += 1
+                report['plain'] += len(zlib.decompress(packed))
+                report['stored'] += len(packed)
+    finally:
+        conn.close()
+    return report
+
+
+def load_locations():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, latitude, longitude FROM locations ORDER BY id")
+    locations = [{'id': r[0], 'name': r[1], 'latitude': r[2], 'longitude': r[3]} for r in cursor.fetchall()]
+    conn.close()
+    return locations
+
+
+def save_location(location):
+    conn = connect()
+    cursor = conn.cursor()
+    if location.get('id') is not None:
+        cursor.execute("UPDATE locations SET name=?, latitude=?, longitude=? WHERE id=?",
+                       (location['name'], location['latitude'], location['longitude'], location['id']))
+    else:
+        cursor.execute("INSERT INTO locations (name, latitude, longitude) VALUES (?, ?, ?)",
+                       (location['name'], location['latitude'], location['longitude']))
+        location['id'] = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return location
+
+
+def delete_location(location_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM locations WHERE id=?", (location_id,))
+    cursor.execute("DELETE FROM weather_cache WHERE location_id=?", (location_id,))
+    conn.commit()
+    conn.close()
+
+
+def load_weather_cache():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT location_id, fetched_at, expires_at, last_modified, data FROM weather_cache")
+    entries = {r[0]: {'fetched_at': r[1], 'expires_at': r[2], 'last_modified': r[3], 'data': r[4]} for r in cursor.fetchall()}
+    conn.close()
+    return entries
+
+
+def save_weather_cache(location_id, fetched_at, expires_at, last_modified, data=None):
+    # data=None records a "not modified" answer: only the timestamps move.
+    conn = connect()
+    cursor = conn.cursor()
+    if data is None:
+        cursor.execute("UPDATE weather_cache SET fetched_at=?, expires_at=?, last_modified=COALESCE(?, last_modified) WHERE location_id=?",
+                       (fetched_at, expires_at, last_modified, location_id))
+    else:
+        cursor.execute("INSERT OR REPLACE INTO weather_cache (location_id, fetched_at, expires_at, last_modified, data) VALUES (?, ?, ?, ?, ?)",
+                       (location_id, fetched_at, expires_at, last_modified, data))
+    conn.commit()
+    conn.close()
+
+
+def delete_weather_cache(location_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM weather_cache WHERE location_id=?", (location_id,))
+    conn.commit()
+    conn.close()
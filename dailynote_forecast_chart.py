@@ -0,0 +1,177 @@
+import os
+import calendar
+from bisect import bisect_left
+
+import cairo
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, Gdk, GdkPixbuf
+
+import dailynote_trace as trace
+import dailynote_weather as weather
+from dailynote_core import _, ICONS_DIR
+
+PIXELS_PER_HOUR = 9
+CHART_HEIGHT = 300
+MARGIN_LEFT = 40
+MARGIN_RIGHT = 20
+ICON_SIZE = 28
+ICON_STRIP_TOP = 22
+PLOT_TOP = ICON_STRIP_TOP + ICON_SIZE + 12
+PLOT_BOTTOM_MARGIN = 24
+
+_icon_surfaces = {}
+
+
+def icon_surface(symbol, size=ICON_SIZE):
+    # Decoding an SVG is by far the most expensive part of a paint, so each
+    # symbol is rasterised once per process and reused by every chart.
+    key = (symbol, size)
+    if key not in _icon_surfaces:
+        surface = None
+        icon_path = os.path.join(ICONS_DIR, f"{symbol}.svg")
+        if symbol and os.path.exists(icon_path):
+            with trace.span("pixbuf load", "pixbuf", path=os.path.basename(icon_path)):
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(icon_path, size, size)
+            surface = cairo.ImageSurface(cairo.Format.ARGB32, size, size)
+            context = cairo.Context(surface)
+            Gdk.cairo_set_source_pixbuf(context, pixbuf, 0, 0)
+            context.paint()
+        _icon_surfaces[key] = surface
+    return _icon_surfaces[key]
+
+
+def clear_icon_cache():
+    _icon_surfaces.clear()
+
+
+class ForecastChart(Gtk.DrawingArea):
+    # One widget for the whole timeseries: temperature curve, precipitation
+    # bars and an icon strip at the Morning/Noon/Evening/Night samples of each
+    # day. Hovering shows the values of the nearest timestep.
+    def __init__(self, forecast):
+        super().__init__()
+        self.forecast = forecast
+        self.day_names = [_("Monday"), _("Tuesday"), _("Wednesday"), _("Thursday"), _("Friday"), _("Saturday"), _("Sunday")]
+        self.xs = []
+        span_hours = (forecast.times[-1] - forecast.times[0]) / 3600 if len(forecast) > 1 else 1
+        self.set_size_request(int(MARGIN_LEFT + MARGIN_RIGHT + span_hours * PIXELS_PER_HOUR), CHART_HEIGHT)
+        self.set_has_tooltip(True)
+        self.connect("draw", self.on_draw)
+        self.connect("query-tooltip", self.on_query_tooltip)
+        self.connect("size-allocate", lambda widget, allocation: self.compute_layout(allocation.width))
+        temperatures = [t for t in forecast.temperature if t is not None] or [0]
+        self.temp_min, self.temp_max = min(temperatures), max(temperatures)
+        if self.temp_max - self.temp_min < 1:
+            self.temp_max = self.temp_min + 1
+        self.precip_max = max([p for p in forecast.precipitation if p] or [1])
+        self.icon_indices = sorted({index for day in forecast.days() for _period, hour in weather.PERIOD_HOURS
+                                    for index in [forecast.nearest_in_day(day, hour)]
+                                    if index is not None and forecast.symbol[index]})
+
+    def compute_layout(self, width):
+        forecast = self.forecast
+        t0, t1 = forecast.times[0], forecast.times[-1]
+        plot_width = max(width - MARGIN_LEFT - MARGIN_RIGHT, 1)
+        scale = plot_width / (t1 - t0) if t1 > t0 else 0
+        self.xs = [MARGIN_LEFT + (t - t0) * scale for t in forecast.times]
+
+    def temperature_y(self, value, height):
+        plot_bottom = height - PLOT_BOTTOM_MARGIN
+        return plot_bottom - (value - self.temp_min) / (self.temp_max - self.temp_min) * (plot_bottom - PLOT_TOP)
+
+    @trace.traced()
+    def on_draw(self, widget, context):
+        forecast = self.forecast
+        width, height = self.get_allocated_width(), self.get_allocated_height()
+        if len(self.xs) != len(forecast):
+            self.compute_layout(width)
+        style = self.get_style_context()
+        fg = style.get_color(Gtk.StateFlags.NORMAL)
+        plot_bottom = height - PLOT_BOTTOM_MARGIN
+        context.select_font_face("Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+        context.set_font_size(11)
+
+        # Day separators and labels
+        for day in forecast.days():
+            start, _end = forecast.day_slices[day]
+            x = self.xs[start]
+            year, month, day_of_month = forecast.day_dates[day]
+            context.set_source_rgba(fg.red, fg.green, fg.blue, 0.25)
+            context.set_line_width(1)
+            context.move_to(x, PLOT_TOP - 4)
+            context.line_to(x, plot_bottom)
+            context.stroke()
+            context.set_source_rgba(fg.red, fg.green, fg.blue, 0.9)
+            context.move_to(x + 3, 12)
+            context.show_text(f"{self.day_names[calendar.weekday(year, month, day_of_month)]} {day_of_month}")
+
+        # Precipitation bars, drawn as wide as the interval they cover
+        context.set_source_rgba(0.25, 0.55, 0.95, 0.55)
+        for i, amount in enumerate(forecast.precipitation):
+            if not amount:
+                continue
+            right = self.xs[i + 1] if i + 1 < len(self.xs) else self.xs[i] + PIXELS_PER_HOUR
+            bar_height = amount / self.precip_max * (plot_bottom - PLOT_TOP) * 0.4
+            context.rectangle(self.xs[i], plot_bottom - bar_height, max(right - self.xs[i] - 1, 1), bar_height)
+        context.fill()
+
+        # Temperature curve
+        context.set_source_rgba(0.9, 0.35, 0.2, 1)
+        context.set_line_width(2)
+        started = False
+        for x, value in zip(self.xs, forecast.temperature):
+            if value is None:
+                started = False
+                continue
+            y = self.temperature_y(value, height)
+            if started:
+                context.line_to(x, y)
+            else:
+                context.move_to(x, y)
+                started = True
+        context.stroke()
+
+        # Temperature scale
+        context.set_source_rgba(fg.red, fg.green, fg.blue, 0.8)
+        for value in (self.temp_min, (self.temp_min + self.temp_max) / 2, self.temp_max):
+            context.move_to(4, self.temperature_y(value, height) + 4)
+            context.show_text(f"{value:.0f}°")
+
+        # Icon strip
+        for i in self.icon_indices:
+            surface = icon_surface(forecast.symbol[i])
+            if surface:
+                context.set_source_surface(surface, self.xs[i] - ICON_SIZE / 2, ICON_STRIP_TOP)
+                context.paint()
+        return False
+
+    def index_at(self, x):
+        if not self.xs:
+            return None
+        i = bisect_left(self.xs, x)
+        if i == len(self.xs):
+            return i - 1
+        if i > 0 and x - self.xs[i - 1] < self.xs[i] - x:
+            return i - 1
+        return i
+
+    def on_query_tooltip(self, widget, x, y, keyboard_mode, tooltip):
+        i = self.index_at(x)
+        if i is None:
+            return False
+        forecast = self.forecast
+        start_day = next(day for day in forecast.days() if forecast.day_slices[day][0] <= i < forecast.day_slices[day][1])
+        year, month, day_of_month = forecast.day_dates[start_day]
+        lines = [f"{self.day_names[calendar.weekday(year, month, day_of_month)]} {forecast.clock(i)}"]
+        if forecast.temperature[i] is not None:
+            lines.append(f"{forecast.temperature[i]}°C")
+        if forecast.precipitation[i] is not None:
+            lines.append(f"{forecast.precipitation[i]} mm")
+        if forecast.wind_speed[i] is not None:
+            lines.append(_("Wind: {speed} m/s").format(speed=forecast.wind_speed[i]))
+        if forecast.humidity[i] is not None:
+            lines.append(_("Humidity: %{humidity}").format(humidity=forecast.humidity[i]))
+        tooltip.set_text("\n".join(lines))
+        return True
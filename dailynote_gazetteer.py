@@ -0,0 +1,133 @@
+import io
+import os
+import sys
+import sqlite3
+import zipfile
+import unicodedata
+
+from dailynote_core import BASE_DIR
+
+# Offline place lookup for the location dialog. The data is a GeoNames
+# cities500-style dump packed by "python3 dailynote_gazetteer.py build" into a
+# read-only SQLite file: one row per place, and a WITHOUT ROWID table of
+# accent-folded name keys clustered by key, so a prefix lookup is a single
+# index range scan. Short prefixes match thousands of keys, too many to rank
+# on every keystroke, so the build also stores the most populous places of
+# every prefix up to RANKED_PREFIX_LENGTH characters, already in order. The
+# file is opened immutable and memory-mapped, so the index lives in the page
+# cache instead of in Python objects.
+
+GAZETTEER_PATH = os.path.join(BASE_DIR, "places.db")
+MIN_PREFIX_LENGTH = 2
+RANKED_PREFIX_LENGTH = 4
+RANKED_PLACES = 30
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Letters NFKD does not decompose into a base letter plus accents.
+_EXTRA_FOLDS = str.maketrans({'ı': 'i', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'æ': 'ae', 'œ': 'oe', 'ß': 'ss'})
+
+
+def fold(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).translate(_EXTRA_FOLDS)
+
+
+def _prefix_upper_bound(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class Gazetteer:
+    def __init__(self, path=GAZETTEER_PATH):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        # Files built before ranked_prefixes existed fall back to ranking the range.
+        self.has_ranked = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name='ranked_prefixes'").fetchone() is not None
+
+    @classmethod
+    def open_default(cls):
+        if not os.path.exists(GAZETTEER_PATH):
+            return None
+        try:
+            return cls(GAZETTEER_PATH)
+        except sqlite3.Error as e:
+            print(f"Could not open place database: {e}")
+            return None
+
+    def search(self, text, limit=15):
+        prefix = fold(text.strip())
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return []
+        if self.has_ranked and len(prefix) <= RANKED_PREFIX_LENGTH and limit <= RANKED_PLACES:
+            rows = self.conn.execute("""
+                SELECT p.name, p.country, p.latitude, p.longitude, p.population
+                FROM ranked_prefixes r JOIN places p ON p.id = r.place_id
+                WHERE r.prefix = ? ORDER BY r.rank LIMIT ?""", (prefix, limit)).fetchall()
+            return [{'name': r[0], 'country': r[1], 'latitude': r[2], 'longitude': r[3], 'population': r[4]} for r in rows]
+        rows = self.conn.execute("""
+            SELECT p.name, p.country, p.latitude, p.longitude, p.population
+            FROM place_keys k JOIN places p ON p.id = k.place_id
+            WHERE k.key >= ? AND k.key < ?
+            GROUP BY p.id ORDER BY p.population DESC LIMIT ?""",
+            (prefix, _prefix_upper_bound(prefix), limit)).fetchall()
+        return [{'name': r[0], 'country': r[1], 'latitude': r[2], 'longitude': r[3], 'population': r[4]} for r in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+def _read_geonames(source):
+    if source.endswith(".zip"):
+        archive = zipfile.ZipFile(source)
+        member = next(name for name in archive.namelist() if name.endswith(".txt"))
+        stream = io.TextIOWrapper(archive.open(member), encoding="utf-8")
+    else:
+        stream = open(source, encoding="utf-8")
+    with stream:
+        for line in stream:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15:
+                continue
+            yield (int(fields[0]), fields[1], fields[2], float(fields[4]), float(fields[5]), fields[8], int(fields[14] or 0))
+
+
+def build(source, destination=GAZETTEER_PATH):
+    tmp_path = destination + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("""CREATE TABLE places (
+        id INTEGER PRIMARY KEY, name TEXT NOT NULL, country TEXT,
+        latitude REAL NOT NULL, longitude REAL NOT NULL, population INTEGER NOT NULL DEFAULT 0)""")
+    conn.execute("CREATE TABLE place_keys (key TEXT NOT NULL, place_id INTEGER NOT NULL, PRIMARY KEY (key, place_id)) WITHOUT ROWID")
+    count = 0
+    with conn:
+        for geonameid, name, asciiname, lat, lon, country, population in _read_geonames(source):
+            conn.execute("INSERT INTO places VALUES (?, ?, ?, ?, ?, ?)", (geonameid, name, country, lat, lon, population))
+            for key in {fold(name), fold(asciiname)}:
+                if key:
+                    conn.execute("INSERT OR IGNORE INTO place_keys VALUES (?, ?)", (key, geonameid))
+            count += 1
+    conn.execute("CREATE TABLE ranked_prefixes (prefix TEXT NOT NULL, rank INTEGER NOT NULL, place_id INTEGER NOT NULL, PRIMARY KEY (prefix, rank)) WITHOUT ROWID")
+    with conn:
+        for length in range(MIN_PREFIX_LENGTH, RANKED_PREFIX_LENGTH + 1):
+            conn.execute("""INSERT INTO ranked_prefixes
+                            SELECT prefix, rank, place_id FROM (
+                                SELECT prefix, place_id, ROW_NUMBER() OVER (PARTITION BY prefix ORDER BY population DESC, place_id) AS rank
+                                FROM (SELECT DISTINCT substr(k.key, 1, ?) AS prefix, k.place_id, p.population
+                                      FROM place_keys k JOIN places p ON p.id = k.place_id WHERE length(k.key) >= ?))
+                            WHERE rank <= ?""", (length, length, RANKED_PLACES))
+    conn.execute("ANALYZE")
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, destination)
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "build":
+        print("Usage: dailynote_gazetteer.py build cities500.zip|cities500.txt [places.db]", file=sys.stderr)
+        sys.exit(2)
+    places = build(*sys.argv[2:])
+    print(f"Packed {places} places.")
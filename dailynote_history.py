@@ -0,0 +1,186 @@
+import json
+import zlib
+import difflib
+import itertools
+
+# Revision history of daily notes. A version is the note's title and content.
+# Only superseded versions are kept, each with the time it was replaced; the
+# current one lives in the notes table and is never stored twice. Every
+# SNAPSHOT_INTERVAL-th revision of a note is stored whole; the ones in
+# between are line deltas against the revision before them, so rebuilding
+# any revision reads one snapshot and at most SNAPSHOT_INTERVAL - 1 deltas.
+# Deltas are zlib-compressed with the previous version as the preset
+# dictionary, so a changed line costs little more than the changed words.
+# difflib can take seconds on long or repetitive text, so the unchanged
+# lines at both ends are copied without diffing, and a version whose diff
+# would run past DELTA_DIFF_BUDGET is stored whole instead.
+# The functions take a cursor; dailynote_core owns the connections. schema
+# names the attached database holding the note, "main" or "archive".
+
+SNAPSHOT_INTERVAL = 10
+# zlib only looks back this far, so only the end of a long version helps.
+ZDICT_SIZE = 32 * 1024
+# Line comparisons allowed per diff, at 50-200 ns each.
+DELTA_DIFF_BUDGET = 500_000
+
+SNAPSHOT = 0
+DELTA = 1
+
+
+def join_version(title, content):
+    # Titles come from a single-line entry, so the first newline splits them.
+    return f"{title}\n{content or ''}"
+
+
+def split_version(text):
+    title, _sep, content = text.partition("\n")
+    return title, content
+
+
+def _zdict(text):
+    return text.encode('utf-8')[-ZDICT_SIZE:]
+
+
+class _DiffTooCostly(Exception):
+    pass
+
+
+class _BudgetedMatcher(difflib.SequenceMatcher):
+    # Each longest-match search is charged the line pairs it may compare,
+    # from a running sum of how often each old line occurs in the new text.
+    def __init__(self, a, b, budget):
+        super().__init__(None, a, b, autojunk=False)
+        self.budget = budget
+        self.charges = list(itertools.accumulate((len(self.b2j.get(line, ())) for line in a), initial=0))
+
+    def find_longest_match(self, alo=0, ahi=None, blo=0, bhi=None):
+        ahi = len(self.a) if ahi is None else ahi
+        self.budget -= self.charges[ahi] - self.charges[alo] + 1
+        if self.budget < 0:
+            raise _DiffTooCostly
+        return super().find_longest_match(alo, ahi, blo, bhi)
+
+
+def encode_delta(old, new):
+    # Opcodes over lines: [i, j] copies old lines i..j, a string is inserted.
+    # None if diffing would run past DELTA_DIFF_BUDGET.
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    shorter = min(len(old_lines), len(new_lines))
+    head = 0
+    while head < shorter and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < shorter - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+        tail += 1
+    old_middle = old_lines[head:len(old_lines) - tail]
+    new_middle = new_lines[head:len(new_lines) - tail]
+    try:
+        opcodes = _BudgetedMatcher(old_middle, new_middle, DELTA_DIFF_BUDGET).get_opcodes()
+    except _DiffTooCostly:
+        return None
+    ops = [[0, head]] if head else []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            ops.append([head + i1, head + i2])
+        elif tag in ('replace', 'insert'):
+            ops.append("".join(new_middle[j1:j2]))
+    if tail:
+        ops.append([len(old_lines) - tail, len(old_lines)])
+    compressor = zlib.compressobj(9, zdict=_zdict(old))
+    return compressor.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8')) + compressor.flush()
+
+
+def apply_delta(old, data):
+    decompressor = zlib.decompressobj(zdict=_zdict(old))
+    ops = json.loads(decompressor.decompress(data) + decompressor.flush())
+    old_lines = old.splitlines(keepends=True)
+    return "".join("".join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def encode_snapshot(text):
+    return zlib.compress(text.encode('utf-8'), 9)
+
+
+def decode_snapshot(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def create_table(cursor, schema="main"):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {schema}.note_revisions (
+        note_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        replaced_at REAL NOT NULL,
+        kind INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (note_id, revision)
+    ) WITHOUT ROWID
+    """)
+
+
+def _latest(cursor, note_id, schema):
+    row = cursor.execute(f"SELECT MAX(revision) FROM {schema}.note_revisions WHERE note_id=?", (note_id,)).fetchone()
+    return row[0]
+
+
+def _store(cursor, note_id, revision, replaced_at, kind, data, schema):
+    cursor.execute(f"INSERT INTO {schema}.note_revisions (note_id, revision, replaced_at, kind, data) VALUES (?, ?, ?, ?, ?)",
+                   (note_id, revision, replaced_at, kind, data))
+
+
+def rebuild(cursor, note_id, revision, schema="main"):
+    # The text of one revision: the nearest snapshot at or before it, then
+    # the deltas after that snapshot in order.
+    rows = cursor.execute(f"""SELECT kind, data FROM {schema}.note_revisions WHERE note_id=? AND revision <= ?
+                             AND revision >= (SELECT MAX(revision) FROM {schema}.note_revisions
+                                              WHERE note_id=? AND revision <= ? AND kind=?)
+                             ORDER BY revision""", (note_id, revision, note_id, revision, SNAPSHOT)).fetchall()
+    if not rows:
+        return None
+    text = decode_snapshot(rows[0][1])
+    for _kind, data in rows[1:]:
+        text = apply_delta(text, data)
+    return text
+
+
+def record(cursor, note_id, previous, current, replaced_at, schema="main"):
+    # Called when a save replaces the (title, content) previous with
+    # current; appends previous unless the save changed nothing. Returns
+    # the new revision number, or None.
+    text = join_version(*previous)
+    if text == join_version(*current):
+        return None
+    latest = _latest(cursor, note_id, schema)
+    snapshot = encode_snapshot(text)
+    if latest is None:
+        _store(cursor, note_id, 0, replaced_at, SNAPSHOT, snapshot, schema)
+        return 0
+    revision = latest + 1
+    if revision % SNAPSHOT_INTERVAL == 0:
+        _store(cursor, note_id, revision, replaced_at, SNAPSHOT, snapshot, schema)
+    else:
+        delta = encode_delta(rebuild(cursor, note_id, latest, schema), text)
+        # A rewrite can make the delta larger than the whole version.
+        if delta is not None and len(delta) < len(snapshot):
+            kind, data = DELTA, delta
+        else:
+            kind, data = SNAPSHOT, snapshot
+        _store(cursor, note_id, revision, replaced_at, kind, data, schema)
+    return revision
+
+
+def move(cursor, source, destination, ids_query, params=()):
+    # Moves the revisions of the notes selected by ids_query (a SELECT of
+    # note ids) between attached databases, e.g. when notes are archived.
+    cursor.execute(f"""INSERT OR REPLACE INTO {destination}.note_revisions
+                       SELECT * FROM {source}.note_revisions WHERE note_id IN ({ids_query})""", params)
+    cursor.execute(f"DELETE FROM {source}.note_revisions WHERE note_id IN ({ids_query})", params)
+
+
+def list_revisions(cursor, note_id, schema="main"):
+    # [(revision, saved_at, replaced_at, stored bytes)], newest first. A
+    # version was saved when the one before it was replaced; the first
+    # one's save time is unknown (None).
+    return cursor.execute(f"""SELECT revision, LAG(replaced_at) OVER (ORDER BY revision), replaced_at, length(data)
+                             FROM {schema}.note_revisions WHERE note_id=? ORDER BY revision DESC""", (note_id,)).fetchall()
@@ -0,0 +1,116 @@
+import gc
+import os
+import sys
+from collections import Counter
+
+from gi.repository import GObject, Gtk
+
+# Leak self-check. Enable with DAILYNOTE_LEAKCHECK=1 (or a cycle count) or the
+# --leak-check[=N] command line flag. Once the window is up, every view that
+# rebuilds its widgets is refreshed N times. Live GObject wrappers and widgets
+# are counted by type, and connected signal handlers are counted on the
+# long-lived objects. Anything that grows by at least one per cycle is
+# reported as unbounded and the program exits with status 1.
+
+DEFAULT_CYCLES = 50
+WARMUP_CYCLES = 5
+
+requested_cycles = None
+failed = False
+
+
+def enable(cycles=DEFAULT_CYCLES):
+    global requested_cycles
+    requested_cycles = cycles
+
+
+def enable_from_env():
+    value = os.environ.get("DAILYNOTE_LEAKCHECK")
+    if value and value != "0":
+        enable(DEFAULT_CYCLES if value == "1" else int(value))
+
+
+def enable_from_argv(argv):
+    # Removes the flag from argv so GApplication does not reject it.
+    for arg in list(argv):
+        if arg == "--leak-check" or arg.startswith("--leak-check="):
+            argv.remove(arg)
+            enable(int(arg.partition("=")[2] or DEFAULT_CYCLES))
+
+
+def live_objects():
+    gc.collect()
+    return Counter(type(obj).__name__ for obj in gc.get_objects() if isinstance(obj, GObject.Object))
+
+
+def live_widgets():
+    counts = Counter()
+
+    def walk(widget):
+        counts[type(widget).__name__] += 1
+        if isinstance(widget, Gtk.Container):
+            for child in widget.get_children():
+                walk(child)
+
+    for window in Gtk.Window.list_toplevels():
+        walk(window)
+    return counts
+
+
+def last_handler_id():
+    # Handler ids are allocated from one global sequence, so a probe
+    # connection tells how far any live id can reach.
+    probe = GObject.Object()
+    handler_id = probe.connect("notify", lambda *args: None)
+    probe.disconnect(handler_id)
+    return handler_id
+
+
+def handler_counts(targets):
+    upto = last_handler_id()
+    return Counter({name: sum(1 for handler_id in range(1, upto) if instance.handler_is_connected(handler_id))
+                    for name, instance in targets.items()})
+
+
+def snapshot(targets):
+    return {"objects": live_objects(), "widgets": live_widgets(), "handlers": handler_counts(targets)}
+
+
+def growth_table(before, after, cycles):
+    lines = [f"Growth over {cycles} refresh cycles:"]
+    unbounded = []
+    for kind in ("objects", "widgets", "handlers"):
+        grown = sorted(((after[kind][key] - before[kind][key], key) for key in after[kind]
+                        if after[kind][key] > before[kind][key]), reverse=True)
+        lines.append(f"  {kind}:" if grown else f"  {kind}: no growth")
+        for delta, key in grown:
+            flag = "  UNBOUNDED" if delta >= cycles else ""
+            lines.append(f"    {key:<28} {before[kind][key]:>6} -> {after[kind][key]:>6}  (+{delta / cycles:.2f}/cycle){flag}")
+            if flag:
+                unbounded.append(f"{kind}:{key}")
+    return "\n".join(lines), unbounded
+
+
+def _pump():
+    while Gtk.events_pending():
+        Gtk.main_iteration_do(False)
+
+
+def run(cycle, targets, cycles=None):
+    # cycle() performs one synthetic refresh of every view; targets maps a
+    # label to each long-lived object whose signal handlers are counted.
+    global failed
+    cycles = cycles or requested_cycles or DEFAULT_CYCLES
+    for _i in range(WARMUP_CYCLES):
+        cycle()
+        _pump()
+    before = snapshot(targets)
+    for _i in range(cycles):
+        cycle()
+        _pump()
+    after = snapshot(targets)
+    table, unbounded = growth_table(before, after, cycles)
+    print(table, file=sys.stderr)
+    failed = bool(unbounded)
+    print(f"Leak check {'FAILED: ' + ', '.join(unbounded) if failed else 'passed'}.", file=sys.stderr)
+    return not failed
@@ -0,0 +1,168 @@
+import os
+import time
+import sqlite3
+import threading
+
+import dailynote_core as core
+import dailynote_trace as trace
+
+# Database housekeeping, run at most once a day in small steps so the main
+# loop can interleave it with other work: the one-time switch to
+# auto_vacuum=INCREMENTAL, PRAGMA optimize (a bounded ANALYZE the first
+# time), incremental_vacuum a few pages at a time and PRAGMA quick_check.
+# The full VACUUM and quick_check cannot be sliced, so they run on a worker
+# thread with their own connection while step() only checks on them;
+# on_worker(True) is called just before such a phase starts and
+# on_worker(False) once it has finished, so the caller can hold back its own
+# writes instead of waiting on the lock.
+# Each run logs how long every phase took and how much space it gave back.
+
+MAINTENANCE_INTERVAL = 24 * 3600
+PAGES_PER_STEP = 128
+ANALYSIS_LIMIT = 400
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def due(last_run, now=None):
+    return last_run is None or (now or time.time()) - last_run >= MAINTENANCE_INTERVAL
+
+
+def _format_bytes(count):
+    return f"{count / 1024:.0f} KiB" if count < 1024 * 1024 else f"{count / (1024 * 1024):.1f} MiB"
+
+
+class MaintenanceRun:
+    def __init__(self, path=None, pages_per_step=PAGES_PER_STEP, on_worker=None):
+        self.path = path or core.DB_NAME
+        self.pages_per_step = pages_per_step
+        self.on_worker = on_worker or (lambda running: None)
+        self.conn = None
+        self.phases = []
+        self.integrity = None
+        self.size_before = None
+        self.size_after = None
+        self.worker = None
+        self._steps = self._run()
+
+    def busy(self):
+        # True while a phase runs on the worker thread; step() returns at
+        # once then, so callers may poll less often.
+        return self.worker is not None and self.worker.is_alive()
+
+    def step(self):
+        # Does one small unit of work; False once the run is complete.
+        try:
+            next(self._steps)
+            return True
+        except StopIteration:
+            self.close()
+            return False
+
+    def run_all(self):
+        while self.step():
+            if self.worker is not None:
+                self.worker.join()
+
+    def close(self):
+        # Waits for a running worker phase; VACUUM cannot be interrupted,
+        # and the database must not be replaced under it.
+        if self.worker is not None:
+            self.worker.join()
+        self._steps.close()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _pragma(self, name):
+        return self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def _timed(self, name, work, **args):
+        begin = time.monotonic()
+        with trace.span(f"maintenance {name}", "db", **args):
+            result = work()
+        self.phases.append((name, time.monotonic() - begin))
+        return result
+
+    def _in_background(self, name, work):
+        # Runs work(conn) on a worker thread and yields until it is done;
+        # use with "result = yield from".
+        outcome = {}
+
+        def target():
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            try:
+                outcome['result'] = self._timed(name, lambda: work(conn))
+            except sqlite3.Error as e:
+                outcome['error'] = e
+            finally:
+                conn.close()
+
+        self.on_worker(True)
+        self.worker = threading.Thread(target=target, name=f"maintenance {name}", daemon=True)
+        self.worker.start()
+        try:
+            while self.worker.is_alive():
+                yield
+        finally:
+            self.worker = None
+            self.on_worker(False)
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def _run(self):
+        self.size_before = os.path.getsize(self.path)
+        # Autocommit, so no step leaves a transaction open between slices.
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        yield
+
+        if self._pragma("auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+            # Takes effect only after a full VACUUM; done once per database.
+            def migrate(conn):
+                conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+                conn.execute("VACUUM")
+            yield from self._in_background("auto_vacuum migration", migrate)
+            yield
+
+        def optimize():
+            self.conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is None:
+                self.conn.execute("ANALYZE")
+            else:
+                self.conn.execute("PRAGMA optimize")
+        self._timed("optimize", optimize)
+        yield
+
+        free_pages = self._pragma("freelist_count")
+        vacuum_time = 0.0
+        while free_pages > 0:
+            begin = time.monotonic()
+            with trace.span("maintenance incremental_vacuum", "db", pages=min(free_pages, self.pages_per_step)):
+                # The pragma frees one page per sqlite3_step() without
+                # returning a row, so execute() would stop after the first;
+                # executescript() steps it to completion.
+                self.conn.executescript(f"PRAGMA incremental_vacuum({self.pages_per_step})")
+            vacuum_time += time.monotonic() - begin
+            remaining = self._pragma("freelist_count")
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+            yield
+        self.phases.append(("incremental_vacuum", vacuum_time))
+
+        self.integrity = yield from self._in_background("quick_check", lambda conn: [row[0] for row in conn.execute("PRAGMA quick_check")])
+        self.size_after = os.path.getsize(self.path)
+
+    def ok(self):
+        return self.integrity == ["ok"]
+
+    def summary(self):
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        total = sum(seconds for _name, seconds in self.phases)
+        reclaimed = (self.size_before or 0) - (self.size_after or self.size_before or 0)
+        lines = [f"Database maintenance took {total * 1000:.0f} ms ({phases}); reclaimed {_format_bytes(max(reclaimed, 0))}."]
+        if self.integrity is not None and not self.ok():
+            lines.append("Integrity check FAILED:")
+            lines.extend(f"  {message}" for message in self.integrity)
+        return "\n".join(lines)
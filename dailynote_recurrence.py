@@ -0,0 +1,123 @@
+import calendar
+from datetime import date, timedelta
+
+# Recurrence rules of fixed notes, compiled once and expanded over date
+# windows. A monthly rule on a day the month does not have (the 31st in
+# April, the 30th in February) falls on the month's last day, and so does a
+# yearly rule on February 29 outside leap years.
+
+
+def _clamped(year, month, day):
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class Rule:
+    __slots__ = ('note', 'kind', 'weekdays', 'day', 'month')
+
+    def __init__(self, note, kind, weekdays=0, day=None, month=None):
+        self.note = note
+        self.kind = kind
+        self.weekdays = weekdays
+        self.day = day
+        self.month = month
+
+    def occurs_on(self, day):
+        if self.kind == 'weekly':
+            return bool(self.weekdays >> day.weekday() & 1)
+        if self.kind == 'monthly':
+            return day == _clamped(day.year, day.month, self.day)
+        return day.month == self.month and day == _clamped(day.year, self.month, self.day)
+
+    def occurrences(self, start, end):
+        # Dates in [start, end], in order.
+        if self.kind == 'weekly':
+            day = start
+            while day <= end:
+                if self.weekdays >> day.weekday() & 1:
+                    yield day
+                day += timedelta(days=1)
+        elif self.kind == 'monthly':
+            for year, month in _months(start, end):
+                day = _clamped(year, month, self.day)
+                if start <= day <= end:
+                    yield day
+        else:
+            for year in range(start.year, end.year + 1):
+                day = _clamped(year, self.month, self.day)
+                if start <= day <= end:
+                    yield day
+
+
+def compile_rule(note):
+    # Returns None for notes that never recur (no days, no date).
+    kind = note.get('repeat_type') or 'weekly'
+    if kind == 'weekly':
+        weekdays = 0
+        for token in (note.get('alarm_days') or '').split(','):
+            if token.strip().isdigit() and int(token) < 7:
+                weekdays |= 1 << int(token)
+        return Rule(note, kind, weekdays=weekdays) if weekdays else None
+    day = note.get('repeat_day')
+    if kind == 'monthly' and day:
+        return Rule(note, kind, day=int(day))
+    month = note.get('repeat_month')
+    if kind == 'yearly' and day and month:
+        return Rule(note, kind, day=int(day), month=int(month))
+    return None
+
+
+def _event_sort_key(note):
+    return (note.get('event_time') or '', note.get('title') or '')
+
+
+class OccurrenceIndex:
+    # Occurrences of every fixed note, expanded a month at a time and kept
+    # until invalidate() is called after a fixed note changes. load_notes is
+    # called lazily to (re)compile the rules.
+    def __init__(self, load_notes):
+        self.load_notes = load_notes
+        self.rules = None
+        self.months = {}
+
+    def invalidate(self):
+        self.rules = None
+        self.months.clear()
+
+    def compiled_rules(self):
+        if self.rules is None:
+            self.rules = [rule for rule in map(compile_rule, self.load_notes()) if rule]
+        return self.rules
+
+    def month(self, year, month):
+        # {date: [fixed notes ordered by event time]} for one month.
+        key = (year, month)
+        if key not in self.months:
+            first = date(year, month, 1)
+            last = date(year, month, calendar.monthrange(year, month)[1])
+            days = {}
+            for rule in self.compiled_rules():
+                for day in rule.occurrences(first, last):
+                    days.setdefault(day, []).append(rule.note)
+            for notes in days.values():
+                notes.sort(key=_event_sort_key)
+            self.months[key] = days
+        return self.months[key]
+
+    def on(self, day):
+        return self.month(day.year, day.month).get(day, [])
+
+    def between(self, start, end):
+        # Yields (date, note) for every occurrence in [start, end], in order.
+        for year, month in _months(start, end):
+            days = self.month(year, month)
+            for day in sorted(days):
+                if start <= day <= end:
+                    for note in days[day]:
+                        yield day, note
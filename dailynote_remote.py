@@ -0,0 +1,91 @@
+import sqlite3
+
+from gi.repository import Gio, GLib
+
+import dailynote_core as core
+
+APPLICATION_ID = "com.github.kullaniciadi.dailynote"
+INTERFACE_NAME = "com.github.kullaniciadi.dailynote.Notes"
+ERROR_INVALID_ARGS = "com.github.kullaniciadi.dailynote.Error.InvalidArgs"
+ERROR_FAILED = "com.github.kullaniciadi.dailynote.Error.Failed"
+
+INTROSPECTION_XML = """
+<node>
+  <interface name='com.github.kullaniciadi.dailynote.Notes'>
+    <method name='AddNotes'>
+      <arg type='a(sss)' name='notes' direction='in'/>
+      <arg type='ax' name='ids' direction='out'/>
+    </method>
+    <method name='SetAlarms'>
+      <arg type='a(xssii)' name='alarms' direction='in'/>
+      <arg type='u' name='count' direction='out'/>
+    </method>
+    <method name='QueryRange'>
+      <arg type='s' name='from_date' direction='in'/>
+      <arg type='s' name='to_date' direction='in'/>
+      <arg type='a(xssss)' name='notes' direction='out'/>
+    </method>
+    <signal name='NotesChanged'/>
+  </interface>
+</node>
+"""
+
+# Every method takes a whole batch: AddNotes([(title, content, YYYY-MM-DD)]),
+# SetAlarms([(note_id, HH:MM, sound, volume, duration)]) and
+# QueryRange(from, to) -> [(id, title, content, date, alarm_time)].
+# A batch is applied in one transaction and followed by one on_changed call.
+
+
+class NotesService:
+    def __init__(self, on_changed=None):
+        self.on_changed = on_changed
+        self.node_info = Gio.DBusNodeInfo.new_for_xml(INTROSPECTION_XML)
+        self.registrations = []
+
+    def register(self, connection, object_path):
+        registration_id = connection.register_object(object_path, self.node_info.interfaces[0],
+                                                     self.on_method_call, None, None)
+        self.registrations.append((connection, object_path, registration_id))
+        return registration_id
+
+    def unregister(self, connection=None):
+        for conn, path, registration_id in list(self.registrations):
+            if connection is None or conn == connection:
+                conn.unregister_object(registration_id)
+                self.registrations.remove((conn, path, registration_id))
+
+    def on_method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        handler = {'AddNotes': self.add_notes, 'SetAlarms': self.set_alarms, 'QueryRange': self.query_range}.get(method_name)
+        if handler is None:
+            invocation.return_dbus_error("org.freedesktop.DBus.Error.UnknownMethod", method_name)
+            return
+        try:
+            result, changed = handler(*parameters.unpack())
+        except ValueError as e:
+            invocation.return_dbus_error(ERROR_INVALID_ARGS, str(e))
+            return
+        except sqlite3.Error as e:
+            invocation.return_dbus_error(ERROR_FAILED, str(e))
+            return
+        invocation.return_value(result)
+        if changed:
+            self.notify_changed(connection, object_path)
+
+    def add_notes(self, notes):
+        ids = core.add_notes([{'title': title, 'content': content, 'date': date} for title, content, date in notes])
+        return GLib.Variant('(ax)', (ids,)), bool(ids)
+
+    def set_alarms(self, alarms):
+        count = core.set_alarms([{'note_id': note_id, 'time': time_str, 'sound': sound, 'volume': volume, 'duration': duration}
+                                 for note_id, time_str, sound, volume, duration in alarms])
+        return GLib.Variant('(u)', (count,)), count > 0
+
+    def query_range(self, from_date, to_date):
+        rows = [(n['id'], n['title'], n['content'] or '', n['date'], n['alarm_time'] or '')
+                for n in core.query_range(from_date, to_date)]
+        return GLib.Variant('(a(xssss))', (rows,)), False
+
+    def notify_changed(self, connection, object_path):
+        connection.emit_signal(None, object_path, INTERFACE_NAME, "NotesChanged", None)
+        if self.on_changed:
+            self.on_changed()
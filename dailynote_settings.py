@@ -0,0 +1,125 @@
+from gi.repository import GLib
+
+import dailynote_core as core
+
+# Application settings held in memory with their real types. Reads never touch
+# the database; set() only records the key as dirty and schedules one idle
+# flush, so a burst of changes becomes a single transaction. Callbacks
+# connected to a key run only when its value actually changes. hold() keeps
+# changes in memory while something else has the database to itself.
+
+
+def _decode_bool(text):
+    return text == 'True'
+
+
+def _decode_optional_int(text):
+    return int(text) if text else None
+
+
+def _decode_optional_float(text):
+    return float(text) if text else None
+
+
+def _encode_optional(value):
+    return "" if value is None else str(value)
+
+
+# key: (decode, encode, default)
+SCHEMA = {
+    'window_width': (int, str, 600),
+    'window_height': (int, str, 800),
+    'window_opacity': (float, str, 1.0),
+    'font_description': (str, str, "Sans Serif 10"),
+    'startup_notification_enabled': (_decode_bool, str, True),
+    'active_location_id': (_decode_optional_int, _encode_optional, None),
+    # Minutes hidden in the tray before the window's widgets are freed; 0 keeps them.
+    'tray_release_minutes': (int, str, 10),
+    # Notes older than this many days are moved to the archive; 0 keeps them.
+    'archive_after_days': (int, str, 365),
+    # Epoch seconds of the last completed database maintenance run.
+    'last_maintenance': (_decode_optional_float, _encode_optional, None),
+    # Epoch seconds of the last minute the alarm scheduler evaluated.
+    'last_alarm_check': (_decode_optional_float, _encode_optional, None),
+}
+
+
+class Settings:
+    def __init__(self, values=None):
+        self.values = {key: default for key, (_decode, _encode, default) in SCHEMA.items()}
+        self.dirty = set()
+        self.handlers = {}
+        self.flush_source = None
+        self.held = False
+        for key, text in (values or {}).items():
+            if key not in SCHEMA:
+                continue
+            try:
+                self.values[key] = SCHEMA[key][0](text)
+            except (TypeError, ValueError):
+                print(f"Ignoring invalid value {text!r} for setting {key}")
+
+    @classmethod
+    def load(cls):
+        return cls(core.load_settings())
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def connect(self, key, callback):
+        # callback(key, value) runs after the value has changed.
+        if key not in SCHEMA:
+            raise KeyError(key)
+        self.handlers.setdefault(key, []).append(callback)
+
+    def set(self, key, value):
+        decode, encode, _default = SCHEMA[key]
+        if value is not None:
+            value = decode(encode(value))
+        if self.values[key] == value:
+            return False
+        self.values[key] = value
+        self.dirty.add(key)
+        self._schedule_flush()
+        for callback in self.handlers.get(key, ()):
+            callback(key, value)
+        return True
+
+    def update(self, **values):
+        return [key for key, value in values.items() if self.set(key, value)]
+
+    def _schedule_flush(self):
+        if self.flush_source is None and not self.held:
+            self.flush_source = GLib.idle_add(self._flush_on_idle, priority=GLib.PRIORITY_LOW)
+
+    def hold(self):
+        if self.flush_source is not None:
+            GLib.source_remove(self.flush_source)
+            self.flush_source = None
+        self.held = True
+
+    def release(self):
+        self.held = False
+        if self.dirty:
+            self._schedule_flush()
+
+    def _flush_on_idle(self):
+        self.flush_source = None
+        self.flush()
+        return False
+
+    def flush(self):
+        if self.flush_source is not None:
+            GLib.source_remove(self.flush_source)
+            self.flush_source = None
+        if not self.dirty or self.held:
+            return
+        core.save_settings({key: SCHEMA[key][1](self.values[key]) for key in self.dirty})
+        self.dirty.clear()
+
+    def discard_pending(self):
+        # Used before the database file is replaced under us (restore).
+        if self.flush_source is not None:
+            GLib.source_remove(self.flush_source)
+            self.flush_source = None
+        self.dirty.clear()
@@ -0,0 +1,71 @@
+import gi
+
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, Gdk, Pango
+
+import dailynote_trace as trace
+
+# Application stylesheets. The static rules are parsed once at startup; the
+# font rule has a provider of its own, so changing the font reparses one rule
+# and both providers are added to the screen exactly once.
+
+BASE_CSS = b"""
+.not-list-frame, .weather-frame {
+    border: 0.5px solid #616161;
+    border-radius: 1px;
+    padding: 5px;
+}
+.weather-frame { padding: 10px; }
+"""
+
+# Font properties are inherited, so setting them on the root node of each CSS
+# tree reaches every widget. A "*" rule instead matches, and is re-evaluated
+# for, every node in every window whenever the provider changes.
+FONT_SELECTOR = "window, popover, tooltip"
+
+
+def font_css(description):
+    font = Pango.FontDescription.from_string(description)
+    declarations = [f"font-family: \"{font.get_family()}\";"] if font.get_family() else []
+    if font.get_size():
+        declarations.append(f"font-size: {font.get_size() // Pango.SCALE}pt;")
+    return f"{FONT_SELECTOR} {{ {' '.join(declarations)} }}"
+
+
+class StyleManager:
+    def __init__(self, screen=None):
+        self.screen = screen or Gdk.Screen.get_default()
+        self.base_provider = Gtk.CssProvider()
+        self.base_provider.load_from_data(BASE_CSS)
+        self.font_provider = Gtk.CssProvider()
+        self.current_font_css = None
+        for provider in (self.base_provider, self.font_provider):
+            Gtk.StyleContext.add_provider_for_screen(self.screen, provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+
+    def set_font(self, description):
+        css = font_css(description)
+        if css == self.current_font_css:
+            return
+        self.current_font_css = css
+        begin = trace.timestamp() if trace.enabled else None
+        with trace.span("css load", "style", provider="font"):
+            self.font_provider.load_from_data(css.encode('utf-8'))
+        if begin is not None:
+            self.measure_restyle(begin)
+
+    def measure_restyle(self, begin):
+        # GTK recomputes styles lazily on the next frame, so the cost of the
+        # invalidation is the time until every visible window has painted.
+        clocks = {window.get_frame_clock() for window in Gtk.Window.list_toplevels() if window.get_mapped()}
+        clocks.discard(None)
+        if not clocks:
+            return
+        handlers = {}
+
+        def on_after_paint(clock):
+            clock.disconnect(handlers.pop(clock))
+            if not handlers:
+                trace.complete("style invalidation", "style", begin, windows=len(clocks))
+
+        for clock in clocks:
+            handlers[clock] = clock.connect("after-paint", on_after_paint)
@@ -0,0 +1,186 @@
+import os
+import sys
+import re
+import json
+import time
+import atexit
+import sqlite3
+import threading
+import functools
+from contextlib import contextmanager
+
+# Opt-in timing spans. Enable with DAILYNOTE_TRACE=1 (or a file path) or the
+# --trace[=FILE] command line flag. On exit the spans are written as Chrome
+# trace JSON (load it in chrome://tracing or ui.perfetto.dev) and a summary
+# table is printed to stderr. When disabled every hook is a cheap no-op.
+
+enabled = False
+trace_path = None
+_events = []
+_local = threading.local()
+_pid = os.getpid()
+_start = time.perf_counter()
+
+
+def _now_us():
+    return (time.perf_counter() - _start) * 1e6
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def enable(path=None):
+    global enabled, trace_path
+    if enabled:
+        return
+    import tempfile
+    enabled = True
+    trace_path = path or os.path.join(tempfile.gettempdir(), f"dailynote-trace-{_pid}.json")
+    atexit.register(finish)
+
+
+def enable_from_env():
+    value = os.environ.get("DAILYNOTE_TRACE")
+    if value and value != "0":
+        enable(None if value == "1" else value)
+
+
+def enable_from_argv(argv):
+    # Removes the flag from argv so GApplication does not reject it.
+    for arg in list(argv):
+        if arg == "--trace" or arg.startswith("--trace="):
+            argv.remove(arg)
+            enable(arg.partition("=")[2] or None)
+
+
+@contextmanager
+def span(name, category="app", **args):
+    if not enabled:
+        yield args
+        return
+    stack = _stack()
+    stack.append(args)
+    begin = _now_us()
+    try:
+        yield args
+    finally:
+        duration = _now_us() - begin
+        stack.pop()
+        _events.append({"name": name, "cat": category, "ph": "X", "ts": begin, "dur": duration,
+                        "pid": _pid, "tid": threading.get_ident(), "args": args})
+
+
+def timestamp():
+    return _now_us()
+
+
+def complete(name, category, begin, **args):
+    # Records a span whose start (from timestamp()) and end are in different
+    # callbacks, e.g. work that finishes on a later frame.
+    if not enabled:
+        return
+    _events.append({"name": name, "cat": category, "ph": "X", "ts": begin, "dur": _now_us() - begin,
+                    "pid": _pid, "tid": threading.get_ident(), "args": args})
+
+
+def count(key, amount=1):
+    if not enabled:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1][key] = stack[-1].get(key, 0) + amount
+
+
+def traced(name=None, category="app"):
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with span(_statement_name(sql), "sqlite", sql=" ".join(sql.split())):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with span(_statement_name(sql), "sqlite", sql=" ".join(sql.split())):
+            return super().executemany(sql, seq_of_parameters)
+
+    def fetchall(self):
+        with span("sqlite fetchall", "sqlite") as args:
+            rows = super().fetchall()
+            args["rows"] = len(rows)
+        count("rows_read", len(rows))
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        count("rows_read", 1 if row is not None else 0)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        with span("sqlite COMMIT", "sqlite"):
+            super().commit()
+
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+(\w+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=256)
+def _statement_name(sql):
+    words = sql.split(None, 1)
+    verb = words[0].upper() if words else ""
+    match = _TABLE_RE.search(sql)
+    return f"sqlite {verb} {match.group(1)}" if match else f"sqlite {verb}"
+
+
+def export_chrome_trace(path):
+    with open(path, "w") as f:
+        json.dump({"traceEvents": list(_events), "displayTimeUnit": "ms"}, f)
+
+
+def summary_table():
+    totals = {}
+    for event in list(_events):
+        entry = totals.setdefault(event["name"], [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += event["dur"]
+        entry[2] = max(entry[2], event["dur"])
+    lines = [f"{'span':<48} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+    for name, (calls, total, longest) in sorted(totals.items(), key=lambda item: item[1][1], reverse=True):
+        lines.append(f"{name[:48]:<48} {calls:>7} {total / 1000:>10.2f} {total / 1000 / calls:>9.3f} {longest / 1000:>9.2f}")
+    return "\n".join(lines)
+
+
+def finish():
+    if not enabled or not _events:
+        return
+    try:
+        export_chrome_trace(trace_path)
+        print(f"Trace written to {trace_path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write trace file: {e}", file=sys.stderr)
+    print(summary_table(), file=sys.stderr)
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import atexit
+import threading
+import traceback
+
+from gi.repository import GLib
+
+# Main loop stall watchdog. Enable with DAILYNOTE_WATCHDOG=1 (or a threshold
+# in milliseconds) or the --watchdog[=MS] command line flag. A background
+# thread posts heartbeats through GLib.idle_add and measures how long they
+# wait to be dispatched; when one waits longer than the threshold the main
+# thread's Python stack is captured and the callback that was running is
+# reported. A latency histogram is printed on exit.
+
+DEFAULT_THRESHOLD_MS = 200
+HEARTBEAT_INTERVAL_MS = 100
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+active = None
+
+
+class MainLoopWatchdog:
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, interval_ms=HEARTBEAT_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.stalls = []
+        self.max_latency = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, base_depth):
+        # Must be called from the main thread just before the main loop runs.
+        # base_depth is the number of Python frames on the stack at that point;
+        # the frame right after them is the callback the loop is dispatching.
+        self.main_thread_id = threading.get_ident()
+        self.base_depth = base_depth
+        self._thread = threading.Thread(target=self._run, name="dailynote-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            dispatched = threading.Event()
+            sent = time.monotonic()
+            GLib.idle_add(self._on_heartbeat, dispatched, priority=GLib.PRIORITY_DEFAULT)
+            stack = None
+            if not dispatched.wait(self.threshold):
+                stack = self.capture_main_stack()
+                while not dispatched.wait(0.5):
+                    if self._stop.is_set():
+                        return
+            self.record(time.monotonic() - sent, stack)
+            self._stop.wait(self.interval)
+
+    def _on_heartbeat(self, dispatched):
+        dispatched.set()
+        return False
+
+    def capture_main_stack(self):
+        frame = sys._current_frames().get(self.main_thread_id)
+        return traceback.extract_stack(frame) if frame else None
+
+    def record(self, latency, stack):
+        latency_ms = latency * 1000
+        self.max_latency = max(self.max_latency, latency_ms)
+        bucket = next((i for i, limit in enumerate(BUCKETS_MS) if latency_ms < limit), len(BUCKETS_MS))
+        self.histogram[bucket] += 1
+        if stack is not None:
+            culprit = self.attribute(stack)
+            self.stalls.append((latency_ms, culprit))
+            print(f"Main loop stalled for {latency_ms:.0f} ms in {culprit}", file=sys.stderr)
+            print("".join(traceback.format_list(stack[self.base_depth:])), end="", file=sys.stderr)
+
+    def attribute(self, stack):
+        if len(stack) <= self.base_depth:
+            return "<main loop>"
+        callback = stack[self.base_depth]
+        return f"{callback.name} ({os.path.basename(callback.filename)}:{callback.lineno})"
+
+    def histogram_table(self):
+        total = sum(self.histogram)
+        labels = [f"< {limit} ms" for limit in BUCKETS_MS] + [f">= {BUCKETS_MS[-1]} ms"]
+        lines = [f"Main loop dispatch latency ({total} heartbeats, max {self.max_latency:.0f} ms):"]
+        for label, hits in zip(labels, self.histogram):
+            share = hits / total if total else 0
+            lines.append(f"  {label:>11} {hits:>7}  {'#' * round(share * 40)}")
+        if self.stalls:
+            by_callback = {}
+            for latency_ms, culprit in self.stalls:
+                entry = by_callback.setdefault(culprit, [0, 0.0])
+                entry[0] += 1
+                entry[1] = max(entry[1], latency_ms)
+            lines.append("Stalls by callback:")
+            for culprit, (hits, worst) in sorted(by_callback.items(), key=lambda item: item[1][1], reverse=True):
+                lines.append(f"  {hits:>4}x  worst {worst:>6.0f} ms  {culprit}")
+        return "\n".join(lines)
+
+    def report(self):
+        if sum(self.histogram):
+            print(self.histogram_table(), file=sys.stderr)
+
+
+def _caller_depth():
+    # Frames up to and including the caller of the public function below.
+    return len(traceback.extract_stack()) - 2
+
+
+def start(threshold_ms=DEFAULT_THRESHOLD_MS, base_depth=None):
+    global active
+    if active:
+        return active
+    active = MainLoopWatchdog(threshold_ms)
+    active.start(_caller_depth() if base_depth is None else base_depth)
+    atexit.register(active.report)
+    return active
+
+
+def enable_from_env():
+    value = os.environ.get("DAILYNOTE_WATCHDOG")
+    if value and value != "0":
+        start(DEFAULT_THRESHOLD_MS if value == "1" else int(value), _caller_depth())
+
+
+def enable_from_argv(argv):
+    # Removes the flag from argv so GApplication does not reject it.
+    for arg in list(argv):
+        if arg == "--watchdog" or arg.startswith("--watchdog="):
+            argv.remove(arg)
+            start(int(arg.partition("=")[2] or DEFAULT_THRESHOLD_MS), _caller_depth())
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import dailynote_core as core
+import dailynote_trace as trace
+
+HEADERS = {'User-Agent': 'NoteApplication/1.0 (example@mail.com)'}
+FORECAST_URL = "https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={lat}&lon={lon}"
+SUMMARY_KEY_ORDER = ('next_1_hours', 'next_6_hours', 'next_12_hours')
+PERIOD_HOURS = (("Morning", 6), ("Noon", 12), ("Evening", 18), ("Night", 0))
+# Used when the server sent no usable Expires header or the fetch failed.
+DEFAULT_REFRESH_SECONDS = 600
+RETRY_SECONDS = 300
+MIN_REFRESH_SECONDS = 60
+
+
+def local_timezone():
+    name = os.environ.get("TZ", "").lstrip(":")
+    if not name:
+        localtime = os.path.realpath("/etc/localtime")
+        if "zoneinfo/" in localtime:
+            name = localtime.split("zoneinfo/", 1)[1]
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return datetime.now().astimezone().tzinfo
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+@trace.traced(category="network")
+def revalidate_forecast(latitude, longitude, last_modified=None, timeout=10):
+    # Returns (data, expires_at, last_modified); data is None when the server
+    # answered 304 Not Modified to our If-Modified-Since.
+    # requests is only imported on demand so the CLI never pays for it.
+    import requests
+    url = FORECAST_URL.format(lat=latitude, lon=longitude)
+    headers = dict(HEADERS, **({'If-Modified-Since': last_modified} if last_modified else {}))
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    expires_at = _http_date(response.headers.get('Expires'))
+    last_modified = response.headers.get('Last-Modified', last_modified)
+    if response.status_code == 304:
+        return None, expires_at, last_modified
+    return response.json(), expires_at, last_modified
+
+
+def fetch_forecast(latitude, longitude, timeout=10):
+    return revalidate_forecast(latitude, longitude, timeout=timeout)[0]
+
+
+class Forecast:
+    # Column-per-field view of a met.no timeseries. Every timestamp is parsed
+    # once into epoch seconds and converted to the local zone; days are
+    # contiguous [start, end) slices of the sorted columns in local time, so
+    # lookups are a bisect instead of a rescan.
+    __slots__ = ('tz', 'times', 'temperature', 'wind_speed', 'humidity', 'precipitation', 'symbol',
+                 'day_keys', 'day_slices', 'day_dates')
+
+    def __init__(self, tz=timezone.utc):
+        self.tz = tz
+        self.times = []
+        self.temperature = []
+        self.wind_speed = []
+        self.humidity = []
+        self.precipitation = []
+        self.symbol = []
+        self.day_keys = []
+        self.day_slices = {}
+        self.day_dates = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def at(self, index):
+        return {'time': self.times[index], 'temperature': self.temperature[index], 'icon': self.symbol[index],
+                'wind_speed': self.wind_speed[index], 'humidity': self.humidity[index],
+                'precipitation': self.precipitation[index]}
+
+    def clock(self, index):
+        # Local HH:MM of a timestep; not always on the hour, since some zones
+        # are offset by 30 or 45 minutes from UTC.
+        return datetime.fromtimestamp(self.times[index], self.tz).strftime("%H:%M")
+
+    def nearest_index(self, epoch, start=0, end=None):
+        end = len(self.times) if end is None else end
+        if start >= end:
+            return None
+        i = bisect_left(self.times, epoch, start, end)
+        if i == end:
+            return end - 1
+        if i > start and epoch - self.times[i - 1] <= self.times[i] - epoch:
+            return i - 1
+        return i
+
+    def current_index(self, now=None):
+        return self.nearest_index(time.time() if now is None else now)
+
+    def days(self):
+        return self.day_keys
+
+    def nearest_in_day(self, day, hour):
+        if day not in self.day_slices:
+            return None
+        start, end = self.day_slices[day]
+        year, month, day_of_month = self.day_dates[day]
+        # Built from the wall clock so the target stays right on DST change days.
+        target = datetime(year, month, day_of_month, hour, tzinfo=self.tz).timestamp()
+        return self.nearest_index(target, start, end)
+
+
+@trace.traced()
+def parse_forecast(data, tz=None):
+    tz = tz or local_timezone()
+    timeseries = (data or {}).get('properties', {}).get('timeseries')
+    if not timeseries:
+        raise ValueError("Could not get time series data from API.")
+    forecast = Forecast(tz)
+    current_day = None
+    for item in timeseries:
+        item_data = item.get('data', {})
+        details = item_data.get('instant', {}).get('details', {})
+        summary_block = next((item_data[key] for key in SUMMARY_KEY_ORDER if key in item_data), None)
+        moment = datetime.fromisoformat(item['time'].replace('Z', '+00:00')).astimezone(tz)
+        index = len(forecast.times)
+        forecast.times.append(int(moment.timestamp()))
+        forecast.temperature.append(details.get('air_temperature'))
+        forecast.wind_speed.append(details.get('wind_speed'))
+        forecast.humidity.append(details.get('relative_humidity'))
+        if summary_block:
+            forecast.symbol.append(summary_block.get('summary', {}).get('symbol_code'))
+            forecast.precipitation.append(summary_block.get('details', {}).get('precipitation_amount', 0))
+        else:
+            forecast.symbol.append(None)
+            forecast.precipitation.append(None)
+
+        day = moment.strftime("%Y-%m-%d")
+        if day != current_day:
+            if current_day is not None:
+                forecast.day_slices[current_day] = (forecast.day_slices[current_day][0], index)
+            forecast.day_keys.append(day)
+            forecast.day_slices[day] = (index, index)
+            forecast.day_dates[day] = (moment.year, moment.month, moment.day)
+            current_day = day
+    forecast.day_slices[current_day] = (forecast.day_slices[current_day][0], len(forecast.times))
+    return forecast
+
+
+class CachedForecast:
+    __slots__ = ('forecast', 'data', 'fetched_at', 'expires_at', 'last_modified', 'failed')
+
+    def __init__(self, forecast, data, fetched_at, expires_at, last_modified):
+        self.forecast = forecast
+        self.data = data
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self.last_modified = last_modified
+        self.failed = False
+
+    def is_stale(self, now=None):
+        now = time.time() if now is None else now
+        expires_at = self.expires_at or self.fetched_at + DEFAULT_REFRESH_SECONDS
+        return self.failed or now >= expires_at
+
+    def age(self, now=None):
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class LocationWeather:
+    # Fetches every saved location concurrently on a small bounded pool and
+    # keeps the last good forecast per location id, persisted so it can be
+    # shown at startup before any request finishes. Refreshes revalidate with
+    # If-Modified-Since and are timed from the Expires header. on_result(
+    # location, forecast, error) is called from the worker thread as each one
+    # finishes, so the caller decides how to hand it to the UI thread.
+    # Between hold() and release() cache writes are kept in memory.
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dailynote-weather")
+        self.cache = {}
+        self.pending = set()
+        self.persist_lock = threading.Lock()
+        self.held = False
+        # location id: save_weather_cache() arguments, or None to delete.
+        self.unsaved = {}
+
+    def load_persisted(self):
+        for location_id, row in core.load_weather_cache().items():
+            try:
+                forecast = parse_forecast(json.loads(row['data']))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring unreadable cached weather for location {location_id}: {e}")
+                continue
+            self.cache[location_id] = CachedForecast(forecast, row['data'], row['fetched_at'], row['expires_at'], row['last_modified'])
+
+    def entry(self, location_id):
+        return self.cache.get(location_id)
+
+    def cached(self, location_id):
+        entry = self.cache.get(location_id)
+        return entry.forecast if entry else None
+
+    def due(self, locations, now=None):
+        return [location for location in locations
+                if location['id'] not in self.cache or self.cache[location['id']].is_stale(now)]
+
+    def next_refresh_delay(self, locations, now=None):
+        now = time.time() if now is None else now
+        delays = []
+        for location in locations:
+            entry = self.cache.get(location['id'])
+            if entry is None or entry.failed:
+                delays.append(RETRY_SECONDS)
+            else:
+                delays.append((entry.expires_at or entry.fetched_at + DEFAULT_REFRESH_SECONDS) - now)
+        return int(max(min(delays, default=DEFAULT_REFRESH_SECONDS), MIN_REFRESH_SECONDS))
+
+    def refresh(self, locations, on_result):
+        for location in locations:
+            if location['id'] in self.pending:
+                continue
+            self.pending.add(location['id'])
+            self.executor.submit(self._fetch, location, on_result)
+
+    def _fetch(self, location, on_result):
+        forecast, error = None, None
+        entry = self.cache.get(location['id'])
+        try:
+            with trace.span("weather refresh", "network", location=location.get('name') or location['id']):
+                data, expires_at, last_modified = revalidate_forecast(
+                    location['latitude'], location['longitude'], entry.last_modified if entry else None)
+                fetched_at = time.time()
+                if data is None and entry is not None:
+                    forecast, raw = entry.forecast, entry.data
+                    self._persist(location['id'], (fetched_at, expires_at, last_modified))
+                else:
+                    forecast = parse_forecast(data)
+                    raw = json.dumps(data)
+                    self._persist(location['id'], (fetched_at, expires_at, last_modified, raw))
+            self.cache[location['id']] = CachedForecast(forecast, raw, fetched_at, expires_at, last_modified)
+        except Exception as e:
+            print(f"Error fetching weather for {location.get('name') or location['id']}: {e}")
+            error = e
+            if entry is not None:
+                entry.failed = True
+        finally:
+            self.pending.discard(location['id'])
+        on_result(location, forecast, error)
+
+    def _persist(self, location_id, row):
+        with self.persist_lock:
+            if self.held:
+                # A held revalidation only refreshes the times, so it must
+                # not drop data saved by an earlier held fetch.
+                earlier = self.unsaved.get(location_id)
+                if row is not None and len(row) == 3 and earlier is not None and len(earlier) == 4:
+                    fetched_at, expires_at, last_modified = row
+                    row = (fetched_at, expires_at, last_modified or earlier[2], earlier[3])
+                self.unsaved[location_id] = row
+            elif row is None:
+                core.delete_weather_cache(location_id)
+            else:
+                core.save_weather_cache(location_id, *row)
+
+    def hold(self):
+        # Waits for a write already under way, so none starts after this.
+        with self.persist_lock:
+            self.held = True
+
+    def release(self):
+        with self.persist_lock:
+            self.held = False
+            unsaved, self.unsaved = self.unsaved, {}
+        for location_id, row in unsaved.items():
+            self._persist(location_id, row)
+
+    def forget(self, location_id):
+        self.cache.pop(location_id, None)
+        self._persist(location_id, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dailynote_history as history
+
+
+class DeltaTest(unittest.TestCase):
+    def assertRoundTrip(self, old, new):
+        data = history.encode_delta(old, new)
+        self.assertIsNotNone(data)
+        self.assertEqual(history.apply_delta(old, data), new)
+        return data
+
+    def test_edits_round_trip(self):
+        old = "".join(f"line {i}\n" for i in range(200))
+        self.assertRoundTrip(old, old.replace("line 7\n", "line seven\n").replace("line 150\n", ""))
+        self.assertRoundTrip(old, "first\n" + old + "last, without newline")
+        self.assertRoundTrip(old, "")
+        self.assertRoundTrip("", old)
+
+    def test_unchanged_ends_are_copied(self):
+        old = "x\n" * 5000
+        data = self.assertRoundTrip(old, "x\n" * 2500 + "y\n" + "x\n" * 2499)
+        self.assertLess(len(data), 100)
+
+    def test_snapshot_round_trip(self):
+        text = "Title\nBody with ümlauts\n" * 100
+        self.assertEqual(history.decode_snapshot(history.encode_snapshot(text)), text)
+
+    def test_costly_diff_is_declined(self):
+        # Repetitive lines changed throughout take difflib seconds.
+        old = "x\n" * 5000
+        new = "".join("y\n" if i % 2 else "x\n" for i in range(5000))
+        begin = time.monotonic()
+        self.assertIsNone(history.encode_delta(old, new))
+        self.assertLess(time.monotonic() - begin, 1.0)
+
+
+class RecordTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        history.create_table(self.conn)
+
+    def kinds(self, note_id):
+        return [row[0] for row in self.conn.execute("SELECT kind FROM note_revisions WHERE note_id=? ORDER BY revision", (note_id,))]
+
+    def test_versions_rebuild(self):
+        versions = [("Plan", "".join(f"step {i}\n" for i in range(step, step + 30))) for step in range(25)]
+        for revision, (previous, current) in enumerate(zip(versions, versions[1:])):
+            self.assertEqual(history.record(self.conn, 1, previous, current, float(revision)), revision)
+        for revision, version in enumerate(versions[:-1]):
+            self.assertEqual(history.split_version(history.rebuild(self.conn, 1, revision)), version)
+        kinds = self.kinds(1)
+        self.assertEqual([kinds[0], kinds[10], kinds[20]], [history.SNAPSHOT] * 3)
+        self.assertIn(history.DELTA, kinds)
+
+    def test_unchanged_save_is_not_recorded(self):
+        self.assertIsNone(history.record(self.conn, 1, ("Same", "text"), ("Same", "text"), 0.0))
+        self.assertEqual(self.kinds(1), [])
+
+    def test_costly_diff_is_stored_whole(self):
+        first = ("Log", "x\n" * 5000)
+        second = ("Log", "".join("y\n" if i % 2 else "x\n" for i in range(5000)))
+        history.record(self.conn, 1, first, second, 0.0)
+        history.record(self.conn, 1, second, first, 1.0)
+        self.assertEqual(self.kinds(1), [history.SNAPSHOT, history.SNAPSHOT])
+        self.assertEqual(history.split_version(history.rebuild(self.conn, 1, 1)), second)
+
+
+if __name__ == '__main__':
+    unittest.main()
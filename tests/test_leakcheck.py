@@ -0,0 +1,66 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import gi
+    gi.require_version("Gtk", "3.0")
+    gi.require_version("Gst", "1.0")
+    gi.require_version("Notify", "0.7")
+    from gi.repository import Gtk  # noqa: F401
+except (ImportError, ValueError):
+    raise unittest.SkipTest("GTK 3, GStreamer or libnotify bindings are not installed")
+
+import dailynote_leakcheck as leakcheck
+
+LEAK_CHECK_CYCLES = 20
+LEAK_CHECK_TIMEOUT = 300
+
+
+class GrowthTableTest(unittest.TestCase):
+    def snapshot(self, objects=(), widgets=(), handlers=()):
+        return {"objects": Counter(dict(objects)), "widgets": Counter(dict(widgets)), "handlers": Counter(dict(handlers))}
+
+    def test_growth_of_one_per_cycle_is_unbounded(self):
+        before = self.snapshot(objects={"Label": 10}, handlers={"calendar": 3})
+        after = self.snapshot(objects={"Label": 10 + 50}, handlers={"calendar": 3 + 50})
+        _table, unbounded = leakcheck.growth_table(before, after, 50)
+        self.assertEqual(unbounded, ["objects:Label", "handlers:calendar"])
+
+    def test_bounded_growth_is_only_listed(self):
+        before = self.snapshot(widgets={"Box": 5})
+        after = self.snapshot(widgets={"Box": 9})
+        table, unbounded = leakcheck.growth_table(before, after, 50)
+        self.assertEqual(unbounded, [])
+        self.assertIn("Box", table)
+
+
+@unittest.skipUnless(shutil.which("xvfb-run") and shutil.which("dbus-run-session"), "xvfb-run and dbus-run-session are needed")
+class LeakCheckRunTest(unittest.TestCase):
+    # Starts the real application on a virtual display and a private session
+    # bus, with a scratch database and home, and lets --leak-check drive
+    # run_leak_check over every view.
+
+    def test_refresh_cycles_do_not_grow_without_bound(self):
+        scratch = tempfile.mkdtemp(prefix="dailynote-leakcheck-")
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        env = dict(os.environ, HOME=scratch, DAILYNOTE_DB=os.path.join(scratch, "notes.db"),
+                   DAILYNOTE_ARCHIVE_DB=os.path.join(scratch, "notes_archive.db"))
+        result = subprocess.run(["xvfb-run", "-a", "dbus-run-session", "--", sys.executable,
+                                 os.path.join(ROOT, "DailyNote.py"), f"--leak-check={LEAK_CHECK_CYCLES}"],
+                                env=env, capture_output=True, text=True, timeout=LEAK_CHECK_TIMEOUT)
+        self.assertIn("Growth over", result.stderr, result.stderr)
+        self.assertNotIn("UNBOUNDED", result.stderr)
+        self.assertIn("Leak check passed.", result.stderr)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
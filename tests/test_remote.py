@@ -0,0 +1,109 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# dailynote_core picks its database up at import time.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="dailynote-test-")
+os.environ["DAILYNOTE_DB"] = os.path.join(SCRATCH_DIR, "notes.db")
+os.environ["DAILYNOTE_ARCHIVE_DB"] = os.path.join(SCRATCH_DIR, "notes_archive.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import gi
+    gi.require_version("Gio", "2.0")
+    from gi.repository import Gio, GLib
+except (ImportError, ValueError):
+    raise unittest.SkipTest("PyGObject is not installed")
+
+import dailynote_core as core
+import dailynote_remote as remote
+
+OBJECT_PATH = "/com/github/kullaniciadi/dailynote"
+
+
+class NotesServiceTest(unittest.TestCase):
+    # The service runs on a private session bus started by Gio.TestDBus and
+    # is called from a second connection, as another program would.
+
+    @classmethod
+    def setUpClass(cls):
+        core.setup_database()
+        cls.bus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+        cls.bus.up()
+        flags = Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION
+        cls.server = Gio.DBusConnection.new_for_address_sync(cls.bus.get_bus_address(), flags, None, None)
+        cls.client = Gio.DBusConnection.new_for_address_sync(cls.bus.get_bus_address(), flags, None, None)
+        cls.changes = []
+        cls.service = remote.NotesService(on_changed=lambda: cls.changes.append(True))
+        cls.service.register(cls.server, OBJECT_PATH)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.service.unregister()
+        cls.client.close_sync(None)
+        cls.server.close_sync(None)
+        cls.bus.down()
+
+    def call(self, method, signature, args):
+        # Returns the unpacked reply, or raises the GLib.Error it failed with.
+        loop = GLib.MainLoop()
+        reply = {}
+
+        def on_reply(connection, result):
+            try:
+                reply['value'] = connection.call_finish(result).unpack()
+            except GLib.Error as e:
+                reply['error'] = e
+            loop.quit()
+
+        self.client.call(self.server.get_unique_name(), OBJECT_PATH, remote.INTERFACE_NAME, method,
+                         GLib.Variant(signature, args), None, Gio.DBusCallFlags.NONE, -1, None, on_reply)
+        loop.run()
+        if 'error' in reply:
+            raise reply['error']
+        return reply['value']
+
+    def assertRemoteError(self, error_name, method, signature, args):
+        with self.assertRaises(GLib.Error) as caught:
+            self.call(method, signature, args)
+        self.assertEqual(Gio.DBusError.get_remote_error(caught.exception), error_name)
+
+    def test_add_set_and_query(self):
+        changes = len(self.changes)
+        (ids,) = self.call("AddNotes", "(a(sss))", ([("Dentist", "Bring the forms", "2030-01-02"),
+                                                     ("Standup", "", "2030-01-03")],))
+        self.assertEqual(len(ids), 2)
+        (count,) = self.call("SetAlarms", "(a(xssii))", ([(ids[0], "14:30", "", 50, 10)],))
+        self.assertEqual(count, 1)
+        (rows,) = self.call("QueryRange", "(ss)", ("2030-01-01", "2030-01-31"))
+        self.assertEqual(rows, [(ids[0], "Dentist", "Bring the forms", "2030-01-02", "14:30"),
+                                (ids[1], "Standup", "", "2030-01-03", "")])
+        # One change notification per batch, none for the query.
+        self.assertEqual(len(self.changes), changes + 2)
+
+    def test_invalid_note_rolls_back_batch(self):
+        self.assertRemoteError(remote.ERROR_INVALID_ARGS, "AddNotes", "(a(sss))",
+                               ([("Kept?", "", "2031-02-01"), ("Bad date", "", "2031-02-30")],))
+        (rows,) = self.call("QueryRange", "(ss)", ("2031-02-01", "2031-02-28"))
+        self.assertEqual(rows, [])
+
+    def test_invalid_alarm_rolls_back_batch(self):
+        (ids,) = self.call("AddNotes", "(a(sss))", ([("Call", "", "2032-03-01")],))
+        self.assertRemoteError(remote.ERROR_INVALID_ARGS, "SetAlarms", "(a(xssii))",
+                               ([(ids[0], "09:00", "", 50, 10), (ids[0] + 1000, "10:00", "", 50, 10)],))
+        self.assertRemoteError(remote.ERROR_INVALID_ARGS, "SetAlarms", "(a(xssii))",
+                               ([(ids[0], "09:00", "", 50, 10), (ids[0], "25:00", "", 50, 10)],))
+        (rows,) = self.call("QueryRange", "(ss)", ("2032-03-01", "2032-03-01"))
+        self.assertEqual(rows, [(ids[0], "Call", "", "2032-03-01", "")])
+
+    def test_added_notes_keep_history(self):
+        (ids,) = self.call("AddNotes", "(a(sss))", ([("Draft", "first words", "2033-04-01")],))
+        note = {'id': ids[0], 'title': "Draft", 'content': "second words", 'date': "2033-04-01"}
+        core.save_note(note)
+        oldest = core.load_note_revisions(ids[0])[-1]
+        self.assertEqual(core.load_note_revision(ids[0], oldest['revision']), ("Draft", "first words"))
+
+
+if __name__ == '__main__':
+    unittest.main()